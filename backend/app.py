@@ -8,32 +8,38 @@
 
 import os
 import tempfile
+import threading
 import logging
 import time
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import threading  # 引入线程模块
 import uuid  # 引入UUID生成唯一任务ID
 
 # 导入自定义模块
-from modules.models import (
-    load_model,
-    get_model_status,
-    model_loaded,
-    model,
-    tokenizer,
-    whisper_model,
-    emotion_detector,
-)
+from modules.models import load_model, get_model_status
+from modules.speech_backends import SPEECH_BACKEND_NAMES
 from modules.utils import (
     error_response,
     allowed_file,
     allowed_video_file,
     ensure_upload_folder,
+    parse_bool_option,
 )
 from modules.speech_recognition import handle_upload_request, handle_record_request
-from modules.text_analysis import handle_text_analysis_request
+from modules.streaming_speech import (
+    handle_stream_start_request,
+    handle_stream_chunk_request,
+    handle_stream_state_request,
+    handle_stream_finish_request,
+)
+from modules.text_analysis import (
+    handle_text_analysis_request,
+    handle_batch_text_analysis_request,
+)
 from modules.video_analysis import handle_video_upload_request
+from modules.task_queue import BoundedExecutor
+from modules.video_jobs import VideoJobExecutor, VIDEO_TASK_RETRY_AFTER
+from modules.task_store import create_task_store
 from modules.camera_analysis import handle_camera_frame_request
 
 # 配置日志
@@ -43,20 +49,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # 添加文件处理器，将日志输出到文件
-file_handler = logging.FileHandler("backend.log", mode="w", encoding="utf-8")
-file_handler.setLevel(logging.INFO)
-file_formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
-
-# 用于存储异步任务状态和结果的字典
-# 结构: { 'task_id': {'status': 'processing'/'completed'/'failed', 'result': ..., 'error': ...} }
-task_status = {}
+# （spawn启动的工作进程会以 __mp_main__ 重新导入本文件，不能再次以"w"模式打开日志文件）
+if __name__ != "__mp_main__":
+    file_handler = logging.FileHandler("backend.log", mode="w", encoding="utf-8")
+    file_handler.setLevel(logging.INFO)
+    file_formatter = logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    file_handler.setFormatter(file_formatter)
+    logger.addHandler(file_handler)
 
-# 确保线程安全访问 task_status 的锁
-task_lock = threading.Lock()
+# 异步任务状态和结果的存储（有条目上限，已结束的任务按TTL过期；TASK_STORE=sqlite 时多进程共享）
+# 任务信息: {'status': 'queued'/'processing'/'completed'/'failed'/'cancelled', 'result': ..., 'error': ...}
+task_store = create_task_store()
 
 # 创建Flask应用
 app = Flask(__name__)
@@ -74,7 +79,7 @@ CORS(
     ],
     methods=["GET", "POST", "OPTIONS"],  # 限制允许的HTTP方法
     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],  # 允许的头部
-    expose_headers=["Content-Length", "X-Request-ID"],  # 暴露给前端的头部
+    expose_headers=["Content-Length", "X-Request-ID", "Retry-After"],  # 暴露给前端的头部
     supports_credentials=True,  # 支持跨域请求中的凭证
     max_age=600,  # 预检请求的缓存时间，减少OPTIONS请求
 )
@@ -86,6 +91,13 @@ app.config["MAX_CONTENT_LENGTH"] = int(
     os.environ.get("MAX_CONTENT_LENGTH", 32 * 1024 * 1024)
 )  # 限制上传文件大小为32MB
 
+# 音频异步任务：工作线程数、等待队列长度，以及队列已满时建议客户端重试的间隔（秒）
+AUDIO_TASK_WORKERS = int(os.environ.get("AUDIO_TASK_WORKERS", 2))
+AUDIO_TASK_QUEUE = int(os.environ.get("AUDIO_TASK_QUEUE", 8))
+AUDIO_TASK_RETRY_AFTER = int(os.environ.get("AUDIO_TASK_RETRY_AFTER", 10))
+
+audio_task_executor = BoundedExecutor(AUDIO_TASK_WORKERS, AUDIO_TASK_QUEUE, name="audio-task")
+
 
 # API路由定义
 
@@ -96,6 +108,13 @@ def status():
     """获取详细的模型加载状态和系统信息"""
     try:
         model_status = get_model_status()
+        # 从共享模型注册表读取实时状态，而不是导入时绑定的旧值
+        text_ready = model_status["models"]["text"]
+        whisper_ready = model_status["models"]["whisper"]
+        face_ready = model_status["models"]["face"]
+        # 实际加载的语音识别后端（faster-whisper不可用时会回退为whisper）
+        speech_backend = model_status["speech_backend"]
+        whisper_size = model_status["whisper_model_size"]
 
         # 添加详细的模型状态信息
         detailed_status = {
@@ -106,15 +125,17 @@ def status():
             ),
             "models": {
                 "text_analysis": {
-                    "loaded": model is not None and tokenizer is not None,
+                    "loaded": text_ready,
                     "name": model_status.get("model_name", "N/A"),
                 },
                 "speech_recognition": {
-                    "loaded": whisper_model is not None,
-                    "name": "OpenAI Whisper base",
+                    "loaded": whisper_ready,
+                    "name": f"{SPEECH_BACKEND_NAMES.get(speech_backend, speech_backend)} {whisper_size}",
+                    "backend": speech_backend,
+                    "model_size": whisper_size,
                 },
                 "face_emotion": {
-                    "loaded": emotion_detector is not None,
+                    "loaded": face_ready,
                     "name": "FER with MTCNN",
                 },
             },
@@ -125,13 +146,11 @@ def status():
                 "loading": model_status["loading"],
             },
             "capabilities": {
-                "text_emotion": model is not None and tokenizer is not None,
-                "speech_to_text": whisper_model is not None,
-                "face_emotion": emotion_detector is not None,
-                "video_analysis": (
-                    emotion_detector is not None and whisper_model is not None
-                ),
-                "camera_analysis": emotion_detector is not None,
+                "text_emotion": text_ready,
+                "speech_to_text": whisper_ready,
+                "face_emotion": face_ready,
+                "video_analysis": face_ready and whisper_ready,
+                "camera_analysis": face_ready,
             },
         }
 
@@ -156,70 +175,190 @@ def api_analyze():
     data = request.get_json()
     text = data.get("text", "")
 
-    return handle_text_analysis_request(text)
+    return handle_text_analysis_request(
+        text,
+        rules_first=parse_bool_option(data.get("rules_first")),
+        calibrated_scores=bool(parse_bool_option(data.get("calibrated_scores"))),
+        long_text=parse_bool_option(data.get("long_text")),
+        cascade=parse_bool_option(data.get("cascade")),
+    )
+
+
+# 批量文本情感分析API
+@app.route("/api/analyze_batch", methods=["POST"])
+def api_analyze_batch():
+    """批量分析文本API"""
+    if not request.is_json:
+        return error_response("请求必须包含JSON数据")
+
+    data = request.get_json()
+    texts = data.get("texts")
+
+    return handle_batch_text_analysis_request(
+        texts,
+        rules_first=parse_bool_option(data.get("rules_first")),
+        calibrated_scores=bool(parse_bool_option(data.get("calibrated_scores"))),
+        cascade=parse_bool_option(data.get("cascade")),
+    )
+
+
+# 流式语料情感分析API
+@app.route("/api/analyze_stream", methods=["POST"])
+def api_analyze_stream():
+    """逐行读取NDJSON或纯文本请求体，分批分析并以NDJSON流式返回结果"""
+    from werkzeug.wsgi import get_input_stream
+    from modules.corpus_analysis import stream_ndjson
+
+    # 直接逐行读取原始请求体，不把整个语料读入内存，也不受 MAX_CONTENT_LENGTH 限制
+    input_stream = get_input_stream(request.environ)
+
+    options = {}
+    for name in ("rules_first", "cascade"):
+        if name in request.args:
+            options[name] = parse_bool_option(request.args.get(name))
+
+    return Response(
+        stream_with_context(stream_ndjson(input_stream, **options)),
+        mimetype="application/x-ndjson",
+    )
+
+
+# --- 音频异步任务 ---
+# 本进程中排队和运行中的音频任务ID（用于定期刷新任务存储中的状态更新时间）
+audio_task_ids = set()
+audio_task_ids_lock = threading.Lock()
+
+
+def run_audio_analysis_async(task_id, handler, *args):
+    """在后台线程中运行音频处理函数，并把其JSON响应写入任务状态"""
+    try:
+        _run_audio_analysis(task_id, handler, *args)
+    finally:
+        with audio_task_ids_lock:
+            audio_task_ids.discard(task_id)
+
+
+def _run_audio_analysis(task_id, handler, *args):
+    task_store.set(task_id, "processing")
+
+    try:
+        # 处理函数返回Flask响应，需要应用上下文
+        with app.app_context():
+            response = handler(*args)
+            if isinstance(response, tuple):
+                response = response[0]
+            data = response.get_json()
+
+        if data.get("success"):
+            task_store.set(task_id, "completed", result=data)
+        else:
+            task_store.set(task_id, "failed", error=data.get("error"))
+        logger.info(f"[Task {task_id}] 异步音频处理完成")
+    except Exception as e:
+        logger.error(f"[Task {task_id}] 异步音频处理出错: {str(e)}", exc_info=True)
+        task_store.set(task_id, "failed", error=str(e))
+
+
+def submit_audio_task(handler, *args):
+    """把音频处理提交到有界任务队列，返回任务ID；队列已满时返回429和Retry-After"""
+    task_id = str(uuid.uuid4())
+    task_store.set(task_id, "queued", kind="audio")
+    with audio_task_ids_lock:
+        audio_task_ids.add(task_id)
+
+    future = audio_task_executor.try_submit(run_audio_analysis_async, task_id, handler, *args)
+    if future is None:
+        with audio_task_ids_lock:
+            audio_task_ids.discard(task_id)
+        task_store.delete(task_id)
+        response, status_code = error_response("服务器繁忙，请稍后重试", 429)
+        response.headers["Retry-After"] = str(AUDIO_TASK_RETRY_AFTER)
+        return response, status_code
+
+    logger.info(f"已提交音频处理任务，Task ID: {task_id}")
+    return jsonify({"success": True, "message": "音频处理已开始", "task_id": task_id})
 
 
 # 音频文件上传API
 @app.route("/api/upload", methods=["POST"])
 def api_upload():
-    """上传音频文件API"""
+    """上传音频文件API（async=true 时返回任务ID，通过 /api/task_status 查询结果）"""
 
-    return handle_upload_request(app.config["UPLOAD_FOLDER"])
+    return handle_upload_request(app.config["UPLOAD_FOLDER"], submit_audio_task)
 
 
 # 录音数据处理API
 @app.route("/api/record", methods=["POST"])
 def api_record():
-    """处理录音数据API"""
-    return handle_record_request()
+    """处理录音数据API（async=true 时返回任务ID，通过 /api/task_status 查询结果）"""
+    return handle_record_request(submit_audio_task)
 
 
-# --- 异步任务处理函数 ---
-def run_video_analysis_async(task_id, file_path, language):
-    """在后台线程中运行视频分析并更新状态"""
-    global task_status
-    try:
-        logger.info(f"[Task {task_id}] 开始异步视频分析: {file_path}")
-        # 直接调用处理逻辑，避免Flask Response对象的复杂性
-        from modules.video_analysis import process_video
-
-        result, error = process_video(file_path, language)
-        logger.info(f"[Task {task_id}] 异步视频分析完成")
-
-        # 更新任务状态为完成
-        with task_lock:
-            if error:
-                task_status[task_id] = {
-                    "status": "failed",
-                    "result": None,
-                    "error": error,
-                }
-            else:
-                task_status[task_id] = {
-                    "status": "completed",
-                    "result": {"success": True, "result": result},
-                    "error": None,
-                }
-    except Exception as e:
-        logger.error(f"[Task {task_id}] 异步视频分析出错: {str(e)}", exc_info=True)
-        # 更新任务状态为失败
-        with task_lock:
-            task_status[task_id] = {"status": "failed", "result": None, "error": str(e)}
-    finally:
-        # 清理上传的临时文件
+# 实时录音识别API：录音过程中分块上传音频，返回阶段性识别结果
+@app.route("/api/record_stream", methods=["POST"])
+def api_record_stream_start():
+    """创建实时识别会话"""
+    return handle_stream_start_request()
+
+
+@app.route("/api/record_stream/<session_id>/chunk", methods=["POST"])
+def api_record_stream_chunk(session_id):
+    """上传一块录音数据（请求体为原始音频字节）"""
+    return handle_stream_chunk_request(session_id)
+
+
+@app.route("/api/record_stream/<session_id>", methods=["GET"])
+def api_record_stream_state(session_id):
+    """查询阶段性识别结果"""
+    return handle_stream_state_request(session_id)
+
+
+@app.route("/api/record_stream/<session_id>/finish", methods=["POST"])
+def api_record_stream_finish(session_id):
+    """结束录音并返回最终结果"""
+    return handle_stream_finish_request(session_id)
+
+
+# --- 视频异步任务 ---
+def update_video_task(task_id, status, result, error):
+    """视频任务执行器的状态回调：把任务状态和结果写入任务存储"""
+    if status == "completed":
+        task_store.set(task_id, "completed", result={"success": True, "result": result})
+    else:
+        task_store.set(task_id, status, error=error)
+
+
+video_task_executor = VideoJobExecutor(update_video_task)
+
+# 共享任务存储时由执行任务的进程定期轮询：刷新本进程中未结束任务的状态更新时间（避免被判定为超时），
+# 并处理其他工作进程转交的视频任务取消请求
+TASK_CANCEL_POLL_INTERVAL = float(os.environ.get("TASK_CANCEL_POLL_INTERVAL", 2))
+
+
+def watch_live_tasks():
+    """刷新本进程中未结束的任务，取消被其他工作进程请求取消的视频任务"""
+    while True:
+        time.sleep(TASK_CANCEL_POLL_INTERVAL)
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"[Task {task_id}] 已清理临时文件: {file_path}")
+            video_ids = video_task_executor.task_ids()
+            with audio_task_ids_lock:
+                live_ids = video_ids + list(audio_task_ids)
+            task_store.touch(live_ids)
+            for task_id in task_store.get_cancel_requests(video_ids):
+                if video_task_executor.cancel(task_id):
+                    logger.info(f"[Task {task_id}] 已处理转交的取消请求")
         except Exception as e:
-            logger.error(f"[Task {task_id}] 清理临时文件时出错: {str(e)}")
+            logger.error(f"轮询任务状态时出错: {str(e)}")
+
+
+if task_store.shared and __name__ != "__mp_main__":
+    threading.Thread(target=watch_live_tasks, name="task-watch", daemon=True).start()
 
 
 # 视频上传处理API (修改为异步)
 @app.route("/api/upload_video", methods=["POST"])
 def api_upload_video():
     """处理视频上传请求（异步）"""
-    global task_status
     try:
         # 检查是否有文件
         if "file" not in request.files:
@@ -240,6 +379,24 @@ def api_upload_video():
 
         # 获取语言参数
         language = request.form.get("language", "zh-CN")
+        segment_sentiment = parse_bool_option(request.form.get("segment_sentiment"))
+
+        # 面部表情分析的采样帧数预算（可选）
+        sample_budget = request.form.get("sample_budget")
+        if sample_budget is not None:
+            try:
+                sample_budget = int(sample_budget)
+            except ValueError:
+                return error_response("sample_budget 必须是整数")
+            if sample_budget <= 0:
+                return error_response("sample_budget 必须大于0")
+        track_faces = parse_bool_option(request.form.get("track_faces"))
+
+        # 任务优先级，数值越大越先执行
+        try:
+            priority = int(request.form.get("priority", 0))
+        except ValueError:
+            return error_response("priority 必须是整数")
 
         # 生成安全的文件名
         safe_name = safe_filename(file.filename)
@@ -255,21 +412,24 @@ def api_upload_video():
         # 创建任务ID
         task_id = str(uuid.uuid4())
 
-        # 初始化任务状态为 processing
-        with task_lock:
-            task_status[task_id] = {
-                "status": "processing",
-                "result": None,
-                "error": None,
-            }
+        # 初始化任务状态为 queued，工作进程开始处理时更新为 processing
+        task_store.set(task_id, "queued", kind="video")
 
-        # 创建并启动后台线程
-        thread = threading.Thread(
-            target=run_video_analysis_async, args=(task_id, file_path, language)
-        )
-        thread.daemon = True  # 设置为守护线程，主程序退出时线程也退出
-        thread.start()
-        logger.info(f"已为视频分析启动后台任务，Task ID: {task_id}")
+        # 提交到视频分析进程池，等待队列已满时返回429
+        options = {
+            "language": language,
+            "segment_sentiment": segment_sentiment,
+            "sample_budget": sample_budget,
+            "track_faces": track_faces,
+        }
+        if not video_task_executor.try_submit(task_id, file_path, options, priority):
+            task_store.delete(task_id)
+            os.remove(file_path)
+            response, status_code = error_response("服务器繁忙，请稍后重试", 429)
+            response.headers["Retry-After"] = str(VIDEO_TASK_RETRY_AFTER)
+            return response, status_code
+
+        logger.info(f"已提交视频分析任务，Task ID: {task_id}，优先级: {priority}")
 
         # 立即返回任务ID给客户端
         return jsonify(
@@ -285,9 +445,7 @@ def api_upload_video():
 @app.route("/api/task_status/<task_id>", methods=["GET"])
 def get_task_status(task_id):
     """获取指定异步任务的状态和结果"""
-    global task_status
-    with task_lock:
-        status_info = task_status.get(task_id)
+    status_info = task_store.get(task_id)
 
     if status_info:
         response = {
@@ -297,16 +455,43 @@ def get_task_status(task_id):
         }
         if status_info["status"] == "completed":
             response["result"] = status_info["result"]
-        elif status_info["status"] == "failed":
+        elif status_info["status"] in ("failed", "cancelled"):
             response["error"] = status_info["error"]
-            # 可选：如果任务失败或完成，可以从字典中移除以节省内存
-            # if status_info["status"] in ["completed", "failed"]:
-            #     del task_status[task_id]
         return jsonify(response)
     else:
         return error_response(f"未找到任务ID: {task_id}", 404)
 
 
+# 取消异步任务的API
+@app.route("/api/task_cancel/<task_id>", methods=["POST"])
+def cancel_task(task_id):
+    """取消排队中或运行中的视频分析任务（运行中的任务会终止其工作进程）"""
+    status_info = task_store.get(task_id)
+    if not status_info:
+        return error_response(f"未找到任务ID: {task_id}", 404)
+    if status_info["status"] not in ("queued", "processing"):
+        return error_response(f"任务已结束，无法取消: {status_info['status']}", 409)
+
+    if not video_task_executor.cancel(task_id):
+        # 任务不在本进程中：通过共享任务存储转交给执行它的工作进程
+        if not task_store.request_cancel(task_id, "video"):
+            return error_response("该任务无法取消", 409)
+        logger.info(f"[Task {task_id}] 已转交取消请求")
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "task_id": task_id,
+                    "message": "已请求取消，任务将由执行它的工作进程取消",
+                }
+            ),
+            202,
+        )
+
+    logger.info(f"[Task {task_id}] 已请求取消任务")
+    return jsonify({"success": True, "task_id": task_id, "message": "任务已取消"})
+
+
 # 摄像头帧分析API
 @app.route("/api/analyze_frame", methods=["POST"])
 def api_analyze_frame():
@@ -348,7 +533,7 @@ def health_check():
         return jsonify(
             {
                 "status": "ok" if health_data["healthy"] else "warning",
-                "model_loaded": model_loaded,
+                "model_loaded": get_model_status()["loaded"],
                 "timestamp": time.time(),
                 "version": "1.0.0",
                 "health": health_data,
@@ -359,7 +544,7 @@ def health_check():
         return jsonify(
             {
                 "status": "error",
-                "model_loaded": model_loaded,
+                "model_loaded": get_model_status()["loaded"],
                 "timestamp": time.time(),
                 "version": "1.0.0",
                 "error": "健康检查失败",
@@ -381,7 +566,16 @@ def performance_stats():
     try:
         from modules.monitoring import get_performance_summary
 
+        from modules.text_analysis import get_text_batching_stats, get_text_cache_stats
+        from modules.streaming_speech import get_streaming_stats
+
         stats = get_performance_summary()
+        stats["text_batching"] = get_text_batching_stats()
+        stats["text_cache"] = get_text_cache_stats()
+        stats["speech_streaming"] = get_streaming_stats()
+        stats["audio_tasks"] = audio_task_executor.get_stats()
+        stats["video_tasks"] = video_task_executor.get_stats()
+        stats["task_store"] = task_store.get_stats()
         return jsonify({"success": True, "data": stats})
     except Exception as e:
         logger.error(f"获取性能统计时出错: {str(e)}")
@@ -394,7 +588,7 @@ if __name__ == "__main__":
     try:
         # 尝试加载模型
         load_model()
-        if model_loaded:
+        if get_model_status()["loaded"]:
             logger.info("所有模型加载成功")
         else:
             logger.error("模型加载失败，应用将以降级模式启动")
@@ -403,7 +597,7 @@ if __name__ == "__main__":
         logger.error(f"模型加载过程中发生错误: {str(e)}", exc_info=True)
         logger.warning("应用将以降级模式启动，部分AI功能将不可用")
 
-    logger.info(f"当前模型加载状态: {model_loaded}")
+    logger.info(f"当前模型加载状态: {get_model_status()['loaded']}")
 
     # 从环境变量获取端口或使用默认值
     port = int(os.environ.get("PORT", 8080))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+音频解码模块
+在内存中把上传的音频字节直接解码为16kHz单声道float32数组，供Whisper使用，避免临时文件读写
+"""
+
+import os
+import io
+import logging
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+# 导入soundfile（可选依赖，用于直接读取WAV/FLAC）
+try:
+    import soundfile
+
+    soundfile_available = True
+except ImportError:
+    soundfile_available = False
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# Whisper要求的采样率
+SAMPLE_RATE = 16000
+
+# 管道解码失败时（例如moov头在文件末尾的MP4）是否回退为临时文件解码
+AUDIO_DECODE_FILE_FALLBACK = (
+    os.environ.get("AUDIO_DECODE_FILE_FALLBACK", "true").lower() == "true"
+)
+
+
+class AudioDecodeError(Exception):
+    """音频解码失败"""
+
+
+class NoAudioStreamError(AudioDecodeError):
+    """输入文件（如视频）中没有音频流"""
+
+
+# ffmpeg在输入没有可用音频流时的错误信息
+NO_AUDIO_STREAM_MESSAGES = ("does not contain any stream", "matches no streams")
+
+
+def _decode_error(stderr):
+    """根据ffmpeg的错误输出构造异常"""
+    message = stderr.decode("utf-8", errors="replace").strip()
+    if any(text in message for text in NO_AUDIO_STREAM_MESSAGES):
+        return NoAudioStreamError(message)
+    return AudioDecodeError(message)
+
+
+def _decode_native(data, sample_rate):
+    """使用soundfile直接读取WAV/FLAC，只在采样率已匹配时使用，返回None表示无法处理"""
+    if not soundfile_available:
+        return None
+    try:
+        audio, file_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except Exception:
+        return None
+    if file_rate != sample_rate:
+        # 重采样交给ffmpeg，保证与Whisper自身的解码结果一致
+        return None
+    return audio.mean(axis=1).astype(np.float32)
+
+
+def _ffmpeg_command(source, sample_rate):
+    """构造把任意音频解码为单声道16位PCM并输出到标准输出的ffmpeg命令"""
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-threads",
+        "0",
+        "-i",
+        source,
+        "-vn",
+        "-f",
+        "s16le",
+        "-ac",
+        "1",
+        "-acodec",
+        "pcm_s16le",
+        "-ar",
+        str(sample_rate),
+        "-loglevel",
+        "error",
+        "pipe:1",
+    ]
+
+
+def _pcm16_to_float(pcm):
+    """16位PCM字节转换为[-1, 1]范围的float32数组"""
+    return np.frombuffer(pcm, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def _decode_ffmpeg_pipe(data, sample_rate):
+    """通过ffmpeg的标准输入/输出解码，不落盘"""
+    result = subprocess.run(
+        _ffmpeg_command("pipe:0", sample_rate), input=data, capture_output=True
+    )
+    if result.returncode != 0 or not result.stdout:
+        raise _decode_error(result.stderr)
+    return _pcm16_to_float(result.stdout)
+
+
+def _decode_ffmpeg_file(data, sample_rate, tmp_dir=None):
+    """写入临时文件后解码（仅用于无法从管道读取的容器格式）"""
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as temp_file:
+        temp_file.write(data)
+        temp_path = temp_file.name
+    try:
+        return decode_audio_file(temp_path, sample_rate)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def decode_audio_bytes(data, sample_rate=SAMPLE_RATE, tmp_dir=None):
+    """将音频字节解码为指定采样率的单声道float32数组"""
+    if not data:
+        raise AudioDecodeError("音频数据为空")
+
+    audio = _decode_native(data, sample_rate)
+    if audio is not None:
+        logger.info(f"音频直接解码完成: {len(audio) / sample_rate:.2f}秒")
+        return audio
+
+    try:
+        audio = _decode_ffmpeg_pipe(data, sample_rate)
+    except NoAudioStreamError:
+        raise
+    except AudioDecodeError as e:
+        if not AUDIO_DECODE_FILE_FALLBACK:
+            raise
+        logger.warning(f"ffmpeg管道解码失败，回退为临时文件解码: {str(e)}")
+        audio = _decode_ffmpeg_file(data, sample_rate, tmp_dir)
+
+    logger.info(f"音频内存解码完成: {len(audio) / sample_rate:.2f}秒")
+    return audio
+
+
+def decode_audio_file(path, sample_rate=SAMPLE_RATE):
+    """将音频/视频文件中的音轨解码为指定采样率的单声道float32数组
+
+    直接从容器中解复用并解码音频流，一次ffmpeg调用，不写临时文件；没有音频流时抛出 NoAudioStreamError
+    """
+    result = subprocess.run(_ffmpeg_command(path, sample_rate), capture_output=True)
+    if result.returncode != 0:
+        raise _decode_error(result.stderr)
+    return _pcm16_to_float(result.stdout)
+
+
+def iter_audio_file_blocks(path, sample_rate=SAMPLE_RATE, block_seconds=10):
+    """流式解码音频文件（生成器），每次产出约 block_seconds 秒的float32数组
+
+    ffmpeg的输出按块读取，内存占用与文件长度无关
+    """
+    block_bytes = int(sample_rate * block_seconds) * 2
+    process = subprocess.Popen(
+        _ffmpeg_command(path, sample_rate), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        while True:
+            chunk = process.stdout.read(block_bytes)
+            if not chunk:
+                break
+            # 保证字节数为偶数（16位采样）
+            if len(chunk) % 2:
+                chunk += process.stdout.read(1)
+            yield _pcm16_to_float(chunk)
+        if process.wait() != 0:
+            raise _decode_error(process.stderr.read())
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+class StreamDecoder:
+    """常驻的ffmpeg解码进程，用于分块到达的容器格式音频（如MediaRecorder的webm/ogg）
+
+    每次只把新到达的字节写入ffmpeg的标准输入，读取线程把解码出的float32数组交给 on_samples，
+    解码总耗时与录音长度成正比，而不是每次从头解码
+    """
+
+    def __init__(self, on_samples, sample_rate=SAMPLE_RATE):
+        self._on_samples = on_samples
+        self._write_lock = threading.Lock()
+        self._stderr = bytearray()
+        self.process = subprocess.Popen(
+            _ffmpeg_command("pipe:0", sample_rate),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._reader.start()
+        self._error_reader = threading.Thread(target=self._read_errors, daemon=True)
+        self._error_reader.start()
+
+    def _read_output(self):
+        remainder = b""
+        while True:
+            chunk = self.process.stdout.read1(65536)
+            if not chunk:
+                break
+            # 保证字节数为偶数（16位采样）
+            chunk = remainder + chunk
+            usable = len(chunk) - len(chunk) % 2
+            remainder = chunk[usable:]
+            if usable:
+                self._on_samples(_pcm16_to_float(chunk[:usable]))
+
+    def _read_errors(self):
+        for line in self.process.stderr:
+            self._stderr.extend(line)
+
+    def write(self, data):
+        """写入新到达的字节；ffmpeg已退出时忽略，错误在 finish 时抛出"""
+        with self._write_lock:
+            try:
+                self.process.stdin.write(data)
+                self.process.stdin.flush()
+            except (BrokenPipeError, ValueError, OSError):
+                pass
+
+    def finish(self):
+        """关闭输入并等待剩余音频解码完成，解码失败时抛出 AudioDecodeError"""
+        with self._write_lock:
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+        self._reader.join()
+        self._error_reader.join()
+        if self.process.wait() != 0:
+            raise _decode_error(bytes(self._stderr))
+
+    def kill(self):
+        """终止解码进程（会话过期或出错时）"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        with self._write_lock:
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+
+def probe_duration(path):
+    """使用ffprobe获取音频/视频文件时长（秒），失败时返回None"""
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration",
+                "-of",
+                "default=noprint_wrappers=1:nokey=1",
+                path,
+            ],
+            capture_output=True,
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+动态微批处理模块
+将并发到达的推理请求在短时间窗口内合并为一个批次，执行一次批量推理后再分发结果
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """动态微批处理调度器"""
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5, name="batcher"):
+        """
+        batch_fn: 接收一个输入列表并返回等长结果列表的函数
+        max_batch_size: 单个批次的最大请求数
+        max_wait_ms: 收到第一个请求后等待更多请求的最长时间（毫秒）
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_seen_batch = 0
+
+    def submit(self, item):
+        """提交一个请求，返回对应的Future"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def run(self, item, timeout=None):
+        """提交请求并阻塞等待结果"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        """确保后台工作线程在当前进程中运行（兼容gunicorn fork后的子进程）"""
+        pid = os.getpid()
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == pid:
+            return
+
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._worker_pid == pid:
+                return
+            if self._worker_pid != pid:
+                # fork后继承的队列和线程状态不可用，重新创建
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(
+                target=self._worker_loop, name=f"{self.name}-worker", daemon=True
+            )
+            self._worker_pid = pid
+            self._worker.start()
+            logger.info(
+                f"微批处理线程已启动: {self.name} (最大批次={self.max_batch_size}, 最长等待={self.max_wait * 1000:.1f}ms)"
+            )
+
+    def _collect_batch(self):
+        """阻塞等待第一个请求，然后在等待窗口内尽量凑满一个批次"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # 窗口已过，只取已经在排队的请求
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _worker_loop(self):
+        """后台线程：收集批次、执行批量推理、分发结果"""
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"批量推理返回结果数量不匹配: {len(results)} != {len(items)}"
+                    )
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"微批处理 {self.name} 执行出错: {str(e)}")
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(items)
+                self._max_seen_batch = max(self._max_seen_batch, len(items))
+
+    def get_stats(self):
+        """获取批处理统计信息"""
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0,
+                "max_batch_size_seen": self._max_seen_batch,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_size": self._queue.qsize(),
+            }
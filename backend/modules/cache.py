@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+缓存模块
+提供线程安全、带过期时间和容量上限的LRU缓存
+"""
+
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def _default_size(key, value):
+    """粗略估算缓存条目占用的内存（字节）"""
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+class LRUCache:
+    """线程安全的LRU缓存，支持TTL、条目数上限和内存上限"""
+
+    def __init__(self, max_entries=10000, ttl=3600, max_bytes=None, size_fn=None, name="cache"):
+        """
+        max_entries: 最大条目数
+        ttl: 条目有效期（秒），0或None表示不过期
+        max_bytes: 估算内存上限（字节），None表示不限制
+        size_fn: 估算条目大小的函数 size_fn(key, value) -> 字节数
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl or None
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn or _default_size
+        self.name = name
+
+        self._data = OrderedDict()  # key -> (value, 过期时间, 大小)
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def get(self, key, default=None):
+        """读取缓存，未命中或已过期时返回default"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+
+            value, expires_at, _ = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        size = self.size_fn(key, value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest_key = next(iter(self._data))
+                self._remove(oldest_key)
+                self._evictions += 1
+
+    def _remove(self, key):
+        """删除条目（调用方需持有锁）"""
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """清空缓存（例如模型重新加载后）"""
+        with self._lock:
+            count = len(self._data)
+            self._data.clear()
+            self._bytes = 0
+            self._invalidations += 1
+        logger.info(f"缓存 {self.name} 已清空，移除 {count} 个条目")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups * 100 if lookups else 0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
@@ -16,7 +16,7 @@ import io
 from PIL import Image
 
 # 导入自定义模块
-from modules.models import emotion_detector, model_loaded
+from modules.models import get_emotion_detector
 from modules.utils import error_response, emotion_to_chinese
 
 # 配置日志
@@ -25,18 +25,11 @@ logger = logging.getLogger(__name__)
 
 def process_camera_frame(image_data):
     """处理摄像头帧并进行情感分析"""
-    # 初始化FER模型（如果尚未初始化）
-    global emotion_detector
+    # 从共享模型注册表获取FER模型（如果尚未加载则按需加载一次）
+    emotion_detector = get_emotion_detector()
     if emotion_detector is None:
-        try:
-            from fer import FER
-            logger.info("尝试初始化FER模型...")
-            emotion_detector = FER(mtcnn=True)
-            logger.info("FER模型初始化成功")
-        except Exception as e:
-            logger.error(f"初始化FER模型失败: {str(e)}")
-            # 如果初始化失败，返回模拟数据
-            return _get_mock_emotion_data(), None
+        logger.error("FER模型不可用，返回模拟数据")
+        return _get_mock_emotion_data(), None
 
     try:
         start_time = time.time()
@@ -62,23 +55,6 @@ def process_camera_frame(image_data):
         preprocessing_end = time.time()
         preprocessing_duration = preprocessing_end - preprocessing_start
         
-        # 尝试使用FER模型进行情绪分析
-        # 如果emotion_detector仍然为None，再次尝试初始化
-        if emotion_detector is None:
-            try:
-                from fer import FER
-                logger.info("尝试初始化FER模型...")
-                emotion_detector = FER(mtcnn=True)
-                logger.info("FER模型初始化成功")
-            except Exception as e:
-                logger.error(f"初始化FER模型失败: {str(e)}")
-                # 如果初始化失败，返回模拟数据
-                total_duration = time.time() - start_time
-                mock_result = _get_mock_emotion_data()
-                mock_result["processing_info"]["total_time"] = round(total_duration * 1000, 2)
-                mock_result["processing_info"]["preprocessing_time"] = round(preprocessing_duration * 1000, 2)
-                return mock_result, None
-        
         # 使用FER进行情绪分析
         detection_start = time.time()
         emotions = emotion_detector.detect_emotions(img)
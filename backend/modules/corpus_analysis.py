@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+语料流式分析模块
+逐行读取NDJSON/纯文本语料，分批进行情感分析并以NDJSON逐批输出，内存占用与语料大小无关
+
+命令行用法:
+    python -m modules.corpus_analysis ../examples/text/ -o results.ndjson --workers 2
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", 64))
+
+CORPUS_FILE_EXTENSIONS = {".txt", ".jsonl", ".ndjson"}
+
+
+def parse_record(line, line_number):
+    """解析一行输入，支持纯文本或 {"id": ..., "text": ...} 形式的JSON对象"""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    line = line.strip()
+    if not line:
+        return None
+
+    if line.startswith("{"):
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return {"line": line_number, "error": "JSON格式错误"}
+        text = data.get("text")
+        if not isinstance(text, str) or not text.strip():
+            return {"line": line_number, "id": data.get("id"), "error": "文本不能为空"}
+        return {"line": line_number, "id": data.get("id"), "text": text}
+
+    return {"line": line_number, "text": line}
+
+
+def parse_lines(lines):
+    """逐行解析输入（生成器），跳过空行"""
+    for line_number, line in enumerate(lines, start=1):
+        record = parse_record(line, line_number)
+        if record is not None:
+            yield record
+
+
+def iter_batches(records, batch_size=STREAM_BATCH_SIZE):
+    """把记录组装为批次（生成器，只在内存中保留一个批次）"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def analyze_record_batch(records, **options):
+    """分析一个记录批次，返回对应的输出记录列表"""
+    from modules.text_analysis import analyze_emotions_batch
+
+    valid = [record for record in records if "text" in record]
+    results, error = [], None
+    if valid:
+        results, error = analyze_emotions_batch([record["text"] for record in valid], **options)
+
+    outputs = []
+    result_iter = iter(results or [])
+    for record in records:
+        output = {key: value for key, value in record.items() if key != "text"}
+        if "text" in record:
+            if error:
+                output["error"] = error
+            else:
+                output["result"] = next(result_iter)
+        outputs.append(output)
+    return outputs
+
+
+def stream_ndjson(lines, batch_size=STREAM_BATCH_SIZE, **options):
+    """流式分析：每完成一个批次就产出对应的NDJSON行"""
+    for batch in iter_batches(parse_lines(lines), batch_size):
+        for output in analyze_record_batch(batch, **options):
+            yield json.dumps(output, ensure_ascii=False) + "\n"
+
+
+def iter_corpus_records(paths):
+    """按顺序逐行读取语料文件并解析为记录，目录会展开为其中的语料文件"""
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if os.path.splitext(name)[1].lower() in CORPUS_FILE_EXTENSIONS
+            )
+        else:
+            files = [path]
+
+        for file_path in files:
+            with open(file_path, "r", encoding="utf-8") as f:
+                for record in parse_lines(f):
+                    record["source"] = file_path
+                    yield record
+
+
+def _init_worker(threads):
+    """进程池工作进程初始化：限制每个进程的计算线程数"""
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def run_corpus(paths, output, workers=1, batch_size=STREAM_BATCH_SIZE, **options):
+    """使用进程池分析语料并按输入顺序写出NDJSON，返回处理的记录数"""
+    count = 0
+    batches = iter_batches(iter_corpus_records(paths), batch_size)
+
+    if workers <= 1:
+        for batch in batches:
+            for record in analyze_record_batch(batch, **options):
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(threads,)
+    ) as executor:
+        # 限制同时提交的批次数量，避免把整个语料读入内存
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(analyze_record_batch, batch, **options))
+            if len(pending) >= workers * 2:
+                for record in pending.popleft().result():
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+        while pending:
+            for record in pending.popleft().result():
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量分析文本语料的情感（NDJSON输出）")
+    parser.add_argument(
+        "paths", nargs="+", help="语料文件或目录（.txt/.jsonl/.ndjson，每行一条文本）"
+    )
+    parser.add_argument("-o", "--output", help="输出文件，默认写到标准输出")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数")
+    parser.add_argument("--batch-size", type=int, default=STREAM_BATCH_SIZE, help="每批文本数")
+    parser.add_argument("--rules-first", action="store_true", help="关键词规则能判定时跳过模型推理")
+    parser.add_argument("--cascade", action="store_true", help="启用轻量模型级联")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+    options = {}
+    if args.rules_first:
+        options["rules_first"] = True
+    if args.cascade:
+        options["cascade"] = True
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        count = run_corpus(args.paths, output, args.workers, args.batch_size, **options)
+    finally:
+        if args.output:
+            output.close()
+
+    print(f"已分析 {count} 条记录", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
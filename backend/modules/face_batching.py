@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+面部表情批量分析模块
+分两阶段处理视频采样帧：先对所有帧做人脸检测并裁剪人脸，再把所有人脸合并为批次，
+一次前向推理完成表情分类。裁剪和预处理与 FER.detect_emotions 保持一致，
+每张人脸的结果与逐帧调用相同
+"""
+
+import os
+import logging
+
+import cv2
+import numpy as np
+
+try:
+    from fer.fer import PADDING as FER_PADDING
+except ImportError:
+    FER_PADDING = 40
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+VIDEO_FACE_BATCHING = os.environ.get("VIDEO_FACE_BATCHING", "true").lower() == "true"
+VIDEO_DETECT_BATCH_SIZE = int(os.environ.get("VIDEO_DETECT_BATCH_SIZE", 8))  # 每批做人脸检测的帧数
+VIDEO_CLASSIFY_BATCH_SIZE = int(os.environ.get("VIDEO_CLASSIFY_BATCH_SIZE", 128))  # 每批分类的人脸数
+
+# FER的默认值，取不到检测器的私有属性时使用
+DEFAULT_FACE_OFFSETS = (10, 10)
+DEFAULT_TARGET_SIZE = (64, 64)
+
+
+def supports_batching(detector):
+    """检测器是否提供批量分类所需的接口（本地Keras模型）"""
+    return (
+        hasattr(detector, "_classify_emotions")
+        and hasattr(detector, "find_faces")
+        and not getattr(detector, "tfserving", False)
+    )
+
+
+def detect_faces(detector, frames):
+    """对一批帧做人脸检测，返回每帧的人脸框列表 [(x, y, w, h), ...]
+
+    使用MTCNN时所有帧一次送入检测网络（同一视频的帧尺寸相同），否则逐帧检测
+    """
+    mtcnn = getattr(detector, "_mtcnn", None)
+    if mtcnn is None or len(frames) == 1:
+        return [detector.find_faces(frame, bgr=True) for frame in frames]
+
+    batch_boxes, _ = mtcnn.detect(list(frames))
+    faces = []
+    for boxes in batch_boxes:
+        # 与 FER.find_faces 相同的坐标转换
+        faces.append(
+            [
+                [int(box[0]), int(box[1]), int(box[2]) - int(box[0]), int(box[3]) - int(box[1])]
+                for box in boxes
+            ]
+            if isinstance(boxes, np.ndarray)
+            else []
+        )
+    return faces
+
+
+def crop_faces(detector, frame, face_rectangles):
+    """按 FER.detect_emotions 的方式裁剪并预处理人脸，返回 [(人脸框, 预处理后的灰度图), ...]"""
+    x_off, y_off = getattr(detector, "_FER__offsets", DEFAULT_FACE_OFFSETS)
+    target_size = tuple(getattr(detector, "_FER__emotion_target_size", DEFAULT_TARGET_SIZE))
+
+    gray_img = detector.pad(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    crops = []
+    for face_rectangle in face_rectangles:
+        x, y, w, h = detector.tosquare(face_rectangle)
+        x1 = max(0, x - x_off + FER_PADDING)
+        y1 = max(0, y - y_off + FER_PADDING)
+        x2 = x + w + x_off + FER_PADDING
+        y2 = y + h + y_off + FER_PADDING
+        try:
+            gray_face = cv2.resize(gray_img[y1:y2, x1:x2], target_size)
+        except Exception as e:
+            logger.warning(f"人脸裁剪区域缩放失败: {str(e)}")
+            continue
+        gray_face = (gray_face.astype("float32") / 255.0 - 0.5) * 2.0
+        crops.append((face_rectangle, gray_face))
+    return crops
+
+
+def classify_crops(detector, crops):
+    """批量分类预处理后的人脸图像，返回与 detect_emotions 相同格式的情绪得分字典列表"""
+    labels = detector._get_labels()
+    predictions = []
+    for start in range(0, len(crops), VIDEO_CLASSIFY_BATCH_SIZE):
+        batch = np.array(crops[start : start + VIDEO_CLASSIFY_BATCH_SIZE])
+        predictions.extend(np.asarray(detector._classify_emotions(batch)))
+    return [
+        {labels[idx]: round(float(score), 2) for idx, score in enumerate(scores)}
+        for scores in predictions
+    ]
+
+
+def detect_emotions_batch(detector, frames):
+    """批量分析多帧的面部表情，返回与逐帧调用 detector.detect_emotions 结构相同的结果列表
+
+    frames 为 [(帧号, 帧图像), ...] 的可迭代对象，可以是采样帧读取器；
+    返回 [(帧号, [{"box": ..., "emotions": {...}}, ...]), ...]，检测出错的帧结果为空列表
+    """
+    # 第一阶段：分批检测人脸并裁剪，只保留小尺寸的人脸图像
+    frame_ids = []
+    boxes = []
+    crops = []
+    owners = []  # 每张人脸所属的帧序号
+
+    def flush(pending):
+        try:
+            batch_faces = detect_faces(detector, [frame for _, frame in pending])
+        except Exception as e:
+            logger.error(f"批量人脸检测出错，改为逐帧检测: {str(e)}")
+            batch_faces = []
+            for frame_idx, frame in pending:
+                try:
+                    batch_faces.append(detector.find_faces(frame, bgr=True))
+                except Exception as frame_error:
+                    logger.error(f"分析帧 {frame_idx} 时出错: {str(frame_error)}")
+                    batch_faces.append([])
+
+        for (frame_idx, frame), face_rectangles in zip(pending, batch_faces):
+            position = len(frame_ids)
+            frame_ids.append(frame_idx)
+            for face_rectangle, gray_face in crop_faces(detector, frame, face_rectangles):
+                boxes.append(face_rectangle)
+                crops.append(gray_face)
+                owners.append(position)
+
+    pending = []
+    for item in frames:
+        pending.append(item)
+        if len(pending) >= VIDEO_DETECT_BATCH_SIZE:
+            flush(pending)
+            pending = []
+    if pending:
+        flush(pending)
+
+    results = [(frame_idx, []) for frame_idx in frame_ids]
+    for box, owner, emotions in zip(boxes, owners, classify_crops(detector, crops)):
+        results[owner][1].append({"box": box, "emotions": emotions})
+    logger.info(f"批量表情分类: {len(frame_ids)} 帧, {len(crops)} 张人脸")
+    return results
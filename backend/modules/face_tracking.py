@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+视频人脸跟踪模块
+只在关键采样帧上做完整的人脸检测，其余采样帧用模板匹配在上一位置附近跟踪人脸，
+关键帧上按IoU把检测结果关联到已有的人物；最后批量分类所有跟踪到的人脸，
+输出每个人物的情绪时间线
+"""
+
+import os
+import logging
+
+import cv2
+
+from modules.face_batching import detect_faces, crop_faces, classify_crops
+from modules.utils import emotion_to_chinese
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+VIDEO_FACE_TRACKING = os.environ.get("VIDEO_FACE_TRACKING", "false").lower() == "true"
+VIDEO_DETECT_INTERVAL = int(os.environ.get("VIDEO_DETECT_INTERVAL", 5))  # 每隔多少个采样帧做一次完整检测
+VIDEO_TRACK_MIN_SCORE = float(os.environ.get("VIDEO_TRACK_MIN_SCORE", 0.5))  # 模板匹配的最低相关系数
+VIDEO_TRACK_IOU = float(os.environ.get("VIDEO_TRACK_IOU", 0.3))  # 检测框关联到已有人物的最低IoU
+VIDEO_TRACK_MAX_MISSES = int(os.environ.get("VIDEO_TRACK_MAX_MISSES", 2))  # 连续多少个关键帧未检测到后不再关联
+
+# 模板匹配的搜索范围：人脸框向四周扩展的比例
+TRACK_SEARCH_MARGIN = 0.5
+
+
+def box_iou(a, b):
+    """计算两个 (x, y, w, h) 框的IoU"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def match_template(gray, template, box):
+    """在上一位置附近搜索人脸模板，返回 (新的人脸框, 相关系数)，搜索失败时返回 (None, 0)"""
+    x, y, w, h = box
+    margin_x, margin_y = int(w * TRACK_SEARCH_MARGIN), int(h * TRACK_SEARCH_MARGIN)
+    x1, y1 = max(0, x - margin_x), max(0, y - margin_y)
+    x2 = min(gray.shape[1], x + w + margin_x)
+    y2 = min(gray.shape[0], y + h + margin_y)
+    region = gray[y1:y2, x1:x2]
+    if region.shape[0] < template.shape[0] or region.shape[1] < template.shape[1]:
+        return None, 0.0
+
+    scores = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+    return [x1 + dx, y1 + dy, w, h], float(score)
+
+
+class FaceTrack:
+    """一个被跟踪的人物"""
+
+    def __init__(self, person_id, box, gray):
+        self.person_id = person_id
+        self.misses = 0
+        self.observations = []  # [(帧号, 人脸框, 是否来自检测)]
+        self.active = False
+        self.update(box, gray)
+
+    def update(self, box, gray):
+        x, y, w, h = [int(v) for v in box]
+        x, y = max(0, x), max(0, y)
+        self.box = [x, y, w, h]
+        self.template = gray[y : y + h, x : x + w]
+        self.active = self.template.size > 0
+
+
+class FaceTracker:
+    """关键帧检测 + 模板匹配跟踪"""
+
+    def __init__(self, detector, detect_interval=VIDEO_DETECT_INTERVAL):
+        self.detector = detector
+        self.detect_interval = max(1, detect_interval)
+        self.tracks = []
+        self.stats = {"frames": 0, "detections": 0, "tracked": 0, "lost": 0}
+
+    def _associate(self, frame_idx, faces, gray):
+        """把关键帧上的检测结果按IoU贪心关联到已有人物，未关联的检测创建新人物"""
+        candidates = [track for track in self.tracks if track.misses <= VIDEO_TRACK_MAX_MISSES]
+        pairs = sorted(
+            (
+                (box_iou(track.box, face), track_index, face_index)
+                for track_index, track in enumerate(candidates)
+                for face_index, face in enumerate(faces)
+            ),
+            reverse=True,
+        )
+
+        matched_tracks, matched_faces = set(), set()
+        for iou, track_index, face_index in pairs:
+            if iou < VIDEO_TRACK_IOU:
+                break
+            if track_index in matched_tracks or face_index in matched_faces:
+                continue
+            matched_tracks.add(track_index)
+            matched_faces.add(face_index)
+            track = candidates[track_index]
+            track.update(faces[face_index], gray)
+            track.misses = 0
+            track.observations.append((frame_idx, list(faces[face_index]), True))
+
+        for track_index, track in enumerate(candidates):
+            if track_index not in matched_tracks:
+                track.misses += 1
+                track.active = False
+
+        for face_index, face in enumerate(faces):
+            if face_index not in matched_faces:
+                track = FaceTrack(len(self.tracks), face, gray)
+                track.observations.append((frame_idx, list(face), True))
+                self.tracks.append(track)
+
+    def _follow(self, frame_idx, gray):
+        """非关键帧：在上一位置附近用模板匹配跟踪每个活跃的人物"""
+        for track in self.tracks:
+            if not track.active:
+                continue
+            box, score = match_template(gray, track.template, track.box)
+            if box is None or score < VIDEO_TRACK_MIN_SCORE:
+                track.active = False
+                self.stats["lost"] += 1
+                continue
+            track.update(box, gray)
+            track.observations.append((frame_idx, box, False))
+            self.stats["tracked"] += 1
+
+    def process(self, frames):
+        """处理 (帧号, 帧图像) 序列，同时收集每次观测的人脸裁剪，返回 [(人物, 观测序号, 预处理人脸)]"""
+        crops = []
+        for position, (frame_idx, frame) in enumerate(frames):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            counts = [len(track.observations) for track in self.tracks]
+
+            if position % self.detect_interval == 0:
+                try:
+                    faces = detect_faces(self.detector, [frame])[0]
+                except Exception as e:
+                    logger.error(f"检测帧 {frame_idx} 中的人脸时出错: {str(e)}")
+                    faces = []
+                self.stats["detections"] += 1
+                self._associate(frame_idx, faces, gray)
+            else:
+                self._follow(frame_idx, gray)
+            self.stats["frames"] += 1
+
+            # 裁剪本帧新增的观测，只保留小尺寸人脸图像
+            counts += [0] * (len(self.tracks) - len(counts))
+            for track, count in zip(self.tracks, counts):
+                for index in range(count, len(track.observations)):
+                    box = track.observations[index][1]
+                    for _, gray_face in crop_faces(self.detector, frame, [box]):
+                        crops.append((track, index, gray_face))
+        return crops
+
+
+def _summarize(emotion_dicts):
+    """计算平均情绪和主要情绪"""
+    avg_emotions = {}
+    for emotion_dict in emotion_dicts:
+        for emotion, score in emotion_dict.items():
+            avg_emotions[emotion] = avg_emotions.get(emotion, 0) + score / len(emotion_dicts)
+    dominant = max(avg_emotions, key=avg_emotions.get) if avg_emotions else "unknown"
+    return avg_emotions, dominant
+
+
+def track_face_emotions(detector, frames, fps):
+    """跟踪视频中的人脸并批量分类，返回 (所有观测的情绪列表, 人物时间线列表, 跟踪统计)"""
+    tracker = FaceTracker(detector)
+    crops = tracker.process(frames)
+    classified = classify_crops(detector, [gray_face for _, _, gray_face in crops])
+
+    timelines = {}
+    for (track, index, _), emotions in zip(crops, classified):
+        frame_idx, box, detected = track.observations[index]
+        timelines.setdefault(track.person_id, []).append(
+            {
+                "frame": frame_idx,
+                "time": frame_idx / fps if fps > 0 else 0,
+                "box": [int(v) for v in box],
+                "detected": detected,
+                "emotions": emotions,
+                "dominant_emotion": max(emotions, key=emotions.get),
+            }
+        )
+
+    persons = []
+    all_emotions = []
+    for person_id in sorted(timelines):
+        timeline = sorted(timelines[person_id], key=lambda item: item["frame"])
+        emotion_dicts = [item["emotions"] for item in timeline]
+        all_emotions.extend(emotion_dicts)
+        avg_emotions, dominant = _summarize(emotion_dicts)
+        persons.append(
+            {
+                "person_id": person_id,
+                "first_seen": timeline[0]["time"],
+                "last_seen": timeline[-1]["time"],
+                "emotions": avg_emotions,
+                "dominant_emotion": dominant,
+                "dominant_emotion_zh": emotion_to_chinese(dominant),
+                "timeline": timeline,
+            }
+        )
+
+    stats = dict(tracker.stats, persons=len(persons), faces=len(crops))
+    logger.info(f"人脸跟踪统计: {stats}")
+    return all_emotions, persons, stats
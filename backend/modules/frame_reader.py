@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+视频采样帧读取模块
+按帧号顺序读取采样帧：相邻采样帧间隔较小时用 grab() 顺序跳过中间帧、只对目标帧 retrieve()，
+间隔超过GOP估计值时改为跳转，避免每次跳转都从上一个关键帧重新解码
+
+在示例视频和合成的长视频上比较不同读取方式:
+    python -m modules.frame_reader benchmark --synthetic-minutes 10
+"""
+
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+
+import cv2
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+FRAME_READER_MODE = os.environ.get("FRAME_READER_MODE", "auto").lower()  # auto / sequential / seek
+
+# 无法探测GOP时使用的默认值（x264默认的最大关键帧间隔）
+DEFAULT_GOP = 250
+# 探测GOP时读取的视频包数量
+GOP_PROBE_PACKETS = 600
+
+FRAME_READER_MODES = ("auto", "sequential", "seek")
+
+# 基准测试使用的示例视频目录
+EXAMPLE_VIDEO_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "examples",
+    "video",
+)
+
+
+def sample_frame_indices(total_frames, max_samples):
+    """在视频中均匀选取不超过 max_samples 个帧号"""
+    if total_frames <= max_samples:
+        return list(range(total_frames))
+    return [int(i * total_frames / max_samples) for i in range(max_samples)]
+
+
+def estimate_gop(video_file, max_packets=GOP_PROBE_PACKETS):
+    """使用ffprobe读取开头若干视频包的关键帧标记，估计GOP长度，失败时返回None"""
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "packet=flags",
+                "-of",
+                "csv=p=0",
+                "-read_intervals",
+                f"%+#{max_packets}",
+                video_file,
+            ],
+            capture_output=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+
+    flags = result.stdout.decode("utf-8", errors="replace").split()
+    keyframes = [index for index, flag in enumerate(flags) if flag.startswith("K")]
+    if not flags or not keyframes:
+        return None
+    if len(keyframes) < 2:
+        # 探测范围内只有一个关键帧，GOP至少为探测的包数
+        return len(flags)
+    return (keyframes[-1] - keyframes[0]) / (len(keyframes) - 1)
+
+
+class SampledFrameReader:
+    """按给定帧号读取采样帧的迭代器，产出 (帧号, 帧图像)
+
+    mode 为 auto 时逐个比较：到下一个目标帧需要跳过的帧数不超过GOP估计值时顺序 grab()，
+    否则跳转（跳转的代价约等于从关键帧开始解码一个GOP）
+    """
+
+    def __init__(self, video, indices, mode=FRAME_READER_MODE, gop=None, video_file=None):
+        self.video = video
+        self.indices = sorted(set(indices))
+        if mode not in FRAME_READER_MODES:
+            logger.warning(f"未知的帧读取方式: {mode}，使用auto")
+            mode = "auto"
+        self.mode = mode
+
+        if mode == "auto" and gop is None:
+            gop = estimate_gop(video_file) if video_file else None
+        self.gop = gop or DEFAULT_GOP
+
+        self.stats = {"mode": mode, "gop": self.gop, "grabbed": 0, "retrieved": 0, "seeks": 0}
+
+    def _should_seek(self, gap):
+        if self.mode == "seek":
+            return gap != 0
+        if self.mode == "sequential":
+            return False
+        return gap > self.gop
+
+    def __iter__(self):
+        position = 0  # 下一次 grab() 将得到的帧号
+        for frame_idx in self.indices:
+            gap = frame_idx - position
+            if gap < 0 or self._should_seek(gap):
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                self.stats["seeks"] += 1
+                position = frame_idx
+            else:
+                # 顺序跳过中间帧：grab() 只解码不做颜色转换和拷贝
+                ok = True
+                while position < frame_idx:
+                    ok = self.video.grab()
+                    self.stats["grabbed"] += 1
+                    position += 1
+                    if not ok:
+                        break
+                if not ok:
+                    logger.warning(f"视频在帧 {position - 1} 处提前结束")
+                    return
+
+            ok = self.video.grab()
+            position += 1
+            if not ok:
+                logger.warning(f"无法读取帧 {frame_idx}")
+                continue
+            ok, frame = self.video.retrieve()
+            self.stats["retrieved"] += 1
+            if not ok:
+                logger.warning(f"无法读取帧 {frame_idx}")
+                continue
+            yield frame_idx, frame
+
+
+def read_sampled_frames(video_file, indices, mode=FRAME_READER_MODE):
+    """打开视频并读取采样帧（便捷函数），返回 ([(帧号, 帧图像), ...], 统计信息)"""
+    video = cv2.VideoCapture(video_file)
+    try:
+        reader = SampledFrameReader(video, indices, mode, video_file=video_file)
+        frames = list(reader)
+        return frames, reader.stats
+    finally:
+        video.release()
+
+
+def _make_synthetic_video(path, minutes, gop, fps=30):
+    """使用ffmpeg生成合成测试视频（长GOP的H.264）"""
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc=duration={int(minutes * 60)}:size=640x360:rate={fps}",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-g",
+            str(gop),
+            path,
+        ],
+        check=True,
+    )
+    return path
+
+
+def benchmark(paths, samples=20, modes=FRAME_READER_MODES):
+    """比较各读取方式读取采样帧的耗时，返回 {视频: {方式: 统计}}"""
+    results = {}
+    for path in paths:
+        video = cv2.VideoCapture(path)
+        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        video.release()
+        indices = sample_frame_indices(total_frames, samples)
+
+        results[path] = {}
+        for mode in modes:
+            start = time.time()
+            frames, stats = read_sampled_frames(path, indices, mode)
+            stats["seconds"] = time.time() - start
+            stats["frames"] = len(frames)
+            results[path][mode] = stats
+    return results
+
+
+def main(argv=None):
+    """命令行入口：采样帧读取基准测试"""
+    parser = argparse.ArgumentParser(description="视频采样帧读取基准测试")
+    parser.add_argument("command", choices=["benchmark"])
+    parser.add_argument("paths", nargs="*", help="视频文件，默认使用 examples/video/*.mp4")
+    parser.add_argument("--samples", type=int, default=20, help="每个视频的采样帧数")
+    parser.add_argument(
+        "--synthetic-minutes",
+        type=float,
+        nargs="*",
+        default=[],
+        help="额外生成指定时长（分钟）的合成视频参与测试（需要ffmpeg）",
+    )
+    parser.add_argument("--gop", type=int, default=DEFAULT_GOP, help="合成视频的关键帧间隔")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+    paths = args.paths or sorted(glob.glob(os.path.join(EXAMPLE_VIDEO_DIR, "*.mp4")))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for minutes in args.synthetic_minutes:
+            synthetic = os.path.join(tmp_dir, f"synthetic_{minutes:g}min_gop{args.gop}.mp4")
+            paths.append(_make_synthetic_video(synthetic, minutes, args.gop))
+
+        results = benchmark(paths, args.samples)
+
+    print(f"{'视频':<40}{'方式':<12}{'耗时(秒)':>10}{'跳转':>6}{'grab':>8}{'GOP':>8}")
+    for path, by_mode in results.items():
+        for mode, stats in by_mode.items():
+            print(
+                f"{os.path.basename(path):<40}{mode:<12}{stats['seconds']:>10.3f}"
+                f"{stats['seeks']:>6}{stats['grabbed']:>8}{stats['gop']:>8.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
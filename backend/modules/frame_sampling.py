@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+视频自适应采样模块
+按视频时长确定采样预算，先以低分辨率扫描候选帧计算画面变化量，
+在镜头切换和画面变化较大处采样，跳过几乎不变的重复画面。
+扫描时在内存上限内保留候选帧，选中的帧直接交给表情分析，无需再次解码视频
+"""
+
+import os
+import logging
+
+import cv2
+import numpy as np
+
+from modules.frame_reader import SampledFrameReader, sample_frame_indices
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+VIDEO_ADAPTIVE_SAMPLING = os.environ.get("VIDEO_ADAPTIVE_SAMPLING", "true").lower() == "true"
+VIDEO_SAMPLES_PER_MINUTE = float(os.environ.get("VIDEO_SAMPLES_PER_MINUTE", 20))
+VIDEO_MIN_SAMPLES = int(os.environ.get("VIDEO_MIN_SAMPLES", 10))
+VIDEO_MAX_SAMPLES = int(os.environ.get("VIDEO_MAX_SAMPLES", 200))
+VIDEO_CANDIDATE_FACTOR = int(os.environ.get("VIDEO_CANDIDATE_FACTOR", 4))  # 候选帧数 = 预算 × 该系数
+VIDEO_DUPLICATE_THRESHOLD = float(os.environ.get("VIDEO_DUPLICATE_THRESHOLD", 2.0))
+VIDEO_SCENE_THRESHOLD = float(os.environ.get("VIDEO_SCENE_THRESHOLD", 30.0))
+# 人脸情绪分析的CPU时间预算（秒，0表示不限制）及单帧分析耗时的估计值
+VIDEO_CPU_BUDGET_SECONDS = float(os.environ.get("VIDEO_CPU_BUDGET_SECONDS", 0))
+VIDEO_FACE_SECONDS_PER_FRAME = float(os.environ.get("VIDEO_FACE_SECONDS_PER_FRAME", 0.15))
+# 扫描候选帧时保留原始帧的内存上限（MB），超出时只保留缩略图，之后重新读取选中的帧
+VIDEO_FRAME_CACHE_MB = float(os.environ.get("VIDEO_FRAME_CACHE_MB", 256))
+
+# 计算画面变化量时使用的缩略图尺寸
+THUMBNAIL_SIZE = (64, 36)
+
+
+def sample_budget_for(duration, requested=None):
+    """根据视频时长（秒）和CPU时间预算确定采样帧数预算，requested 为请求指定的预算"""
+    limit = VIDEO_MAX_SAMPLES
+    if VIDEO_CPU_BUDGET_SECONDS > 0 and VIDEO_FACE_SECONDS_PER_FRAME > 0:
+        limit = min(limit, max(1, int(VIDEO_CPU_BUDGET_SECONDS / VIDEO_FACE_SECONDS_PER_FRAME)))
+
+    if requested is not None:
+        return max(1, min(int(requested), limit))
+    budget = int(round(duration / 60 * VIDEO_SAMPLES_PER_MINUTE))
+    return max(min(VIDEO_MIN_SAMPLES, limit), min(budget, limit))
+
+
+def _thumbnail(frame):
+    """缩小为灰度缩略图，用于廉价地比较画面差异"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def _mean_diff(a, b):
+    """两张缩略图的平均像素差"""
+    return float(np.mean(np.abs(a - b)))
+
+
+def select_by_change(thumbnails, budget):
+    """根据候选帧缩略图选择采样点，返回 (被选中的候选序号, 其中镜头切换的个数)
+
+    与上一个采样帧的平均像素差达到阈值时采样，阈值取 相邻候选帧变化量之和/预算，
+    且不低于重复画面阈值（与上一个采样帧比较，噪声不会累积成一次采样）；
+    与前一个候选帧的差超过镜头切换阈值时总是采样。结果超过预算时保留变化最大的帧。
+    """
+    if not thumbnails:
+        return [], 0
+
+    changes = [0.0] + [
+        _mean_diff(thumbnails[i], thumbnails[i - 1]) for i in range(1, len(thumbnails))
+    ]
+    threshold = max(sum(changes) / budget, VIDEO_DUPLICATE_THRESHOLD)
+
+    selected = [0]
+    scores = {0: float("inf")}
+    reference = thumbnails[0]
+    for index in range(1, len(thumbnails)):
+        score = max(changes[index], _mean_diff(thumbnails[index], reference))
+        if changes[index] >= VIDEO_SCENE_THRESHOLD or score >= threshold:
+            selected.append(index)
+            scores[index] = score
+            reference = thumbnails[index]
+
+    if len(selected) > budget:
+        # 第一个候选帧保留，其余按变化量从大到小取
+        selected = sorted(sorted(selected, key=scores.get, reverse=True)[:budget])
+    scene_changes = sum(1 for index in selected if changes[index] >= VIDEO_SCENE_THRESHOLD)
+    return selected, scene_changes
+
+
+def plan_samples(video, total_frames, fps, budget=None, video_file=None):
+    """规划需要分析的帧号，返回 (帧号列表, 采样统计, 已读取的选中帧)
+
+    budget 为请求指定的采样预算，None 时按视频时长计算。
+    候选帧在 VIDEO_FRAME_CACHE_MB 以内时返回扫描中保留的选中帧 [(帧号, 帧图像), ...]，
+    否则返回None，由调用方重新读取（采样统计中的 gop 可传给 SampledFrameReader，避免再次探测）
+    """
+    duration = total_frames / fps if fps > 0 else 0
+    budget = sample_budget_for(duration, budget)
+
+    if not VIDEO_ADAPTIVE_SAMPLING or total_frames <= budget:
+        indices = sample_frame_indices(total_frames, budget)
+        return indices, {"adaptive": False, "budget": budget, "selected": len(indices)}, None
+
+    # 第一遍：扫描均匀分布的候选帧，计算缩略图，并在内存上限内保留原始帧
+    candidates = sample_frame_indices(total_frames, budget * VIDEO_CANDIDATE_FACTOR)
+    cache_limit = VIDEO_FRAME_CACHE_MB * 1024 * 1024
+    reader = SampledFrameReader(video, candidates, video_file=video_file)
+    scanned = []
+    thumbnails = []
+    cached = []
+    for frame_idx, frame in reader:
+        scanned.append(frame_idx)
+        thumbnails.append(_thumbnail(frame))
+        if cached is not None:
+            if frame.nbytes * len(candidates) <= cache_limit:
+                cached.append(frame)
+            else:
+                cached = None
+
+    selected, scene_changes = select_by_change(thumbnails, budget)
+    indices = [scanned[index] for index in selected]
+    frames = [(scanned[index], cached[index]) for index in selected] if cached else None
+    stats = {
+        "adaptive": True,
+        "budget": budget,
+        "candidates": len(scanned),
+        "selected": len(indices),
+        "scene_changes": scene_changes,
+        "cached_frames": frames is not None,
+        "gop": reader.gop,
+    }
+    logger.info(f"自适应采样: {stats}")
+    return indices, stats, frames
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+情感关键词词典模块
+将关键词词典编译为多模式匹配自动机（Aho-Corasick），一次线性扫描即可统计所有类别的命中次数
+"""
+
+import os
+import json
+import logging
+from collections import deque
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 词典文件路径，可通过环境变量覆盖
+DEFAULT_LEXICON_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "emotion_lexicon.json",
+)
+LEXICON_PATH = os.environ.get("EMOTION_LEXICON_PATH", DEFAULT_LEXICON_PATH)
+
+
+class KeywordMatcher:
+    """多类别关键词匹配器
+
+    lexicon 结构为 {类别: {关键词: 权重}}。每个关键词在文本中出现（无论出现几次）
+    即为对应类别计入一次权重，与原先 ``sum(1 for word in keywords if word in text)``
+    的语义一致；权重等于关键词在原列表中的重复次数。
+    """
+
+    def __init__(self, lexicon):
+        self.categories = list(lexicon.keys())
+
+        # 去重后的关键词表，同一关键词可属于多个类别
+        self._patterns = []
+        pattern_ids = {}
+        self._pattern_weights = []  # 每个关键词: [(类别下标, 权重), ...]
+        for category_index, category in enumerate(self.categories):
+            for word, weight in lexicon[category].items():
+                if not word:
+                    continue
+                if word not in pattern_ids:
+                    pattern_ids[word] = len(self._patterns)
+                    self._patterns.append(word)
+                    self._pattern_weights.append([])
+                self._pattern_weights[pattern_ids[word]].append(
+                    (category_index, int(weight))
+                )
+
+        self._build()
+
+    def _build(self):
+        """构建 goto / fail / output 表"""
+        self._goto = [{}]
+        outputs = [[]]
+
+        for pattern_id, word in enumerate(self._patterns):
+            state = 0
+            for char in word:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(pattern_id)
+
+        # 广度优先计算失败指针，并把失败链上的输出合并到当前状态
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                outputs[next_state].extend(outputs[self._fail[next_state]])
+
+        self._outputs = [tuple(output) for output in outputs]
+
+    def find(self, text):
+        """返回文本中出现过的关键词下标集合"""
+        found = set()
+        if not text:
+            return found
+
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+    def count(self, text):
+        """统计各类别的关键词命中次数，返回 {类别: 次数}"""
+        counts = [0] * len(self.categories)
+        for pattern_id in self.find(text):
+            for category_index, weight in self._pattern_weights[pattern_id]:
+                counts[category_index] += weight
+        return dict(zip(self.categories, counts))
+
+    @property
+    def pattern_count(self):
+        """去重后的关键词数量"""
+        return len(self._patterns)
+
+
+def load_lexicons(path=None):
+    """从JSON文件加载所有词典，返回 {词典名: {类别: {关键词: 权重}}}"""
+    path = path or LEXICON_PATH
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_matchers(path=None):
+    """加载词典文件并为每个词典编译一个匹配器"""
+    lexicons = load_lexicons(path)
+    matchers = {name: KeywordMatcher(lexicon) for name, lexicon in lexicons.items()}
+    for name, matcher in matchers.items():
+        logger.info(f"情感词典 {name} 编译完成: {matcher.pattern_count} 个关键词")
+    return matchers
@@ -8,18 +8,22 @@
 
 import os
 import time
+import threading
 import torch
 import logging
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-import whisper
 from fer import FER
 
+from modules.text_backends import load_text_backend
+from modules.speech_backends import load_speech_backend
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 全局变量
+# 全局变量（共享模型注册表，所有模块通过 get_* 函数获取同一份实例）
 model = None
 tokenizer = None
+cascade_model = None
+cascade_tokenizer = None
 whisper_model = None
 emotion_detector = None
 device = "cuda:0" if torch.cuda.is_available() else "cpu"
@@ -27,21 +31,153 @@ model_loaded = False
 model_loading = False
 last_model_load_time = 0
 
+# 每个模型一把锁，保证并发请求下只加载一次
+_model_locks = {
+    "text": threading.Lock(),
+    "cascade": threading.Lock(),
+    "whisper": threading.Lock(),
+    "face": threading.Lock(),
+}
+
+# 模型（重新）加载完成后的回调，例如清空依赖该模型的推理缓存
+_reload_callbacks = {"text": [], "cascade": [], "whisper": [], "face": []}
+
 # 从环境变量获取配置
 MODEL_NAME = os.environ.get("MODEL_NAME", "nlptown/bert-base-multilingual-uncased-sentiment")
 MODEL_RELOAD_INTERVAL = int(os.environ.get("MODEL_RELOAD_INTERVAL", 24 * 60 * 60))  # 默认24小时
+TEXT_BACKEND = os.environ.get("TEXT_BACKEND", "torch").lower()  # torch / quantized / onnx
+TEXT_CASCADE_ENABLED = os.environ.get("TEXT_CASCADE_ENABLED", "false").lower() == "true"
+TEXT_CASCADE_MODEL = os.environ.get(
+    "TEXT_CASCADE_MODEL", "lxyuan/distilbert-base-multilingual-cased-sentiments-student"
+)
+WHISPER_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "base")  # tiny / base / small / medium
+SPEECH_BACKEND = os.environ.get("SPEECH_BACKEND", "whisper").lower()  # whisper / faster-whisper
+
+# 量化和ONNX后端只在CPU上运行
+text_backend = TEXT_BACKEND
+text_device = device if TEXT_BACKEND == "torch" else "cpu"
+speech_backend = SPEECH_BACKEND
+
+
+def _load_text_model():
+    """加载文本情感分析模型"""
+    global model, tokenizer, text_backend
+    logger.info(f"加载文本情感分析模型: {MODEL_NAME}，推理后端: {TEXT_BACKEND}")
+    new_model, new_tokenizer, backend = load_text_backend(MODEL_NAME, TEXT_BACKEND, text_device)
+    model, tokenizer, text_backend = new_model, new_tokenizer, backend
+    logger.info(f"文本情感分析模型加载成功（后端: {backend}）")
+
+
+def _load_cascade_model():
+    """加载级联第一级的轻量文本情感分类模型"""
+    global cascade_model, cascade_tokenizer
+    logger.info(f"加载轻量文本情感分类模型: {TEXT_CASCADE_MODEL}")
+    new_model, new_tokenizer, _ = load_text_backend(TEXT_CASCADE_MODEL, TEXT_BACKEND, text_device)
+    cascade_model, cascade_tokenizer = new_model, new_tokenizer
+    logger.info("轻量文本情感分类模型加载成功")
+
+
+def _load_whisper_model():
+    """加载语音识别模型"""
+    global whisper_model, speech_backend
+    logger.info(f"加载Whisper语音识别模型: {WHISPER_MODEL_SIZE} ({SPEECH_BACKEND})")
+    whisper_model, speech_backend = load_speech_backend(WHISPER_MODEL_SIZE, SPEECH_BACKEND, device)
+    logger.info("Whisper语音识别模型加载成功")
+
+
+def _load_emotion_detector():
+    """加载面部表情识别模型"""
+    global emotion_detector
+    logger.info("加载面部表情识别模型...")
+    emotion_detector = FER(mtcnn=True)
+    logger.info("面部表情识别模型加载成功")
+
+
+_loaders = {
+    "text": (_load_text_model, lambda: model is not None and tokenizer is not None),
+    "cascade": (
+        _load_cascade_model,
+        lambda: cascade_model is not None and cascade_tokenizer is not None,
+    ),
+    "whisper": (_load_whisper_model, lambda: whisper_model is not None),
+    "face": (_load_emotion_detector, lambda: emotion_detector is not None),
+}
+
+
+def _ensure_loaded(name, force=False):
+    """确保指定模型已加载（线程安全，只加载一次），返回是否可用"""
+    loader, is_loaded = _loaders[name]
+    if is_loaded() and not force:
+        return True
+
+    with _model_locks[name]:
+        # 获得锁后再检查一次，其他线程可能已经完成加载
+        if is_loaded() and not force:
+            return True
+        try:
+            loader()
+        except Exception as e:
+            logger.error(f"加载模型 {name} 时出错: {str(e)}")
+            return is_loaded()
+
+        for callback in _reload_callbacks[name]:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"执行模型 {name} 加载回调时出错: {str(e)}")
+    return is_loaded()
+
+
+def register_reload_callback(name, callback):
+    """注册模型（重新）加载完成后调用的回调函数"""
+    _reload_callbacks[name].append(callback)
+
+
+def get_text_model():
+    """获取共享的文本情感分析模型和分词器，未加载时按需加载"""
+    if not _ensure_loaded("text"):
+        return None, None
+    return model, tokenizer
+
+
+def get_text_backend():
+    """获取实际加载的文本推理后端（配置的后端不可用时会回退为torch）"""
+    return text_backend
+
+
+def get_cascade_model():
+    """获取共享的轻量文本情感分类模型和分词器，未加载时按需加载"""
+    if not _ensure_loaded("cascade"):
+        return None, None
+    return cascade_model, cascade_tokenizer
+
+
+def get_whisper_model():
+    """获取共享的Whisper语音识别模型，未加载时按需加载"""
+    if not _ensure_loaded("whisper"):
+        return None
+    return whisper_model
+
+
+def get_emotion_detector():
+    """获取共享的面部表情识别模型，未加载时按需加载"""
+    if not _ensure_loaded("face"):
+        return None
+    return emotion_detector
 
 
 def load_model():
     """加载所有模型"""
-    global model, tokenizer, whisper_model, emotion_detector, model_loaded, model_loading, last_model_load_time
+    global model_loaded, model_loading, last_model_load_time
 
     current_time = time.time()
 
     # 如果模型已加载但超过指定时间，考虑重新加载
+    force = False
     if model_loaded and (current_time - last_model_load_time > MODEL_RELOAD_INTERVAL):
         logger.info(f"模型已加载超过{MODEL_RELOAD_INTERVAL/3600}小时，准备重新加载...")
         model_loaded = False
+        force = True
 
     # 如果模型已经加载或正在加载，则直接返回
     if model_loaded or model_loading:
@@ -52,33 +188,13 @@ def load_model():
     try:
         logger.info("开始加载模型...")
 
-        # 加载文本情感分析模型
-        try:
-            logger.info(f"加载文本情感分析模型: {MODEL_NAME}")
-            model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME).to(device)
-            tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-            logger.info("文本情感分析模型加载成功")
-        except Exception as e:
-            logger.error(f"加载文本情感分析模型时出错: {str(e)}")
-            raise
-
-        # 加载语音识别模型
-        try:
-            logger.info("加载Whisper语音识别模型...")
-            whisper_model = whisper.load_model("base")
-            logger.info("Whisper语音识别模型加载成功")
-        except Exception as e:
-            logger.error(f"加载Whisper语音识别模型时出错: {str(e)}")
-            raise
+        for name in ("text", "whisper", "face"):
+            if not _ensure_loaded(name, force=force):
+                raise RuntimeError(f"模型 {name} 加载失败")
 
-        # 加载面部表情识别模型
-        try:
-            logger.info("加载面部表情识别模型...")
-            emotion_detector = FER(mtcnn=True)
-            logger.info("面部表情识别模型加载成功")
-        except Exception as e:
-            logger.error(f"加载面部表情识别模型时出错: {str(e)}")
-            raise
+        # 级联模式的轻量模型加载失败时不影响整体状态，请求会直接使用完整模型
+        if TEXT_CASCADE_ENABLED:
+            _ensure_loaded("cascade", force=force)
 
         # 更新模型状态
         model_loaded = True
@@ -99,5 +215,9 @@ def get_model_status():
         "last_load_time": last_model_load_time,
         "device": device,
         "cuda_available": torch.cuda.is_available(),
-        "model_name": MODEL_NAME
+        "model_name": MODEL_NAME,
+        "text_backend": text_backend,
+        "speech_backend": speech_backend,
+        "whisper_model_size": WHISPER_MODEL_SIZE,
+        "models": {name: is_loaded() for name, (_, is_loaded) in _loaders.items()},
     }
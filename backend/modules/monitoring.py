@@ -31,6 +31,9 @@ system_stats = {
     "last_update": 0,
 }
 
+# 文本模型级联统计：各级模型给出最终结果的次数
+cascade_stats = defaultdict(int)
+
 # 线程锁
 stats_lock = threading.Lock()
 
@@ -89,6 +92,25 @@ def record_error(endpoint):
         performance_stats["errors"][endpoint] += 1
 
 
+def record_model_tier(tier, count=1):
+    """记录文本模型级联中由哪一级模型给出结果"""
+    with stats_lock:
+        cascade_stats[tier] += count
+
+
+def get_cascade_stats():
+    """获取文本模型级联各级命中率"""
+    with stats_lock:
+        total = sum(cascade_stats.values())
+        return {
+            "total": total,
+            "tiers": {
+                tier: {"count": count, "rate": count / total * 100 if total else 0}
+                for tier, count in cascade_stats.items()
+            },
+        }
+
+
 def update_system_stats():
     """更新系统资源统计"""
     current_time = time.time()
@@ -143,6 +165,8 @@ def get_performance_summary():
                 "max_duration": max(durations) if durations else 0,
             }
 
+    summary["text_cascade"] = get_cascade_stats()
+
     # 更新系统统计
     update_system_stats()
 
@@ -211,6 +235,7 @@ def reset_stats():
         performance_stats["errors"].clear()
         performance_stats["total_requests"] = 0
         performance_stats["start_time"] = time.time()
+        cascade_stats.clear()
 
         system_stats["cpu_usage"].clear()
         system_stats["memory_usage"].clear()
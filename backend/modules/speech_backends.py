@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+语音识别推理后端模块
+支持openai-whisper（PyTorch）和faster-whisper（CTranslate2，默认int8量化）两种后端
+
+在示例音频上比较各后端的实时率(RTF)和字/词错误率:
+    python -m modules.speech_backends benchmark --backends whisper faster-whisper
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+
+import whisper
+
+# 导入faster-whisper（可选依赖）
+try:
+    from faster_whisper import WhisperModel
+
+    faster_whisper_available = True
+except ImportError:
+    faster_whisper_available = False
+
+from modules.audio_decoding import SAMPLE_RATE, decode_audio_file
+from modules.utils import traditional_to_simplified
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+SPEECH_BACKENDS = ("whisper", "faster-whisper")
+# 各后端对外显示的名称
+SPEECH_BACKEND_NAMES = {"whisper": "OpenAI Whisper", "faster-whisper": "faster-whisper"}
+
+# faster-whisper的计算精度（int8 / int8_float16 / float16 / float32）
+SPEECH_COMPUTE_TYPE = os.environ.get("SPEECH_COMPUTE_TYPE", "int8")
+
+# 基准测试使用的示例音频目录（包含 transcripts.json 参考文本）
+EXAMPLE_AUDIO_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "examples",
+    "audio",
+)
+
+
+class FasterWhisperModel:
+    """faster-whisper模型的包装，transcribe的调用方式和返回结构与openai-whisper一致"""
+
+    def __init__(self, model_size, device="cpu", compute_type=SPEECH_COMPUTE_TYPE, threads=0):
+        self.model = WhisperModel(
+            model_size, device=device, compute_type=compute_type, cpu_threads=threads
+        )
+        self.compute_type = compute_type
+
+    def transcribe(self, audio, language=None, fp16=False, **kwargs):
+        # openai-whisper默认使用贪心解码，这里保持一致
+        kwargs.setdefault("beam_size", 1)
+        segments, _ = self.model.transcribe(audio, language=language, **kwargs)
+        segments = [
+            {"start": segment.start, "end": segment.end, "text": segment.text}
+            for segment in segments
+        ]
+        return {"text": "".join(segment["text"] for segment in segments), "segments": segments}
+
+
+def load_speech_backend(model_size="base", backend="whisper", device="cpu"):
+    """按指定后端加载语音识别模型，返回 (模型, 实际使用的后端)"""
+    if backend not in SPEECH_BACKENDS:
+        logger.warning(f"未知的语音识别后端: {backend}，使用默认的whisper后端")
+        backend = "whisper"
+    if backend == "faster-whisper" and not faster_whisper_available:
+        logger.warning("faster-whisper未安装，使用默认的whisper后端")
+        backend = "whisper"
+
+    if backend == "faster-whisper":
+        # CTranslate2只区分cpu和cuda设备
+        ct2_device = "cuda" if str(device).startswith("cuda") else "cpu"
+        return FasterWhisperModel(model_size, ct2_device), backend
+
+    return whisper.load_model(model_size, device=device), backend
+
+
+def _is_cjk(text):
+    """判断文本是否包含中文字符"""
+    return bool(re.search(r"[\u4e00-\u9fff]", text))
+
+
+def _normalize_transcript(text):
+    """比较前统一为简体小写并去除标点（中文同时去除空白）"""
+    text = traditional_to_simplified(text).lower()
+    if _is_cjk(text):
+        return re.sub(r"[\W_]", "", text)
+    return re.sub(r"[^\w\s]", "", text)
+
+
+def _edit_distance(reference, hypothesis):
+    """计算两个序列的编辑距离"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_item in enumerate(reference, start=1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_item in enumerate(hypothesis, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_item != hyp_item),
+            )
+        previous = current
+    return previous[-1]
+
+
+def error_rate(reference, hypothesis):
+    """计算错误率：中文按字（CER），其他语言按词（WER）"""
+    reference = _normalize_transcript(reference)
+    hypothesis = _normalize_transcript(hypothesis)
+    if _is_cjk(reference):
+        ref_units, hyp_units = list(reference), list(hypothesis)
+    else:
+        ref_units, hyp_units = reference.split(), hypothesis.split()
+    if not ref_units:
+        return 0.0 if not hyp_units else 1.0
+    return _edit_distance(ref_units, hyp_units) / len(ref_units)
+
+
+def benchmark(backends, model_size="base", audio_dir=EXAMPLE_AUDIO_DIR, language="zh"):
+    """对每个后端转写示例音频，返回 {后端: 统计} 的实时率和错误率"""
+    with open(os.path.join(audio_dir, "transcripts.json"), "r", encoding="utf-8") as f:
+        references = json.load(f)
+    paths = sorted(glob.glob(os.path.join(audio_dir, "*.mp3")))
+    audios = {path: decode_audio_file(path) for path in paths}
+
+    results = {}
+    for name in backends:
+        load_start = time.time()
+        speech_model, actual = load_speech_backend(model_size, name)
+        if actual != name:
+            logger.warning(f"后端 {name} 不可用，跳过")
+            continue
+        load_time = time.time() - load_start
+
+        # 预热一次，避免首次推理的初始化开销计入结果
+        speech_model.transcribe(audios[paths[0]][: SAMPLE_RATE * 2], language=language, fp16=False)
+
+        audio_seconds, compute_seconds, errors = 0.0, 0.0, []
+        for path, audio in audios.items():
+            start = time.time()
+            text = speech_model.transcribe(audio, language=language, fp16=False)["text"]
+            compute_seconds += time.time() - start
+            audio_seconds += len(audio) / SAMPLE_RATE
+            reference = references.get(os.path.basename(path))
+            if reference:
+                errors.append(error_rate(reference, text))
+
+        results[name] = {
+            "model_size": model_size,
+            "load_seconds": load_time,
+            "audio_seconds": audio_seconds,
+            "rtf": compute_seconds / audio_seconds if audio_seconds else 0.0,
+            "error_rate": sum(errors) / len(errors) if errors else None,
+            "files": len(audios),
+        }
+        logger.info(f"{name}: {results[name]}")
+        del speech_model
+    return results
+
+
+def main(argv=None):
+    """命令行入口：比较各语音识别后端的实时率和错误率"""
+    parser = argparse.ArgumentParser(description="语音识别后端基准测试")
+    parser.add_argument("command", choices=["benchmark"])
+    parser.add_argument(
+        "--backends", nargs="+", choices=SPEECH_BACKENDS, default=list(SPEECH_BACKENDS)
+    )
+    parser.add_argument(
+        "--model-size", default=os.environ.get("WHISPER_MODEL_SIZE", "base")
+    )
+    parser.add_argument("--audio-dir", default=EXAMPLE_AUDIO_DIR)
+    parser.add_argument("--language", default="zh")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+    results = benchmark(args.backends, args.model_size, args.audio_dir, args.language)
+    print(f"{'后端':<16}{'模型':<10}{'RTF':>8}{'错误率':>10}")
+    for name, stats in results.items():
+        error = "-" if stats["error_rate"] is None else f"{stats['error_rate']:.3f}"
+        print(f"{name:<16}{stats['model_size']:<10}{stats['rtf']:>8.3f}{error:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,80 +8,137 @@
 
 import os
 import base64
-import tempfile
 import logging
+import tempfile
 from flask import request, jsonify
 import time
 from werkzeug.utils import secure_filename
 
 # 导入自定义模块
-from modules.models import whisper_model, model_loaded
+from modules.models import get_whisper_model
 from modules.utils import (
     error_response,
     allowed_file,
     safe_filename,
-    traditional_to_simplified,
+    parse_bool_option,
+)
+from modules.text_analysis import analyze_emotion, analyze_segment_emotions
+from modules.audio_decoding import (
+    decode_audio_bytes,
+    decode_audio_file,
+    probe_duration,
+    SAMPLE_RATE,
+)
+from modules.transcription import (
+    transcribe_array,
+    transcribe_long_audio,
+    is_long_audio,
+    uses_process_pool,
 )
-from modules.text_analysis import analyze_emotion
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 从环境变量获取配置
+SPEECH_VAD_ENABLED = os.environ.get("SPEECH_VAD_ENABLED", "true").lower() == "true"
+SPEECH_SEGMENT_SENTIMENT = os.environ.get("SPEECH_SEGMENT_SENTIMENT", "false").lower() == "true"
 
-def recognize_speech(audio_file, language="zh-CN"):
-    """使用Whisper识别语音"""
-    # 初始化Whisper模型（如果尚未初始化）
-    global whisper_model
-    if whisper_model is None:
-        try:
-            import whisper
-
-            logger.info("尝试初始化Whisper模型...")
-            whisper_model = whisper.load_model("base")
-            logger.info("Whisper模型初始化成功")
-        except Exception as e:
-            logger.error(f"初始化Whisper模型失败: {str(e)}")
-            return None, f"语音识别模型初始化失败: {str(e)}"
-
-    # 如果模型仍然为None，返回模拟数据
-    if whisper_model is None:
-        return (
-            "这是一段模拟的语音识别结果。由于模型尚未加载完成，我们提供了这个示例文本。请稍后再试。",
-            None,
-        )
 
+def transcribe_speech(audio_file, language="zh-CN"):
+    """使用Whisper识别语音，返回包含文本、分段和静音裁剪信息的字典
+
+    audio_file 可以是文件路径或16kHz单声道float32数组。启用VAD时先去除静音，
+    只把语音区间拼接后交给Whisper，分段时间戳会映射回原始音频。
+    超过 SPEECH_LONG_AUDIO_MIN_SECONDS 的长音频按静音切分为窗口并行转写，
+    audio_file 为文件路径时逐窗口流式解码，不会把整段音频读入内存。
+    """
     try:
         start_time = time.time()
         logger.info(f"开始识别语音，语言: {language}")
 
-        # 使用Whisper模型进行语音识别
-        result = whisper_model.transcribe(
-            audio_file, language=language[:2] if language else None, fp16=False
-        )
-
-        # 获取识别结果
-        text = result["text"].strip()
+        if isinstance(audio_file, str):
+            duration = probe_duration(audio_file)
+        else:
+            duration = len(audio_file) / SAMPLE_RATE
+        long_audio = is_long_audio(duration)
+
+        # 长音频交给转写进程池时模型只在工作进程中加载，当前进程无需加载
+        whisper_model = None
+        if not (long_audio and uses_process_pool()):
+            # 从共享模型注册表获取Whisper模型（如果尚未加载则按需加载一次）
+            whisper_model = get_whisper_model()
+            if whisper_model is None:
+                return None, "语音识别模型初始化失败，请稍后再试"
+
+        if long_audio:
+            logger.info(f"音频时长 {duration:.2f}秒，使用长音频分段转写")
+            result = transcribe_long_audio(
+                audio_file, language, SPEECH_VAD_ENABLED, whisper_model
+            )
+        else:
+            if isinstance(audio_file, str) and SPEECH_VAD_ENABLED:
+                audio_file = decode_audio_file(audio_file)
+            result = transcribe_array(whisper_model, audio_file, language, SPEECH_VAD_ENABLED)
+
+        vad_stats = result["vad"]
+        if vad_stats:
+            logger.info(
+                f"静音裁剪完成: 原始 {vad_stats['original_duration']:.2f}秒，"
+                f"保留 {vad_stats['voiced_duration']:.2f}秒 ({vad_stats['speech_regions']} 个语音区间)"
+            )
 
-        # 将繁体中文转换为简体中文
-        text = traditional_to_simplified(text)
         end_time = time.time()
         logger.info(f"语音识别完成，耗时: {end_time - start_time:.2f}秒")
-        logger.info(f"识别结果: {text[:100]}...")
-        return text, None
+        logger.info(f"识别结果: {result['text'][:100]}...")
+        return result, None
     except Exception as e:
         error_msg = f"语音识别出错: {str(e)}"
         logger.error(error_msg)
         return None, error_msg
 
 
-def process_audio_file(file_path, language="zh-CN"):
-    """处理音频文件并返回识别结果及情感分析"""
+def recognize_speech(audio_file, language="zh-CN"):
+    """使用Whisper识别语音，只返回识别文本"""
+    transcription, error = transcribe_speech(audio_file, language)
+    if error:
+        return None, error
+    return transcription["text"], None
+
+
+def segment_sentiment_track(transcription, segment_sentiment=None):
+    """按需为识别结果的每个分段分析情感，返回 (情感轨迹, 错误信息)，未启用时返回 (None, None)"""
+    if segment_sentiment is None:
+        segment_sentiment = SPEECH_SEGMENT_SENTIMENT
+    if not segment_sentiment:
+        return None, None
+    return analyze_segment_emotions(transcription["segments"])
+
+
+def process_audio_file(audio, language="zh-CN", segment_sentiment=None):
+    """处理音频（文件路径或已解码的音频数组）并返回识别结果及情感分析
+
+    segment_sentiment 为True时额外返回每个分段的情感轨迹（sentiment_track）
+    """
     try:
         # 识别语音
-        text, error = recognize_speech(file_path, language)
+        transcription, error = transcribe_speech(audio, language)
         if error:
             return error_response(error)
 
+        text = transcription["text"]
+        if not text:
+            return error_response("未检测到语音")
+
+        # 静音裁剪信息（裁剪比例等）
+        extra = {"vad": transcription["vad"]} if transcription["vad"] else {}
+
+        # 分段情感轨迹
+        track, track_error = segment_sentiment_track(transcription, segment_sentiment)
+        if track_error:
+            logger.warning(f"分段情感分析出错: {track_error}")
+        elif track is not None:
+            extra["sentiment_track"] = track
+
         # 对识别出的文本进行情感分析
         emotion_result, emotion_error = analyze_emotion(text)
         if emotion_error:
@@ -94,6 +151,7 @@ def process_audio_file(file_path, language="zh-CN"):
                     "language": language,
                     "emotion_analysis": None,
                     "emotion_error": emotion_error,
+                    **extra,
                 }
             )
 
@@ -103,63 +161,50 @@ def process_audio_file(file_path, language="zh-CN"):
                 "text": text,
                 "language": language,
                 "emotion_analysis": emotion_result,
+                **extra,
             }
         )
     except Exception as e:
         return error_response(f"处理音频文件时出错: {str(e)}")
 
 
-def process_audio_base64(audio_data, language="zh-CN"):
+def process_audio_base64(audio_data, language="zh-CN", segment_sentiment=None):
     """处理Base64编码的音频数据"""
     try:
-        # 解码Base64数据
+        # 解码Base64数据，并在内存中直接解码为音频数组，不写临时文件
         audio_bytes = base64.b64decode(audio_data)
+        audio = decode_audio_bytes(audio_bytes)
 
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-            temp_file.write(audio_bytes)
-            temp_file_path = temp_file.name
-
-        try:
-            # 识别语音
-            text, error = recognize_speech(temp_file_path, language)
-            if error:
-                return error_response(error)
-
-            # 对识别出的文本进行情感分析
-            emotion_result, emotion_error = analyze_emotion(text)
-            if emotion_error:
-                logger.warning(f"情感分析出错: {emotion_error}")
-
-                # 即使情感分析出错，仍然返回语音识别结果
-                return jsonify(
-                    {
-                        "success": True,
-                        "text": text,
-                        "language": language,
-                        "emotion_analysis": None,
-                        "emotion_error": emotion_error,
-                    }
-                )
-
-            return jsonify(
-                {
-                    "success": True,
-                    "text": text,
-                    "language": language,
-                    "emotion_analysis": emotion_result,
-                }
-            )
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+        return process_audio_file(audio, language, segment_sentiment)
     except Exception as e:
         return error_response(f"处理音频数据时出错: {str(e)}")
 
 
-def handle_upload_request(upload_folder):
-    """处理音频上传请求"""
+def _remove_upload(file_path):
+    """删除上传音频的临时文件"""
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as e:
+        logger.error(f"清理临时文件时出错: {str(e)}")
+
+
+def process_audio_upload(file_path, language="zh-CN", segment_sentiment=None):
+    """处理保存为临时文件的上传音频，返回识别结果及情感分析，结束后删除该文件
+
+    长音频由 transcribe_speech 从文件流式解码，短音频一次解码到内存
+    """
+    try:
+        return process_audio_file(file_path, language, segment_sentiment)
+    finally:
+        _remove_upload(file_path)
+
+
+def handle_upload_request(upload_folder, submit_task=None):
+    """处理音频上传请求
+
+    submit_task 不为None且请求参数 async=true 时，音频交给后台任务处理并立即返回任务ID
+    """
     try:
         # 检查是否有文件
         if "file" not in request.files:
@@ -181,10 +226,10 @@ def handle_upload_request(upload_folder):
 
         # 获取语言参数
         language = request.form.get("language", "zh-CN")
+        segment_sentiment = parse_bool_option(request.form.get("segment_sentiment"))
 
-        # 生成安全的文件名并保存文件
+        # 生成安全的文件名（用于日志和临时文件的扩展名）
         filename = safe_filename(file.filename)
-        file_path = os.path.join(upload_folder, filename)
 
         # 记录文件信息
         from modules.utils import get_file_hash
@@ -192,24 +237,33 @@ def handle_upload_request(upload_folder):
         file_hash = get_file_hash(file)
         logger.info(f"处理上传文件: {filename}, 哈希值: {file_hash}")
 
-        # 保存文件
-        file.save(file_path)
-
-        try:
-            # 处理音频文件
-            return process_audio_file(file_path, language)
-        finally:
-            # 清理文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        # 上传内容分块写入临时文件，长音频之后从文件流式解码，不整体读入内存
+        suffix = os.path.splitext(filename)[1]
+        with tempfile.NamedTemporaryFile(dir=upload_folder, suffix=suffix, delete=False) as temp_file:
+            file.save(temp_file)
+            file_path = temp_file.name
+
+        args = (file_path, language, segment_sentiment)
+        if submit_task is not None and parse_bool_option(request.values.get("async")):
+            response = submit_task(process_audio_upload, *args)
+            if isinstance(response, tuple):
+                # 任务未被接受（队列已满），临时文件不会再被处理
+                _remove_upload(file_path)
+            return response
+
+        # 处理音频
+        return process_audio_upload(*args)
     except Exception as e:
         logger.error(f"处理音频上传时发生错误: {str(e)}")
         # 对外部返回通用错误信息
         return error_response("处理文件时发生错误")
 
 
-def handle_record_request():
-    """处理录音数据请求"""
+def handle_record_request(submit_task=None):
+    """处理录音数据请求
+
+    submit_task 不为None且请求中 async 为true时，音频交给后台任务处理并立即返回任务ID
+    """
     # 检查请求数据
     if not request.is_json:
         return error_response("请求必须包含JSON数据")
@@ -223,6 +277,11 @@ def handle_record_request():
     # 获取参数
     audio_data = data["audio"]
     language = data.get("language", "zh-CN")
+    segment_sentiment = parse_bool_option(data.get("segment_sentiment"))
+
+    args = (audio_data, language, segment_sentiment)
+    if submit_task is not None and parse_bool_option(data.get("async")):
+        return submit_task(process_audio_base64, *args)
 
     # 处理Base64编码的音频数据
-    return process_audio_base64(audio_data, language)
+    return process_audio_base64(*args)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实时语音识别模块
+录音过程中分块接收音频，在后台对未提交的音频做滚动窗口解码，
+推送阶段性识别文本和临时情感结果；停止录音时只需处理最后一个窗口
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flask import request, jsonify
+
+from modules.models import get_whisper_model
+from modules.utils import error_response
+from modules.audio_decoding import SAMPLE_RATE, StreamDecoder
+from modules.transcription import transcribe_array, find_silence_cut
+from modules.speech_recognition import SPEECH_VAD_ENABLED
+from modules.text_analysis import analyze_emotion
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+STREAM_MAX_SESSIONS = int(os.environ.get("STREAM_MAX_SESSIONS", 8))
+STREAM_SESSION_TTL = int(os.environ.get("STREAM_SESSION_TTL", 300))  # 无新数据的会话过期时间（秒）
+STREAM_DECODE_INTERVAL = float(os.environ.get("STREAM_DECODE_INTERVAL", 2.0))
+STREAM_WINDOW_SECONDS = float(os.environ.get("STREAM_WINDOW_SECONDS", 20))
+STREAM_MAX_MB = int(os.environ.get("STREAM_MAX_MB", 32))
+STREAM_DECODE_WORKERS = int(os.environ.get("STREAM_DECODE_WORKERS", 1))
+
+# 音频格式：pcm16 为16kHz单声道16位小端PCM，container 为浏览器MediaRecorder产生的webm/ogg等分块
+STREAM_FORMATS = ("pcm16", "container")
+
+# 未提交音频短于该长度时不做阶段性解码
+MIN_PARTIAL_SECONDS = 0.5
+
+_executor = ThreadPoolExecutor(
+    max_workers=STREAM_DECODE_WORKERS, thread_name_prefix="stream-decode"
+)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_reaper_started = False
+
+
+class StreamingSession:
+    """一次实时录音的识别会话"""
+
+    def __init__(self, language="zh-CN", audio_format="pcm16"):
+        self.session_id = str(uuid.uuid4())
+        self.language = language
+        self.audio_format = audio_format
+        self.lock = threading.Lock()
+
+        # 已解码但尚未提交的音频块：pcm16 直接转换，container 由常驻的ffmpeg进程增量解码
+        self.chunks = []
+        self.pcm_remainder = b""
+        self.decoder = None
+        self.received_bytes = 0
+        self.received_samples = 0
+
+        # 已提交（不再重新解码）的部分
+        self.committed_samples = 0
+        self.committed_text = []
+        self.committed_segments = []
+
+        self.partial_text = ""
+        self.emotion = None
+        self.version = 0
+        self.pending = None
+        self.last_decode_time = 0.0
+        self.last_active = time.time()
+        self.closed = False
+
+    def append(self, data):
+        """追加一块音频数据，只转换或解码新到达的部分"""
+        with self.lock:
+            self.received_bytes += len(data)
+            self.last_active = time.time()
+            if self.audio_format == "pcm16":
+                data = self.pcm_remainder + data
+                usable = len(data) - len(data) % 2
+                self.pcm_remainder = data[usable:]
+                self._add_samples(np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0)
+                return
+            if self.decoder is None:
+                self.decoder = StreamDecoder(self._on_decoded)
+            decoder = self.decoder
+        # 写入可能等待ffmpeg读取，不持有会话锁
+        decoder.write(data)
+
+    def _on_decoded(self, samples):
+        with self.lock:
+            self._add_samples(samples)
+
+    def _add_samples(self, samples):
+        """追加已解码的音频块（调用方需持有锁）"""
+        if len(samples):
+            self.chunks.append(samples)
+            self.received_samples += len(samples)
+
+    def _snapshot_audio(self):
+        """获取尚未提交的音频（从 committed_samples 开始）"""
+        with self.lock:
+            if len(self.chunks) > 1:
+                self.chunks = [np.concatenate(self.chunks)]
+            return self.chunks[0] if self.chunks else np.zeros(0, dtype=np.float32)
+
+    def _discard(self, count):
+        """丢弃已提交的音频，之后只保留未提交的部分"""
+        with self.lock:
+            audio = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.float32)
+            self.chunks = [audio[count:]]
+
+    def release(self):
+        """结束会话时终止解码进程"""
+        with self.lock:
+            decoder, self.decoder = self.decoder, None
+        if decoder is not None:
+            decoder.kill()
+
+    def _transcribe(self, whisper_model, audio, offset_samples):
+        return transcribe_array(
+            whisper_model, audio, self.language, SPEECH_VAD_ENABLED, offset_samples / SAMPLE_RATE
+        )
+
+    def _join(self, texts):
+        separator = "" if self.language and self.language.startswith("zh") else " "
+        return separator.join(text for text in texts if text)
+
+    def decode(self, final=False):
+        """滚动窗口解码：未提交的音频超过窗口长度时在静音处提交，其余部分作为阶段性结果
+
+        只保留未提交的音频，每次只解码不超过一个窗口的音频，耗时与录音总长度无关
+        """
+        whisper_model = get_whisper_model()
+        if whisper_model is None:
+            raise RuntimeError("语音识别模型初始化失败，请稍后再试")
+
+        if final and self.decoder is not None:
+            # 关闭解码器输入，等待最后一个分块解码完成
+            self.decoder.finish()
+
+        window_length = int(SAMPLE_RATE * STREAM_WINDOW_SECONDS)
+        tail = self._snapshot_audio()
+        committed = 0
+        while len(tail) > window_length or (final and len(tail)):
+            if len(tail) > window_length:
+                cut = find_silence_cut(tail[:window_length], SAMPLE_RATE)
+            else:
+                cut = len(tail)
+            result = self._transcribe(whisper_model, tail[:cut], self.committed_samples)
+            self.committed_text.append(result["text"])
+            self.committed_segments.extend(result["segments"])
+            self.committed_samples += cut
+            committed += cut
+            tail = tail[cut:]
+        if committed:
+            self._discard(committed)
+
+        texts = list(self.committed_text)
+        if not final and len(tail) >= SAMPLE_RATE * MIN_PARTIAL_SECONDS:
+            texts.append(self._transcribe(whisper_model, tail, self.committed_samples)["text"])
+
+        text = self._join(texts)
+        emotion = None
+        if text and not final:
+            # 阶段性情感结果优先使用关键词规则，只在规则无法判定时调用模型
+            emotion, _ = analyze_emotion(text, rules_first=True)
+
+        with self.lock:
+            self.partial_text = text
+            self.emotion = emotion
+            self.version += 1
+
+    def maybe_schedule(self):
+        """距上次解码超过间隔且没有进行中的解码时，提交一次后台解码"""
+        with self.lock:
+            now = time.time()
+            if self.closed:
+                return
+            if self.pending is not None and not self.pending.done():
+                return
+            if now - self.last_decode_time < STREAM_DECODE_INTERVAL:
+                return
+            self.last_decode_time = now
+            self.pending = _executor.submit(self._safe_decode)
+
+    def _safe_decode(self):
+        try:
+            self.decode()
+        except Exception as e:
+            logger.error(f"实时语音解码出错: {str(e)}")
+
+    def close(self):
+        """停止接收后台解码，并等待进行中的解码完成"""
+        with self.lock:
+            self.closed = True
+            pending = self.pending
+        if pending is not None:
+            pending.result()
+
+    def state(self):
+        """返回当前的阶段性结果"""
+        with self.lock:
+            return {
+                "success": True,
+                "session_id": self.session_id,
+                "final": False,
+                "text": self.partial_text,
+                "emotion_analysis": self.emotion,
+                "committed_seconds": self.committed_samples / SAMPLE_RATE,
+                "received_seconds": self.received_samples / SAMPLE_RATE,
+                "version": self.version,
+            }
+
+
+def _cleanup_expired_sessions():
+    """清理长时间没有新数据的会话"""
+    now = time.time()
+    with _sessions_lock:
+        expired = [
+            session_id
+            for session_id, session in _sessions.items()
+            if now - session.last_active > STREAM_SESSION_TTL
+        ]
+        expired = [_sessions.pop(session_id) for session_id in expired]
+    for session in expired:
+        session.release()
+    if expired:
+        logger.info(f"已清理 {len(expired)} 个过期的实时识别会话")
+
+
+def _reap_expired_sessions():
+    """后台定期清理过期会话，空闲节点上被放弃的录音也会释放其解码进程和缓冲区"""
+    while True:
+        time.sleep(max(1, min(STREAM_SESSION_TTL, 60)))
+        try:
+            _cleanup_expired_sessions()
+        except Exception as e:
+            logger.error(f"清理实时识别会话时出错: {str(e)}")
+
+
+def _start_reaper():
+    """首次创建会话时启动清理线程"""
+    global _reaper_started
+    with _sessions_lock:
+        if _reaper_started:
+            return
+        _reaper_started = True
+    threading.Thread(target=_reap_expired_sessions, name="stream-reaper", daemon=True).start()
+
+
+def _get_session(session_id):
+    with _sessions_lock:
+        return _sessions.get(session_id)
+
+
+def get_streaming_stats():
+    """获取实时识别会话统计"""
+    with _sessions_lock:
+        return {"active_sessions": len(_sessions), "max_sessions": STREAM_MAX_SESSIONS}
+
+
+def handle_stream_start_request():
+    """创建实时识别会话"""
+    data = request.get_json(silent=True) or {}
+    language = data.get("language", "zh-CN")
+    audio_format = data.get("format", "pcm16")
+    if audio_format not in STREAM_FORMATS:
+        return error_response(f"不支持的音频格式: {audio_format}")
+
+    _start_reaper()
+    _cleanup_expired_sessions()
+    with _sessions_lock:
+        if len(_sessions) >= STREAM_MAX_SESSIONS:
+            return error_response("实时识别会话数已达上限，请稍后再试", 429)
+        session = StreamingSession(language, audio_format)
+        _sessions[session.session_id] = session
+
+    logger.info(f"创建实时识别会话: {session.session_id} ({audio_format})")
+    return jsonify(
+        {
+            "success": True,
+            "session_id": session.session_id,
+            "sample_rate": SAMPLE_RATE,
+            "decode_interval": STREAM_DECODE_INTERVAL,
+        }
+    )
+
+
+def handle_stream_chunk_request(session_id):
+    """接收一块音频数据，返回最新的阶段性结果"""
+    _cleanup_expired_sessions()
+    session = _get_session(session_id)
+    if session is None:
+        return error_response("实时识别会话不存在或已过期", 404)
+
+    data = request.get_data()
+    if session.received_bytes + len(data) > STREAM_MAX_MB * 1024 * 1024:
+        return error_response("录音过长，请停止录音", 413)
+
+    if data:
+        session.append(data)
+        session.maybe_schedule()
+    return jsonify(session.state())
+
+
+def handle_stream_state_request(session_id):
+    """查询会话的阶段性结果"""
+    _cleanup_expired_sessions()
+    session = _get_session(session_id)
+    if session is None:
+        return error_response("实时识别会话不存在或已过期", 404)
+    return jsonify(session.state())
+
+
+def handle_stream_finish_request(session_id):
+    """结束录音：解码剩余音频，返回最终识别结果和完整情感分析"""
+    with _sessions_lock:
+        session = _sessions.pop(session_id, None)
+    if session is None:
+        return error_response("实时识别会话不存在或已过期", 404)
+
+    try:
+        session.close()
+        session.decode(final=True)
+    except Exception as e:
+        return error_response(f"语音识别出错: {str(e)}")
+    finally:
+        session.release()
+
+    text = session.partial_text
+    if not text:
+        return error_response("未检测到语音")
+
+    emotion_result, emotion_error = analyze_emotion(text)
+    response = {
+        "success": True,
+        "final": True,
+        "session_id": session_id,
+        "text": text,
+        "language": session.language,
+        "segments": session.committed_segments,
+        "emotion_analysis": emotion_result,
+    }
+    if emotion_error:
+        logger.warning(f"情感分析出错: {emotion_error}")
+        response["emotion_error"] = emotion_error
+    return jsonify(response)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+有界任务执行器模块
+固定数量的工作线程加上有限长度的等待队列，队列已满时立即拒绝新任务，
+避免耗时任务占满Web服务的请求线程
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BoundedExecutor:
+    """带有界队列的线程池，try_submit 在队列已满时返回None而不是阻塞"""
+
+    def __init__(self, max_workers=2, max_queue=8, name="task"):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # 运行中和等待中的任务共用同一组名额
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._submitted = 0
+        self._rejected = 0
+
+    def try_submit(self, fn, *args, **kwargs):
+        """提交任务，返回Future；运行和等待中的任务已达上限时返回None"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            return None
+
+        with self._lock:
+            self._in_flight += 1
+            self._submitted += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def get_stats(self):
+        """获取执行器统计信息"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.max_workers),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+异步任务状态存储模块
+保存异步任务的状态和结果，限制条目数并让已结束的任务过期：
+- memory: 进程内存储（默认）
+- sqlite: SQLite文件存储，多个gunicorn工作进程共享任务状态，服务重启后仍可查询
+未结束（queued / processing）的任务不会被淘汰；SQLite存储中超过 TASK_STORE_UNFINISHED_TTL
+没有状态更新的未结束任务（执行它的进程会定期刷新，进程退出后不再刷新）标记为失败，之后按已结束的任务过期。
+共享存储还转交取消请求：由不执行该任务的进程记录，执行该任务的进程轮询后取消
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+TASK_STORE = os.environ.get("TASK_STORE", "memory").lower()  # memory / sqlite
+TASK_STORE_PATH = os.environ.get("TASK_STORE_PATH", "tasks.sqlite3")
+TASK_STORE_MAX_ENTRIES = int(os.environ.get("TASK_STORE_MAX_ENTRIES", 1000))
+TASK_STORE_TTL = int(os.environ.get("TASK_STORE_TTL", 3600))  # 已结束任务的保留时间（秒）
+# 未结束任务自最后一次状态更新（或执行进程的定期刷新）起的最长时间（秒）
+TASK_STORE_UNFINISHED_TTL = int(os.environ.get("TASK_STORE_UNFINISHED_TTL", 7200))
+
+TASK_STORES = ("memory", "sqlite")
+
+# 已结束的任务状态，只有这些任务会被淘汰
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# 超时未结束的任务的错误信息
+STALE_TASK_ERROR = "任务长时间未完成，执行它的进程可能已退出"
+
+
+def _task_info(status, result=None, error=None):
+    return {"status": status, "result": result, "error": error}
+
+
+class MemoryTaskStore:
+    """进程内的任务存储：已结束的任务超过TTL后删除，超出条目上限时淘汰最久未访问的已结束任务"""
+
+    shared = False  # 是否在多个进程间共享
+
+    def __init__(self, max_entries=TASK_STORE_MAX_ENTRIES, ttl=TASK_STORE_TTL):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl or None
+        self._data = OrderedDict()  # task_id -> (任务信息, 结束时间)
+        self._lock = threading.Lock()
+        self._evictions = 0
+        self._expirations = 0
+
+    def set(self, task_id, status, result=None, error=None, kind=None):
+        """写入任务状态（进程内存储不需要记录任务类型）"""
+        finished_at = time.monotonic() if status in FINISHED_STATUSES else None
+        with self._lock:
+            self._data[task_id] = (_task_info(status, result, error), finished_at)
+            self._data.move_to_end(task_id)
+            self._evict()
+
+    def get(self, task_id):
+        """读取任务状态，不存在或已过期时返回None"""
+        with self._lock:
+            entry = self._data.get(task_id)
+            if entry is None:
+                return None
+            info, finished_at = entry
+            if self._expired(finished_at, time.monotonic()):
+                del self._data[task_id]
+                self._expirations += 1
+                return None
+            self._data.move_to_end(task_id)
+            return dict(info)
+
+    def delete(self, task_id):
+        with self._lock:
+            self._data.pop(task_id, None)
+
+    def request_cancel(self, task_id, kind):
+        """进程内存储只对本进程可见，没有需要转交的取消请求"""
+        return False
+
+    def get_cancel_requests(self, task_ids):
+        return []
+
+    def touch(self, task_ids):
+        pass
+
+    def _expired(self, finished_at, now):
+        return finished_at is not None and self.ttl is not None and now - finished_at >= self.ttl
+
+    def _evict(self):
+        """删除过期任务，超出上限时按最久未访问的顺序淘汰已结束的任务（调用方需持有锁）"""
+        now = time.monotonic()
+        for task_id in [
+            task_id for task_id, (_, finished_at) in self._data.items()
+            if self._expired(finished_at, now)
+        ]:
+            del self._data[task_id]
+            self._expirations += 1
+
+        if len(self._data) <= self.max_entries:
+            return
+        for task_id in [
+            task_id for task_id, (_, finished_at) in self._data.items() if finished_at is not None
+        ]:
+            if len(self._data) <= self.max_entries:
+                break
+            del self._data[task_id]
+            self._evictions += 1
+
+    def get_stats(self):
+        """获取任务存储统计信息"""
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+class SQLiteTaskStore:
+    """SQLite任务存储：多个进程共享同一个数据库文件，淘汰规则与内存存储相同"""
+
+    shared = True
+
+    def __init__(
+        self,
+        path=TASK_STORE_PATH,
+        max_entries=TASK_STORE_MAX_ENTRIES,
+        ttl=TASK_STORE_TTL,
+        unfinished_ttl=TASK_STORE_UNFINISHED_TTL,
+    ):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl or None
+        self.unfinished_ttl = unfinished_ttl or None
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "task_id TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, error TEXT, "
+                "finished_at REAL, accessed_at REAL NOT NULL, updated_at REAL, kind TEXT)"
+            )
+            # 旧版本创建的数据库没有状态更新时间和任务类型
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+            if "updated_at" not in columns:
+                conn.execute("ALTER TABLE tasks ADD COLUMN updated_at REAL")
+                conn.execute("UPDATE tasks SET updated_at = accessed_at")
+            if "kind" not in columns:
+                conn.execute("ALTER TABLE tasks ADD COLUMN kind TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks (finished_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cancel_requests ("
+                "task_id TEXT PRIMARY KEY, requested_at REAL NOT NULL)"
+            )
+            # 启动时处理上次运行遗留的、已超时的未结束任务
+            stale = self._fail_stale(conn, time.time())
+        if stale:
+            logger.warning(f"已将 {stale} 个超时未结束的任务标记为失败")
+
+    def _connect(self):
+        """每个线程使用自己的连接（WAL模式允许读写并发）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def set(self, task_id, status, result=None, error=None, kind=None):
+        """写入任务状态，kind 为任务类型（如 audio / video），只需在创建任务时给出"""
+        now = time.time()
+        finished_at = now if status in FINISHED_STATUSES else None
+        result = json.dumps(result, ensure_ascii=False) if result is not None else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO tasks "
+                "(task_id, status, result, error, finished_at, accessed_at, updated_at, kind) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (task_id) DO UPDATE SET status = excluded.status, "
+                "result = excluded.result, error = excluded.error, "
+                "finished_at = excluded.finished_at, accessed_at = excluded.accessed_at, "
+                "updated_at = excluded.updated_at, kind = COALESCE(excluded.kind, tasks.kind)",
+                (task_id, status, result, error, finished_at, now, now, kind),
+            )
+            if finished_at is not None:
+                conn.execute("DELETE FROM cancel_requests WHERE task_id = ?", (task_id,))
+            self._evict(conn, now)
+
+    def get(self, task_id):
+        """读取任务状态，不存在或已过期时返回None"""
+        now = time.time()
+        with self._connect() as conn:
+            self._fail_stale(conn, now, task_id)
+            row = conn.execute(
+                "SELECT status, result, error, finished_at FROM tasks WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            status, result, error, finished_at = row
+            if finished_at is not None and self.ttl is not None and now - finished_at >= self.ttl:
+                conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+                return None
+            conn.execute("UPDATE tasks SET accessed_at = ? WHERE task_id = ?", (now, task_id))
+        return _task_info(status, json.loads(result) if result is not None else None, error)
+
+    def delete(self, task_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM cancel_requests WHERE task_id = ?", (task_id,))
+
+    def request_cancel(self, task_id, kind):
+        """记录取消请求，由执行该任务的进程轮询处理
+
+        只转交类型为 kind 的任务（只有这类任务的执行进程会处理取消请求），
+        任务不存在、已结束或类型不符时返回False
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM tasks WHERE task_id = ? AND finished_at IS NULL AND kind = ?",
+                (task_id, kind),
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO cancel_requests VALUES (?, ?)", (task_id, time.time())
+            )
+        return True
+
+    def get_cancel_requests(self, task_ids):
+        """返回 task_ids 中已被请求取消的任务"""
+        task_ids = list(task_ids)
+        if not task_ids:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT task_id FROM cancel_requests WHERE task_id IN "
+                f"({', '.join('?' * len(task_ids))})",
+                task_ids,
+            ).fetchall()
+        return [task_id for (task_id,) in rows]
+
+    def touch(self, task_ids):
+        """刷新执行中任务的状态更新时间，避免仍在排队或运行的任务被判定为超时"""
+        task_ids = list(task_ids)
+        if not task_ids:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET updated_at = ? WHERE finished_at IS NULL AND task_id IN "
+                f"({', '.join('?' * len(task_ids))})",
+                [time.time()] + task_ids,
+            )
+
+    def _fail_stale(self, conn, now, task_id=None):
+        """把超过 unfinished_ttl 仍未结束的任务标记为失败，返回标记的任务数"""
+        if self.unfinished_ttl is None:
+            return 0
+        query = (
+            "UPDATE tasks SET status = 'failed', error = ?, finished_at = ?, updated_at = ? "
+            "WHERE finished_at IS NULL AND updated_at <= ?"
+        )
+        params = [STALE_TASK_ERROR, now, now, now - self.unfinished_ttl]
+        if task_id is not None:
+            query += " AND task_id = ?"
+            params.append(task_id)
+        return conn.execute(query, params).rowcount
+
+    def _evict(self, conn, now):
+        """删除过期任务，超出上限时按最久未访问的顺序淘汰已结束的任务"""
+        self._fail_stale(conn, now)
+        if self.ttl is not None:
+            conn.execute("DELETE FROM tasks WHERE finished_at <= ?", (now - self.ttl,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM tasks WHERE task_id IN (SELECT task_id FROM tasks "
+                "WHERE finished_at IS NOT NULL ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        conn.execute(
+            "DELETE FROM cancel_requests WHERE task_id NOT IN (SELECT task_id FROM tasks)"
+        )
+
+    def get_stats(self):
+        """获取任务存储统计信息"""
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": count,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "unfinished_ttl": self.unfinished_ttl,
+        }
+
+
+def create_task_store(backend=TASK_STORE):
+    """按配置创建任务存储"""
+    if backend not in TASK_STORES:
+        logger.warning(f"未知的任务存储: {backend}，使用memory")
+        backend = "memory"
+    if backend == "sqlite":
+        logger.info(f"使用SQLite任务存储: {TASK_STORE_PATH}")
+        return SQLiteTaskStore()
+    return MemoryTaskStore()
@@ -6,154 +6,411 @@
 负责处理文本的情感分析功能
 """
 
+import os
+import re
 import torch
 import logging
 import time
+import numpy as np
 from flask import jsonify
 
 # 导入自定义模块
-from modules.models import model, tokenizer, model_loaded, device
-from modules.utils import error_response
+from modules.models import (
+    get_text_model,
+    get_cascade_model,
+    get_text_backend,
+    register_reload_callback,
+    text_device,
+    MODEL_NAME,
+    TEXT_CASCADE_ENABLED,
+)
+from modules.monitoring import record_model_tier
+from modules.utils import error_response, normalize_text
+from modules.batching import MicroBatcher
+from modules.cache import LRUCache
+from modules.text_chunking import split_text_chunks
+from modules.lexicon import build_matchers
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 从环境变量获取配置
+TEXT_BATCH_ENABLED = os.environ.get("TEXT_BATCH_ENABLED", "true").lower() == "true"
+TEXT_BATCH_MAX_SIZE = int(os.environ.get("TEXT_BATCH_MAX_SIZE", 16))
+TEXT_BATCH_MAX_WAIT_MS = float(os.environ.get("TEXT_BATCH_MAX_WAIT_MS", 5))
+ANALYZE_BATCH_MAX_TEXTS = int(os.environ.get("ANALYZE_BATCH_MAX_TEXTS", 1000))
+ANALYZE_BATCH_SIZE = int(os.environ.get("ANALYZE_BATCH_SIZE", 32))
+TEXT_RULES_FIRST = os.environ.get("TEXT_RULES_FIRST", "false").lower() == "true"
+TEXT_CACHE_ENABLED = os.environ.get("TEXT_CACHE_ENABLED", "true").lower() == "true"
+TEXT_CACHE_MAX_ENTRIES = int(os.environ.get("TEXT_CACHE_MAX_ENTRIES", 10000))
+TEXT_CACHE_TTL = int(os.environ.get("TEXT_CACHE_TTL", 3600))  # 默认1小时
+TEXT_CACHE_MAX_MB = float(os.environ.get("TEXT_CACHE_MAX_MB", 64))
+TEXT_LONG_AUTO = os.environ.get("TEXT_LONG_AUTO", "false").lower() == "true"
+LONG_TEXT_CHUNK_TOKENS = int(os.environ.get("LONG_TEXT_CHUNK_TOKENS", 256))
+MODEL_MAX_TOKENS = 512
+TEXT_CASCADE_THRESHOLD = float(os.environ.get("TEXT_CASCADE_THRESHOLD", 0.85))
 
-def analyze_emotion(text):
-    """分析文本情感"""
-    # 初始化文本情感分析模型（如果尚未初始化）
-    global model, tokenizer
+# 启动时编译一次情感关键词匹配器
+keyword_matchers = build_matchers()
+
+
+def predict_sentiment_scores(texts):
+    """对一批文本执行一次前向推理，返回每条文本的5类情感概率"""
+    model, tokenizer = get_text_model()
+    if model is None or tokenizer is None:
+        raise RuntimeError("文本情感分析模型不可用")
+
+    # 批量分词，按批次内最长文本补齐
+    inputs = tokenizer(
+        list(texts), return_tensors="pt", padding=True, truncation=True, max_length=512
+    ).to(text_device)
+
+    with torch.no_grad():
+        outputs = model(**inputs)
+
+    probabilities = torch.softmax(outputs.logits, dim=1)
+    return list(probabilities.cpu().numpy())
+
+
+# 文本推理的微批处理调度器，合并并发的 /api/analyze 请求
+text_batcher = MicroBatcher(
+    predict_sentiment_scores,
+    max_batch_size=TEXT_BATCH_MAX_SIZE,
+    max_wait_ms=TEXT_BATCH_MAX_WAIT_MS,
+    name="text-sentiment",
+)
+
+
+def _score_entry_size(key, value):
+    """估算缓存条目大小：规范化文本 + 概率数组 + 容器开销"""
+    return len(key[-1].encode("utf-8")) + value.nbytes + 256
+
+
+# 模型概率缓存，键为 (模型名称, 规范化文本)；文本模型重新加载时自动清空
+text_score_cache = LRUCache(
+    max_entries=TEXT_CACHE_MAX_ENTRIES,
+    ttl=TEXT_CACHE_TTL,
+    max_bytes=int(TEXT_CACHE_MAX_MB * 1024 * 1024),
+    size_fn=_score_entry_size,
+    name="text-sentiment",
+)
+register_reload_callback("text", text_score_cache.clear)
+
+
+def _score_cache_key(text):
+    """生成文本概率缓存的键（不同推理后端的概率略有差异，按实际加载的后端分别缓存）"""
+    return (MODEL_NAME, get_text_backend(), normalize_text(text))
+
+
+def get_text_cache_stats():
+    """获取文本情感分析缓存统计"""
+    stats = text_score_cache.get_stats()
+    stats["enabled"] = TEXT_CACHE_ENABLED
+    return stats
+
+
+def _label_to_class(label):
+    """将轻量模型的标签名映射到5级情感类别下标
+
+    三分类标签只对应 消极 / 中性 / 积极 三个类别，轻量模型不会给出两端的极端类别
+    """
+    label = str(label).lower()
+    star = re.match(r"(\d)\s*star", label)
+    if star:
+        return min(4, max(0, int(star.group(1)) - 1))
+    if "neg" in label:
+        return 1
+    if "pos" in label:
+        return 3
+    return 2
+
+
+def predict_light_scores(texts):
+    """使用级联第一级的轻量模型评分，返回 [(5级情感概率, 置信度), ...]"""
+    light_model, light_tokenizer = get_cascade_model()
+    if light_model is None or light_tokenizer is None:
+        raise RuntimeError("轻量文本情感分类模型不可用")
+
+    inputs = light_tokenizer(
+        list(texts), return_tensors="pt", padding=True, truncation=True, max_length=512
+    ).to(text_device)
+
+    with torch.no_grad():
+        outputs = light_model(**inputs)
+
+    probabilities = torch.softmax(outputs.logits, dim=1).cpu().numpy()
+
+    # 轻量模型的标签（如 正面/中性/负面）汇总到对应的5级类别
+    id2label = light_model.config.id2label
+    mapping = np.zeros((probabilities.shape[1], 5))
+    for index in range(probabilities.shape[1]):
+        mapping[index, _label_to_class(id2label.get(index, index))] = 1.0
+
+    return [(row @ mapping, float(row.max())) for row in probabilities]
+
+
+# 轻量模型同样通过微批处理合并并发请求
+light_batcher = MicroBatcher(
+    predict_light_scores,
+    max_batch_size=TEXT_BATCH_MAX_SIZE,
+    max_wait_ms=TEXT_BATCH_MAX_WAIT_MS,
+    name="text-sentiment-light",
+)
+
+
+def _score_with_light_model(texts):
+    """级联第一级：返回轻量模型置信度达到阈值的文本概率 {文本: 概率}"""
+    try:
+        if TEXT_BATCH_ENABLED and len(texts) == 1:
+            light_results = [light_batcher.run(texts[0])]
+        else:
+            light_results = predict_light_scores(texts)
+    except Exception as e:
+        logger.warning(f"轻量模型评分失败，直接使用完整模型: {str(e)}")
+        return {}
+
+    return {
+        text: scores
+        for text, (scores, confidence) in zip(texts, light_results)
+        if confidence >= TEXT_CASCADE_THRESHOLD
+    }
+
+
+def get_text_batching_stats():
+    """获取文本推理批处理统计"""
+    stats = text_batcher.get_stats()
+    stats["enabled"] = TEXT_BATCH_ENABLED
+    return stats
+
+
+def _rule_based_scores(predicted_class):
+    """规则判定时（未运行模型）根据预测类别生成确定性的概率分布"""
+    # 预测类别占主要概率，其余概率随与预测类别的距离递减
+    weights = np.array(
+        [0.6 if i == predicted_class else 0.1 / (1 + abs(i - predicted_class)) for i in range(5)]
+    )
+    return weights / weights.sum()
+
+
+def _apply_keyword_rules(text, scores=None):
+    """结合情感关键词规则与模型概率，生成文本情感分析结果（不含处理耗时）
+
+    scores 为 None 表示尚未运行模型：规则能判定时返回基于规则的结果，
+    规则无法判定时返回 None，由调用方运行模型后再次调用。
+    """
+    # 一次线性扫描统计三类情感关键词的命中次数（词典见 data/emotion_lexicon.json）
+    counts = keyword_matchers["analysis"].count(text)
+    angry_count = counts["angry"]
+    negative_count = counts["sad"]
+    positive_count = counts["positive"]
+
+    # 根据关键词出现情况调整预测结果
+    
+    # 特别处理愤怒情绪
+    if angry_count >= 2:  # 如果检测到多个愤怒关键词
+        emotion_type = "愤怒"
+        predicted_class = 0  # 非常消极
+    elif angry_count == 1 and negative_count <= 1 and positive_count <= 1:  # 只有一个愤怒关键词且没有其他明显情绪
+        emotion_type = "愤怒"
+        predicted_class = 0  # 非常消极
+    elif negative_count > positive_count:
+        # 更倾向于消极情感
+        emotion_type = "悲伤"
+        predicted_class = min(
+            2, negative_count - positive_count
+        )  # 0或1，取决于差值
+    elif positive_count > negative_count:
+        # 更倾向于积极情感
+        emotion_type = "快乐"
+        predicted_class = min(
+            4, 2 + positive_count - negative_count
+        )  # 3或4，取决于差值
+    else:
+        # 如果没有明显情感倾向，使用模型预测结果
+        if scores is None:
+            return None
+        predicted_class = int(np.argmax(scores))
+        emotion_type = "中性"
+
+        # 为了避免总是返回相同结果，如果文本长度很短且没有明显情感词，默认为中性
+        if len(text) < 10 and predicted_class > 2:
+            predicted_class = 2  # 中性
+
+    # 映射情感标签
+    sentiment_labels = ["非常消极", "消极", "中性", "积极", "非常积极"]
+    
+    # 记录检测到的关键词数量
+    logger.info(f"情感关键词统计: 愤怒={angry_count}, 悲伤={negative_count}, 积极={positive_count}")
+    sentiment = sentiment_labels[predicted_class]
+
+    # 规则已判定且未运行模型时，分数由规则给出
+    score_source = "model"
+    if scores is None:
+        scores = _rule_based_scores(predicted_class)
+        score_source = "rules"
+    
+    # 构建结果
+    result = {
+        "text": text,
+        "sentiment": sentiment,
+        "emotion_type": emotion_type,  # 添加情绪类型信息
+        "sentiment_class": predicted_class,
+        "scores": {
+            "very_negative": float(scores[0]),
+            "negative": float(scores[1]),
+            "neutral": float(scores[2]),
+            "positive": float(scores[3]),
+            "very_positive": float(scores[4])
+        },
+        "score_source": score_source,
+        "angry_keywords": angry_count,  # 添加关键词统计
+        "sad_keywords": negative_count,
+        "positive_keywords": positive_count
+    }
+    
+    return result
+
+
+def _token_lengths(tokenizer, texts):
+    """一次分词调用计算每条文本的词元数（不含特殊词元）"""
+    encoded = tokenizer(list(texts), add_special_tokens=False)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def _analyze_long_emotion(text, tokenizer):
+    """长文本情感分析：按句子切分窗口，批量推理后按长度加权汇总
+
+    没有切分出窗口（如只含标点或空白的文本）时返回 None，由调用方整体分析
+    """
+    chunks = split_text_chunks(
+        text, lambda texts: _token_lengths(tokenizer, texts), LONG_TEXT_CHUNK_TOKENS
+    )
+    if not chunks:
+        return None
+    chunk_texts = [text[start:end] for start, end, _ in chunks]
+    logger.info(f"长文本模式: 切分为 {len(chunks)} 个窗口")
+
+    # 所有窗口在同一次批量推理中完成（超大文本按批次上限分段）
+    chunk_scores = []
+    for i in range(0, len(chunk_texts), ANALYZE_BATCH_SIZE):
+        chunk_scores.extend(predict_sentiment_scores(chunk_texts[i : i + ANALYZE_BATCH_SIZE]))
+
+    # 按窗口词元数加权平均得到整体概率
+    weights = np.array([max(tokens, 1) for _, _, tokens in chunks], dtype=np.float64)
+    aggregate_scores = np.average(np.stack(chunk_scores), axis=0, weights=weights)
+
+    result = _apply_keyword_rules(text, aggregate_scores)
+    chunk_results = []
+    for (start, end, tokens), chunk_text, scores in zip(chunks, chunk_texts, chunk_scores):
+        chunk_result = _apply_keyword_rules(chunk_text, scores)
+        chunk_results.append({
+            "start": start,
+            "end": end,
+            "tokens": tokens,
+            "text": chunk_text,
+            "sentiment": chunk_result["sentiment"],
+            "emotion_type": chunk_result["emotion_type"],
+            "sentiment_class": chunk_result["sentiment_class"],
+            "scores": chunk_result["scores"],
+        })
+
+    result["long_text"] = {
+        "chunk_count": len(chunks),
+        "aggregation": "length_weighted",
+        "chunks": chunk_results,
+    }
+    return result
+
+
+def analyze_emotion(
+    text, rules_first=None, calibrated_scores=False, long_text=None, cascade=None
+):
+    """分析文本情感
+
+    rules_first 为 True 时先执行关键词规则，只有规则无法判定时才运行模型；
+    calibrated_scores 为 True 时始终运行模型以返回模型给出的概率；
+    long_text 为 True 时按句子切分窗口分别评分并汇总，为 None 时由 TEXT_LONG_AUTO
+    决定是否对超过模型长度上限的文本自动启用；
+    cascade 为 True 时先用轻量模型评分，置信度低于阈值才交给完整模型。
+    """
+    if rules_first is None:
+        rules_first = TEXT_RULES_FIRST
+    if cascade is None:
+        cascade = TEXT_CASCADE_ENABLED
+
+    # 规则优先模式：关键词能决定结果时跳过模型推理
+    if rules_first and not calibrated_scores:
+        start_time = time.time()
+        result = _apply_keyword_rules(text)
+        if result is not None:
+            result["processing_time"] = time.time() - start_time
+            logger.info(f"情感分析由关键词规则判定，结果: {result['sentiment']}，跳过模型推理")
+            return result, None
+
+    # 从共享模型注册表获取模型（如果尚未加载则按需加载一次）
+    model, tokenizer = get_text_model()
     if model is None or tokenizer is None:
-        try:
-            from transformers import AutoModelForSequenceClassification, AutoTokenizer
-            logger.info("尝试初始化文本情感分析模型...")
-            model_name = "nlptown/bert-base-multilingual-uncased-sentiment"
-            model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device)
-            tokenizer = AutoTokenizer.from_pretrained(model_name)
-            logger.info("文本情感分析模型初始化成功")
-        except Exception as e:
-            logger.error(f"初始化文本情感分析模型失败: {str(e)}")
-            return _get_mock_emotion_analysis(text), None
+        logger.error("文本情感分析模型不可用，返回模拟结果")
+        return _get_mock_emotion_analysis(text), None
 
     try:
         start_time = time.time()
         logger.info(f"开始分析文本情感: {text[:50]}...")
 
-        # 使用tokenizer处理文本
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512).to(device)
-        
-        # 使用模型进行预测
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        # 处理预测结果
-        logits = outputs.logits
-        probabilities = torch.softmax(logits, dim=1)
-        scores = probabilities[0].cpu().numpy()
-
-        # 修复：确保情感分析结果更加多样化
-        # 根据文本内容进行更精确的情感分析
-        # 检查文本中的情感关键词
-        
-        # 特别添加更多愤怒情绪的关键词
-        angry_keywords = [
-            "生气", "愤怒", "愤悅", "愤恨", "愤愤", "愤愤不平", 
-            "怒火", "怒火中烧", "怒不可遗", "怒发冠凸", 
-            "怒发冠缆", "怒发冲冠", "怒发填膺", "怒形于色", 
-            "怒目圆睛", "怒目圆眸", "怒目而视", "怒不可遗", 
-            "愤愤不平", "愤然作色", "愤不可遗", 
-            "愤不可遗", "愤不可抑", "愤不可抑", 
-            "讨厌", "厌恶", "厌恶", "厌恶", "厌恶", 
-            "烦恩", "烦躁", "烦躁不安", "烦躁不安", 
-            "烦躁不安", "烦躁不安", "烦躁不安", 
-            "太令人", "太让人", "完全不", "绝对不", "没法忍受", 
-            "心烈头痒", "心急如焼", "心烈头痒", 
-            "心急如焼", "心急如焼", "心急如焼"
-        ]
-        
-        # 原有的负面情绪关键词
-        sad_keywords = [
-            "不", "没", "难过", "伤心", "失望", "痛苦", 
-            "焦虑", "担心", "害怕", "悲伤", "悲伤", 
-            "悲伤", "悲伤", "悲伤", "悲伤", "悲伤", 
-            "悲伤", "悲伤", "悲伤", "悲伤", "悲伤"
-        ]
-        
-        # 原有的正面情绪关键词
-        positive_keywords = [
-            "喜欢", "开心", "高兴", "快乐", "满意", 
-            "感谢", "幸福", "棒", "好", "爱", 
-            "美好", "精彩", "幸运", "兴奋", "愉快", 
-            "愉快", "愉快", "愉快", "愉快", "愉快"
-        ]
+        # 长文本模式：避免超过512个词元的部分被直接截断
+        if long_text is None:
+            # 词元数不会超过字符数，较短的文本无需分词即可排除
+            long_text = (
+                TEXT_LONG_AUTO
+                and len(text) > MODEL_MAX_TOKENS - 2
+                and _token_lengths(tokenizer, [text])[0] > MODEL_MAX_TOKENS - 2
+            )
+        if long_text:
+            result = _analyze_long_emotion(text, tokenizer)
+            if result is not None:
+                processing_time = time.time() - start_time
+                logger.info(f"长文本情感分析完成，结果: {result['sentiment']}，耗时: {processing_time:.2f}秒")
+                result["processing_time"] = processing_time
+                return result, None
+            logger.info("长文本模式未切分出窗口，改为整体分析")
 
-        # 计算关键词出现次数
-        angry_count = sum(1 for word in angry_keywords if word in text)
-        negative_count = sum(1 for word in sad_keywords if word in text)
-        positive_count = sum(1 for word in positive_keywords if word in text)
+        # 相同文本（规范化后）直接复用缓存的模型概率
+        cache_key = _score_cache_key(text) if TEXT_CACHE_ENABLED else None
+        scores = text_score_cache.get(cache_key) if cache_key else None
 
-        # 根据关键词出现情况调整预测结果
-        
-        # 特别处理愤怒情绪
-        if angry_count >= 2:  # 如果检测到多个愤怒关键词
-            emotion_type = "愤怒"
-            predicted_class = 0  # 非常消极
-        elif angry_count == 1 and negative_count <= 1 and positive_count <= 1:  # 只有一个愤怒关键词且没有其他明显情绪
-            emotion_type = "愤怒"
-            predicted_class = 0  # 非常消极
-        elif negative_count > positive_count:
-            # 更倾向于消极情感
-            emotion_type = "悲伤"
-            predicted_class = min(
-                2, negative_count - positive_count
-            )  # 0或1，取决于差值
-        elif positive_count > negative_count:
-            # 更倾向于积极情感
-            emotion_type = "快乐"
-            predicted_class = min(
-                4, 2 + positive_count - negative_count
-            )  # 3或4，取决于差值
-        else:
-            # 如果没有明显情感倾向，使用模型预测结果
-            predicted_class = torch.argmax(logits, dim=1).item()
-            emotion_type = "中性"
+        # 级联模式：轻量模型足够自信时不再运行完整模型
+        model_tier = "full"
+        cascaded = scores is None and cascade and not calibrated_scores
+        if cascaded:
+            scores = _score_with_light_model([text]).get(text)
+            if scores is not None:
+                model_tier = "light"
 
-            # 为了避免总是返回相同结果，如果文本长度很短且没有明显情感词，默认为中性
-            if len(text) < 10 and predicted_class > 2:
-                predicted_class = 2  # 中性
+        if scores is None:
+            # 使用模型进行预测（启用批处理时与其他并发请求合并为一次前向推理）
+            if TEXT_BATCH_ENABLED:
+                scores = text_batcher.run(text)
+            else:
+                scores = predict_sentiment_scores([text])[0]
+
+            if cache_key:
+                text_score_cache.set(cache_key, scores)
+
+        # 只统计经过级联判定的文本，命中缓存的不计入
+        if cascaded:
+            record_model_tier(model_tier)
+
+        # 结合关键词规则生成结果
+        result = _apply_keyword_rules(text, scores)
+        result["model_tier"] = model_tier
 
-        # 映射情感标签
-        sentiment_labels = ["非常消极", "消极", "中性", "积极", "非常积极"]
-        
-        # 记录检测到的关键词数量
-        logger.info(f"情感关键词统计: 愤怒={angry_count}, 悲伤={negative_count}, 积极={positive_count}")
-        sentiment = sentiment_labels[predicted_class]
-        
         # 计算处理时间
         end_time = time.time()
         processing_time = end_time - start_time
-        
-        logger.info(f"情感分析完成，结果: {sentiment}，耗时: {processing_time:.2f}秒")
-        
-        # 构建结果
-        result = {
-            "text": text,
-            "sentiment": sentiment,
-            "emotion_type": emotion_type,  # 添加情绪类型信息
-            "sentiment_class": predicted_class,
-            "scores": {
-                "very_negative": float(scores[0]),
-                "negative": float(scores[1]),
-                "neutral": float(scores[2]),
-                "positive": float(scores[3]),
-                "very_positive": float(scores[4])
-            },
-            "angry_keywords": angry_count,  # 添加关键词统计
-            "sad_keywords": negative_count,
-            "positive_keywords": positive_count,
-            "processing_time": processing_time
-        }
-        
+
+        logger.info(f"情感分析完成，结果: {result['sentiment']}，耗时: {processing_time:.2f}秒")
+
+        result["processing_time"] = processing_time
         return result, None
     except Exception as e:
         error_msg = f"分析文本情感时出错: {str(e)}"
@@ -161,7 +418,124 @@ def analyze_emotion(text):
         return None, error_msg
 
 
-def handle_text_analysis_request(text):
+def _bucket_by_length(texts, tokenizer, batch_size):
+    """按分词长度排序并切分批次，使同一批次内文本长度接近以减少补齐浪费"""
+    if not texts:
+        return []
+    encoded = tokenizer(list(texts), truncation=True, max_length=512)
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def analyze_emotions_batch(texts, rules_first=None, calibrated_scores=False, cascade=None):
+    """批量分析文本情感，返回与输入顺序一致的结果列表"""
+    if rules_first is None:
+        rules_first = TEXT_RULES_FIRST
+    if cascade is None:
+        cascade = TEXT_CASCADE_ENABLED
+
+    try:
+        start_time = time.time()
+
+        # 去重，重复文本只推理一次
+        unique_texts = list(dict.fromkeys(texts))
+        logger.info(f"开始批量分析文本情感: {len(texts)} 条，去重后 {len(unique_texts)} 条")
+
+        # 规则优先模式：先用关键词规则判定，只把无法判定的文本交给模型
+        unique_results = {}
+        if rules_first and not calibrated_scores:
+            for text in unique_texts:
+                result = _apply_keyword_rules(text)
+                if result is not None:
+                    unique_results[text] = result
+        pending_texts = [text for text in unique_texts if text not in unique_results]
+
+        if pending_texts:
+            model, tokenizer = get_text_model()
+            if model is None or tokenizer is None:
+                logger.error("文本情感分析模型不可用，返回模拟结果")
+                for text in pending_texts:
+                    unique_results[text] = _get_mock_emotion_analysis(text)
+            else:
+                # 先查缓存，只对未命中的文本运行模型
+                uncached_texts = []
+                for text in pending_texts:
+                    scores = None
+                    if TEXT_CACHE_ENABLED:
+                        scores = text_score_cache.get(_score_cache_key(text))
+                    if scores is None:
+                        uncached_texts.append(text)
+                    else:
+                        unique_results[text] = _apply_keyword_rules(text, scores)
+                        unique_results[text]["model_tier"] = "full"
+
+                # 级联模式：轻量模型足够自信的文本不再运行完整模型
+                if cascade and not calibrated_scores and uncached_texts:
+                    light_scores = _score_with_light_model(uncached_texts)
+                    for text, scores in light_scores.items():
+                        unique_results[text] = _apply_keyword_rules(text, scores)
+                        unique_results[text]["model_tier"] = "light"
+                    uncached_texts = [text for text in uncached_texts if text not in light_scores]
+                    record_model_tier("light", len(light_scores))
+                    record_model_tier("full", len(uncached_texts))
+
+                # 按长度分桶后逐批推理
+                for bucket in _bucket_by_length(uncached_texts, tokenizer, ANALYZE_BATCH_SIZE):
+                    bucket_texts = [uncached_texts[i] for i in bucket]
+                    for text, scores in zip(bucket_texts, predict_sentiment_scores(bucket_texts)):
+                        if TEXT_CACHE_ENABLED:
+                            text_score_cache.set(_score_cache_key(text), scores)
+                        # 与单条分析使用同一套关键词规则，保证结果一致
+                        unique_results[text] = _apply_keyword_rules(text, scores)
+                        unique_results[text]["model_tier"] = "full"
+
+        results = [dict(unique_results[text]) for text in texts]
+
+        processing_time = time.time() - start_time
+        logger.info(
+            f"批量情感分析完成，需模型判定 {len(pending_texts)} 条，耗时: {processing_time:.2f}秒"
+        )
+        return results, None
+    except Exception as e:
+        error_msg = f"批量分析文本情感时出错: {str(e)}"
+        logger.error(error_msg)
+        return None, error_msg
+
+
+def analyze_segment_emotions(segments, **options):
+    """对带时间戳的文本分段（如Whisper识别结果）逐段分析情感，返回情感轨迹
+
+    所有分段一次性交给 analyze_emotions_batch，在同一轮批量推理中完成
+    """
+    segments = [segment for segment in segments if segment.get("text", "").strip()]
+    if not segments:
+        return [], None
+
+    results, error = analyze_emotions_batch([segment["text"] for segment in segments], **options)
+    if error:
+        return None, error
+
+    track = []
+    for segment, result in zip(segments, results):
+        track.append(
+            {
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": segment["text"],
+                "sentiment": result["sentiment"],
+                # 模型不可用时的模拟结果没有情绪类型
+                "emotion_type": result.get("emotion_type"),
+                "sentiment_class": result["sentiment_class"],
+                "scores": result["scores"],
+            }
+        )
+    return track, None
+
+
+def handle_text_analysis_request(
+    text, rules_first=None, calibrated_scores=False, long_text=None, cascade=None
+):
     """处理文本情感分析请求"""
     try:
         # 检查文本是否为空
@@ -173,7 +547,13 @@ def handle_text_analysis_request(text):
         logger.info(f"处理文本分析请求: 文本长度 {text_length} 字符")
         
         # 分析文本情感
-        result, error = analyze_emotion(text)
+        result, error = analyze_emotion(
+            text,
+            rules_first=rules_first,
+            calibrated_scores=calibrated_scores,
+            long_text=long_text,
+            cascade=cascade,
+        )
         if error:
             # 记录具体错误，但对外返回通用错误信息
             logger.error(f"文本情感分析错误: {error}")
@@ -189,21 +569,62 @@ def handle_text_analysis_request(text):
         return error_response("处理文本分析请求时发生错误")
 
 
+def handle_batch_text_analysis_request(
+    texts, rules_first=None, calibrated_scores=False, cascade=None
+):
+    """处理批量文本情感分析请求"""
+    try:
+        # 检查输入格式
+        if not isinstance(texts, list) or not texts:
+            return error_response("texts必须是非空的文本列表")
+        if len(texts) > ANALYZE_BATCH_MAX_TEXTS:
+            return error_response(f"单次最多分析{ANALYZE_BATCH_MAX_TEXTS}条文本")
+        if not all(isinstance(text, str) for text in texts):
+            return error_response("texts中的每一项都必须是字符串")
+
+        logger.info(f"处理批量文本分析请求: {len(texts)} 条文本")
+        start_time = time.time()
+
+        # 空文本不参与推理，在结果中单独标记
+        valid_texts = [text for text in texts if text.strip()]
+        valid_results = []
+        if valid_texts:
+            valid_results, error = analyze_emotions_batch(
+                valid_texts,
+                rules_first=rules_first,
+                calibrated_scores=calibrated_scores,
+                cascade=cascade,
+            )
+            if error:
+                logger.error(f"批量文本情感分析错误: {error}")
+                return error_response("批量文本分析失败，请检查输入")
+
+        result_iter = iter(valid_results)
+        results = [
+            next(result_iter) if text.strip() else {"text": text, "error": "文本不能为空"}
+            for text in texts
+        ]
+
+        return jsonify({
+            "success": True,
+            "count": len(texts),
+            "unique_count": len(set(valid_texts)),
+            "processing_time": time.time() - start_time,
+            "results": results
+        })
+    except Exception as e:
+        logger.error(f"处理批量文本分析请求时出错: {str(e)}")
+        return error_response("处理批量文本分析请求时发生错误")
+
+
 def _get_mock_emotion_analysis(text):
     """返回模拟的情感分析结果"""
     import random
     
     # 基于文本内容生成一些简单的情感分析
-    negative_keywords = [
-        "不", "没", "难过", "伤心", "失望", "痛苦", "焦虑", "担心", "害怕", "讨厌", "生气", "烦恶",
-    ]
-    positive_keywords = [
-        "喜欢", "开心", "高兴", "快乐", "满意", "感谢", "幸福", "棒", "好", "爱",
-    ]
-    
-    # 计算关键词出现次数
-    negative_count = sum(1 for word in negative_keywords if word in text)
-    positive_count = sum(1 for word in positive_keywords if word in text)
+    counts = keyword_matchers["mock"].count(text)
+    negative_count = counts["negative"]
+    positive_count = counts["positive"]
     
     # 根据关键词出现情况确定情感倒向
     if negative_count > positive_count:
@@ -233,6 +654,7 @@ def _get_mock_emotion_analysis(text):
     # 映射情感标签
     sentiment_labels = ["非常消极", "消极", "中性", "积极", "非常积极"]
     sentiment = sentiment_labels[predicted_class]
+    emotion_type = "悲伤" if predicted_class < 2 else ("快乐" if predicted_class > 2 else "中性")
     
     # 模拟处理时间
     processing_time = random.uniform(0.05, 0.2)
@@ -241,6 +663,7 @@ def _get_mock_emotion_analysis(text):
     result = {
         "text": text,
         "sentiment": sentiment,
+        "emotion_type": emotion_type,
         "sentiment_class": predicted_class,
         "scores": scores,
         "processing_time": processing_time,
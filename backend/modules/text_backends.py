@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文本情感模型推理后端模块
+支持原始fp32 PyTorch、动态int8量化PyTorch和ONNX Runtime三种CPU推理后端
+
+离线导出ONNX模型并检查与fp32结果的一致性:
+    python -m modules.text_backends export
+    python -m modules.text_backends check --backend quantized
+
+ONNX后端只加载已离线导出、且一致性检查通过（记录与模型文件的哈希一致）的模型，
+否则回退到torch后端；服务进程不会在请求中导出模型
+"""
+
+import os
+import sys
+import json
+import glob
+import uuid
+import hashlib
+import logging
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+# 导入ONNX Runtime（可选依赖）
+try:
+    import onnxruntime
+
+    onnxruntime_available = True
+except ImportError:
+    onnxruntime_available = False
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+TEXT_BACKENDS = ("torch", "quantized", "onnx")
+
+# ONNX模型缓存目录
+ONNX_CACHE_DIR = os.environ.get(
+    "TEXT_ONNX_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "emotion-analysis", "onnx"),
+)
+
+# 一致性检查使用的示例文本目录
+EXAMPLE_TEXT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "examples",
+    "text",
+)
+
+ONNX_INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+# 一致性检查允许的最大概率差（默认值）
+PARITY_TOLERANCE = 0.05
+
+
+class OnnxSequenceClassifier:
+    """ONNX Runtime推理会话的包装，调用方式与transformers模型一致（返回带logits的对象）"""
+
+    def __init__(self, onnx_path, config=None):
+        self.config = config
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [item.name for item in self.session.get_inputs()]
+        self.onnx_path = onnx_path
+
+    def __call__(self, **inputs):
+        feeds = {
+            name: inputs[name].cpu().numpy().astype(np.int64)
+            for name in self.input_names
+            if name in inputs
+        }
+        logits = self.session.run(["logits"], feeds)[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+
+def get_onnx_path(model_name):
+    """获取模型对应的ONNX文件缓存路径"""
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "--") + ".onnx")
+
+
+def get_parity_path(onnx_path):
+    """获取ONNX模型一致性检查记录的路径"""
+    return onnx_path + ".parity.json"
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def file_digest(path):
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def record_parity(onnx_path, stats, tolerance=PARITY_TOLERANCE):
+    """记录一致性检查结果（与模型文件的哈希绑定），返回是否通过"""
+    passed = stats["max_abs_diff"] <= tolerance
+    record = dict(stats, passed=passed, tolerance=tolerance, sha256=file_digest(onnx_path))
+    tmp_path = f"{get_parity_path(onnx_path)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp_path, get_parity_path(onnx_path))
+    return passed
+
+
+def parity_passed(onnx_path):
+    """检查ONNX模型是否有通过的一致性检查记录，且记录对应当前的模型文件"""
+    try:
+        with open(get_parity_path(onnx_path), "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return bool(record.get("passed")) and record.get("sha256") == file_digest(onnx_path)
+
+
+def quantize_model(model):
+    """对模型的Linear层进行动态int8量化"""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_onnx(model, tokenizer, onnx_path):
+    """将fp32模型导出为ONNX计算图（批次和序列长度为动态维度）"""
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    dummy = tokenizer(["这是一段用于导出模型的示例文本"], return_tensors="pt")
+    input_names = [name for name in ONNX_INPUT_NAMES if name in dummy]
+
+    model.config.return_dict = False
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    # 每个进程/调用使用独立的临时文件，导出完成后原子改名，并发导出不会互相覆盖
+    tmp_path = f"{onnx_path}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(dummy[name] for name in input_names),
+                tmp_path,
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+            )
+        # 新导出的模型需要重新做一致性检查
+        _remove(get_parity_path(onnx_path))
+        os.replace(tmp_path, onnx_path)
+    finally:
+        _remove(tmp_path)
+    logger.info(f"ONNX模型已导出: {onnx_path}")
+    return onnx_path
+
+
+def load_text_backend(model_name, backend="torch", device="cpu"):
+    """按指定后端加载文本情感分析模型，返回 (模型, 分词器, 实际使用的后端)"""
+    if backend not in TEXT_BACKENDS:
+        logger.warning(f"未知的文本推理后端: {backend}，使用默认的torch后端")
+        backend = "torch"
+    if backend == "onnx" and not onnxruntime_available:
+        logger.warning("onnxruntime未安装，ONNX后端不可用，使用默认的torch后端")
+        backend = "torch"
+
+    if backend == "onnx":
+        onnx_path = get_onnx_path(model_name)
+        if not os.path.exists(onnx_path):
+            logger.warning(
+                f"未找到已导出的ONNX模型，使用默认的torch后端"
+                f"（请先执行 python -m modules.text_backends export）: {onnx_path}"
+            )
+            backend = "torch"
+        elif not parity_passed(onnx_path):
+            logger.warning(
+                f"ONNX模型没有通过一致性检查的记录，使用默认的torch后端"
+                f"（请执行 python -m modules.text_backends check --backend onnx）: {onnx_path}"
+            )
+            backend = "torch"
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    if backend == "onnx":
+        config = AutoConfig.from_pretrained(model_name)
+        return OnnxSequenceClassifier(onnx_path, config), tokenizer, backend
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    if backend == "quantized":
+        # 动态量化只支持CPU
+        return quantize_model(model), tokenizer, backend
+
+    return model.to(device), tokenizer, backend
+
+
+def load_parity_texts(text_dir=EXAMPLE_TEXT_DIR):
+    """加载示例文本用于一致性检查"""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(text_dir, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.extend(line.strip() for line in f if line.strip())
+    return texts or ["今天很开心", "我非常失望", "这是一段普通的文本"]
+
+
+def _predict(model, tokenizer, texts):
+    """计算一批文本的情感概率"""
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    return torch.softmax(logits, dim=1).numpy()
+
+
+def check_parity(reference_model, candidate_model, tokenizer, texts=None):
+    """比较候选后端与fp32模型的输出，返回一致性统计"""
+    texts = texts or load_parity_texts()
+    reference = _predict(reference_model, tokenizer, texts)
+    candidate = _predict(candidate_model, tokenizer, texts)
+    diff = np.abs(reference - candidate)
+    return {
+        "texts": len(texts),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "argmax_agreement": float(np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1))),
+    }
+
+
+def main(argv=None):
+    """命令行入口：导出ONNX模型或检查后端一致性"""
+    parser = argparse.ArgumentParser(description="文本情感模型推理后端工具")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument(
+        "--model",
+        default=os.environ.get("MODEL_NAME", "nlptown/bert-base-multilingual-uncased-sentiment"),
+    )
+    parser.add_argument("--backend", choices=["quantized", "onnx"], default="onnx")
+    parser.add_argument(
+        "--tolerance", type=float, default=PARITY_TOLERANCE, help="允许的最大概率差"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    reference = AutoModelForSequenceClassification.from_pretrained(args.model).eval()
+
+    if args.command == "export" or args.backend == "onnx":
+        if not onnxruntime_available:
+            logger.error("onnxruntime未安装，无法使用ONNX后端")
+            return 1
+        onnx_path = get_onnx_path(args.model)
+        if args.command == "export" or not os.path.exists(onnx_path):
+            export_reference = AutoModelForSequenceClassification.from_pretrained(args.model).eval()
+            export_onnx(export_reference, tokenizer, onnx_path)
+        candidate = OnnxSequenceClassifier(onnx_path)
+    else:
+        candidate = quantize_model(reference)
+
+    stats = check_parity(reference, candidate, tokenizer)
+    logger.info(f"一致性检查结果 ({args.backend}): {stats}")
+    if isinstance(candidate, OnnxSequenceClassifier):
+        # 服务进程只加载有通过记录的ONNX模型
+        record_parity(onnx_path, stats, args.tolerance)
+    if stats["max_abs_diff"] > args.tolerance:
+        logger.error(f"最大概率差 {stats['max_abs_diff']:.4f} 超过允许值 {args.tolerance}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+长文本切分模块
+按句子切分文本，再合并为不超过指定词元数的窗口，用于长文本的分段情感分析
+"""
+
+import re
+import math
+
+# 句子结束标点（中英文）及换行
+SENTENCE_PATTERN = re.compile(r"[^。！？!?；;…\n]+[。！？!?；;…\n]*")
+
+
+def split_sentences(text):
+    """按句末标点切分文本，返回 [(起始位置, 结束位置), ...]"""
+    spans = []
+    for match in SENTENCE_PATTERN.finditer(text or ""):
+        if match.group().strip():
+            spans.append((match.start(), match.end()))
+    return spans
+
+
+def split_text_chunks(text, token_len_fn, max_tokens=256):
+    """将文本切分为词元数不超过 max_tokens 的窗口
+
+    token_len_fn: 接收文本列表，返回每条文本词元数的函数（一次调用完成分词）
+    返回 [(起始位置, 结束位置, 词元数), ...]，相邻句子会尽量合并到同一窗口
+    """
+    sentence_spans = split_sentences(text)
+    if not sentence_spans:
+        return []
+
+    sentence_lengths = token_len_fn([text[start:end] for start, end in sentence_spans])
+
+    # 超长的单个句子按字符均分为若干窗口
+    pieces = []
+    for (start, end), length in zip(sentence_spans, sentence_lengths):
+        if length <= max_tokens:
+            pieces.append((start, end, length))
+            continue
+        piece_count = math.ceil(length / max_tokens)
+        piece_chars = math.ceil((end - start) / piece_count)
+        for piece_start in range(start, end, piece_chars):
+            piece_end = min(end, piece_start + piece_chars)
+            piece_tokens = math.ceil(length * (piece_end - piece_start) / (end - start))
+            pieces.append((piece_start, piece_end, piece_tokens))
+
+    # 贪心合并相邻片段
+    chunks = []
+    chunk_start, chunk_end, chunk_tokens = pieces[0]
+    for start, end, tokens in pieces[1:]:
+        if chunk_tokens + tokens <= max_tokens:
+            chunk_end = end
+            chunk_tokens += tokens
+        else:
+            chunks.append((chunk_start, chunk_end, chunk_tokens))
+            chunk_start, chunk_end, chunk_tokens = start, end, tokens
+    chunks.append((chunk_start, chunk_end, chunk_tokens))
+
+    return chunks
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+长音频分段转写模块
+按静音位置把长音频切分为约30秒的窗口，逐窗口流式解码，并使用进程池并行转写，
+每个工作进程只加载一份Whisper模型，结果按时间顺序拼接
+"""
+
+import os
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from modules.audio_decoding import SAMPLE_RATE, iter_audio_file_blocks
+from modules.utils import traditional_to_simplified
+from modules.vad import frame_energy_db, trim_silence, map_to_original
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+SPEECH_LONG_AUDIO_ENABLED = os.environ.get("SPEECH_LONG_AUDIO_ENABLED", "true").lower() == "true"
+SPEECH_LONG_AUDIO_MIN_SECONDS = float(os.environ.get("SPEECH_LONG_AUDIO_MIN_SECONDS", 120))
+SPEECH_WINDOW_SECONDS = float(os.environ.get("SPEECH_WINDOW_SECONDS", 30))
+SPEECH_WORKERS = int(os.environ.get("SPEECH_WORKERS", 2))
+
+# 在窗口末尾的这段范围内寻找能量最低的位置作为切分点
+CUT_SEARCH_SECONDS = 10
+# 流式解码时每次读取的音频长度
+DECODE_BLOCK_SECONDS = 10
+
+# 工作进程内的Whisper模型（每个进程一份）
+_worker_model = None
+
+_executor = None
+# 为True时长音频总是在当前进程中逐窗口转写
+_process_pool_disabled = False
+
+
+def transcribe_array(whisper_model, audio, language="zh-CN", vad=True, offset=0.0):
+    """转写一段16kHz音频数组，返回 {"text", "segments", "vad"}
+
+    vad 为True时先去除静音，分段时间戳映射回原始音频并加上 offset（秒）
+    """
+    mapping = None
+    vad_stats = None
+    if vad:
+        audio, mapping, vad_stats = trim_silence(audio, SAMPLE_RATE)
+        if len(audio) == 0:
+            return {"text": "", "segments": [], "vad": vad_stats}
+
+    result = whisper_model.transcribe(
+        audio, language=language[:2] if language else None, fp16=False
+    )
+
+    segments = []
+    for segment in result.get("segments", []):
+        start, end = segment["start"], segment["end"]
+        if mapping is not None:
+            start, end = map_to_original(start, mapping), map_to_original(end, mapping)
+        segments.append(
+            {
+                "start": offset + start,
+                "end": offset + end,
+                "text": traditional_to_simplified(segment["text"].strip()),
+            }
+        )
+
+    text = traditional_to_simplified(result["text"].strip())
+    return {"text": text, "segments": segments, "vad": vad_stats}
+
+
+def find_silence_cut(window, sample_rate, search_seconds=CUT_SEARCH_SECONDS):
+    """在窗口末尾寻找能量最低的帧，返回切分位置（采样点）"""
+    search_length = min(len(window), int(sample_rate * search_seconds))
+    tail_start = len(window) - search_length
+    energy, frame_length = frame_energy_db(window[tail_start:], sample_rate)
+    if len(energy) == 0:
+        return len(window)
+    return tail_start + int(np.argmin(energy)) * frame_length + frame_length // 2
+
+
+def iter_windows(blocks, sample_rate=SAMPLE_RATE, window_seconds=SPEECH_WINDOW_SECONDS):
+    """把音频块流切分为在静音处断开的窗口（生成器），产出 (起始秒, 窗口音频)
+
+    内存中最多保留一个窗口加一个音频块
+    """
+    window_length = int(sample_rate * window_seconds)
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0
+    for block in blocks:
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) >= window_length:
+            cut = find_silence_cut(buffer[:window_length], sample_rate)
+            yield offset / sample_rate, buffer[:cut]
+            buffer = buffer[cut:]
+            offset += cut
+    if len(buffer):
+        yield offset / sample_rate, buffer
+
+
+def _array_blocks(audio, sample_rate=SAMPLE_RATE, block_seconds=DECODE_BLOCK_SECONDS):
+    """把已解码的音频数组按块产出，与流式解码使用同一切分逻辑"""
+    block_length = int(sample_rate * block_seconds)
+    for start in range(0, len(audio), block_length):
+        yield audio[start : start + block_length]
+
+
+def _init_worker(threads):
+    """工作进程初始化：限制计算线程数并加载一份Whisper模型"""
+    global _worker_model
+    import torch
+    from modules.models import WHISPER_MODEL_SIZE, SPEECH_BACKEND
+    from modules.speech_backends import load_speech_backend
+
+    torch.set_num_threads(threads)
+    _worker_model, _ = load_speech_backend(WHISPER_MODEL_SIZE, SPEECH_BACKEND)
+
+
+def _transcribe_window(offset, audio, language, vad):
+    """在工作进程中转写一个窗口"""
+    return transcribe_array(_worker_model, audio, language, vad, offset)
+
+
+def _get_executor():
+    """获取转写进程池（首次使用时创建，工作进程常驻以复用已加载的模型）"""
+    global _executor
+    if _executor is None:
+        threads = max(1, (os.cpu_count() or 1) // SPEECH_WORKERS)
+        # 使用spawn启动，避免在已初始化torch线程的进程中fork
+        _executor = ProcessPoolExecutor(
+            max_workers=SPEECH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+    return _executor
+
+
+def disable_process_pool():
+    """当前进程中的长音频改为逐窗口在本进程内转写，不再创建转写进程池
+
+    用于视频分析工作进程：守护进程不能再创建子进程，且工作进程已加载了Whisper模型
+    """
+    global _process_pool_disabled
+    _process_pool_disabled = True
+
+
+def uses_process_pool():
+    """长音频是否交给转写进程池（此时Whisper模型只在工作进程中加载）"""
+    return SPEECH_WORKERS > 1 and not _process_pool_disabled
+
+
+def is_long_audio(duration):
+    """判断是否使用长音频分段转写"""
+    return (
+        SPEECH_LONG_AUDIO_ENABLED
+        and duration is not None
+        and duration >= SPEECH_LONG_AUDIO_MIN_SECONDS
+    )
+
+
+def _merge_window(merged, window_result):
+    """把一个窗口的转写结果按顺序并入总结果"""
+    if window_result["text"]:
+        merged["text"].append(window_result["text"])
+    merged["segments"].extend(window_result["segments"])
+    stats = window_result["vad"]
+    if stats:
+        merged_stats = merged["vad"]
+        merged_stats["original_duration"] += stats["original_duration"]
+        merged_stats["voiced_duration"] += stats["voiced_duration"]
+        merged_stats["speech_regions"] += stats["speech_regions"]
+
+
+def transcribe_long_audio(audio, language="zh-CN", vad=True, whisper_model=None):
+    """分段转写长音频，audio 可以是文件路径（流式解码）或已解码的数组
+
+    使用进程池时并行转写（无需 whisper_model），否则在当前进程中使用 whisper_model 逐窗口转写。
+    只有文件路径是流式解码的，已解码的数组本身已在内存中
+    """
+    if isinstance(audio, str):
+        blocks = iter_audio_file_blocks(audio, SAMPLE_RATE, DECODE_BLOCK_SECONDS)
+    else:
+        blocks = _array_blocks(audio)
+    windows = iter_windows(blocks)
+
+    merged = {
+        "text": [],
+        "segments": [],
+        "vad": {"original_duration": 0.0, "voiced_duration": 0.0, "speech_regions": 0},
+    }
+    window_count = 0
+
+    if not uses_process_pool():
+        for offset, window in windows:
+            _merge_window(merged, transcribe_array(whisper_model, window, language, vad, offset))
+            window_count += 1
+    else:
+        executor = _get_executor()
+        # 限制同时提交的窗口数量，流式解码时内存占用与音频长度无关
+        pending = deque()
+        for offset, window in windows:
+            pending.append(executor.submit(_transcribe_window, offset, window, language, vad))
+            window_count += 1
+            if len(pending) >= SPEECH_WORKERS * 2:
+                _merge_window(merged, pending.popleft().result())
+        while pending:
+            _merge_window(merged, pending.popleft().result())
+
+    logger.info(f"长音频分段转写完成: {window_count} 个窗口")
+
+    stats = merged["vad"]
+    if vad and stats["original_duration"]:
+        stats["trimmed_ratio"] = 1 - stats["voiced_duration"] / stats["original_duration"]
+    else:
+        stats = None
+    # 中文文本直接拼接，其他语言以空格分隔
+    separator = "" if language and language.startswith("zh") else " "
+    return {"text": separator.join(merged["text"]), "segments": merged["segments"], "vad": stats}
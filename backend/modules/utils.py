@@ -103,6 +103,13 @@ def log_request_end(request_id, success=True, duration=None, **kwargs):
     )
 
 
+def parse_bool_option(value):
+    """解析请求中的布尔参数（JSON布尔值或表单字符串），未提供时返回None"""
+    if value is None or isinstance(value, bool):
+        return value
+    return str(value).lower() in ("true", "1", "yes")
+
+
 def error_response(message, status_code=400, request_id=None):
     """统一的错误响应函数"""
     # 生成请求ID（如果没有提供的话）
@@ -296,3 +303,12 @@ def traditional_to_simplified(text):
     else:
         # 如果OpenCC不可用，返回原文本
         return text
+
+
+def normalize_text(text):
+    """规范化文本：繁体转简体并合并空白字符，用于缓存键等场景"""
+    if not text:
+        return text
+
+    text = traditional_to_simplified(text)
+    return re.sub(r"\s+", " ", text).strip()
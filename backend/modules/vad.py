@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+语音活动检测模块
+基于短时能量检测语音区间，去除静音后再交给Whisper识别，并把识别结果的时间戳映射回原始音频
+"""
+
+import os
+import numpy as np
+
+# 从环境变量获取配置
+VAD_FRAME_MS = int(os.environ.get("VAD_FRAME_MS", 30))
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", 12))  # 语音能量需高出底噪的分贝数
+VAD_MIN_SPEECH_MS = int(os.environ.get("VAD_MIN_SPEECH_MS", 200))
+VAD_MIN_SILENCE_MS = int(os.environ.get("VAD_MIN_SILENCE_MS", 400))
+VAD_PADDING_MS = int(os.environ.get("VAD_PADDING_MS", 200))
+
+# 绝对静音门限（dBFS），低于该值的帧一律视为静音
+SILENCE_FLOOR_DB = -60.0
+# 拼接语音区间时插入的静音长度，避免相邻区间的词粘连
+JOIN_GAP_MS = 100
+
+
+def frame_energy_db(audio, sample_rate, frame_ms=VAD_FRAME_MS):
+    """计算每帧的RMS能量（dBFS）"""
+    frame_length = max(1, int(sample_rate * frame_ms / 1000))
+    frame_count = len(audio) // frame_length
+    if frame_count == 0:
+        return np.array([]), frame_length
+
+    frames = audio[: frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10)), frame_length
+
+
+def detect_speech(audio, sample_rate):
+    """检测语音区间，返回 [(起始采样点, 结束采样点), ...]"""
+    energy, frame_length = frame_energy_db(audio, sample_rate)
+    if len(energy) == 0:
+        return []
+
+    # 自适应门限：底噪（能量较低的10%帧）加上余量，但不高于峰值以下20dB
+    noise_floor = np.percentile(energy, 10)
+    threshold = min(noise_floor + VAD_MARGIN_DB, energy.max() - 20)
+    threshold = max(threshold, SILENCE_FLOOR_DB)
+    voiced = energy > threshold
+
+    # 连续的语音帧组成区间
+    regions = []
+    start = None
+    for index, is_voiced in enumerate(voiced):
+        if is_voiced and start is None:
+            start = index
+        elif not is_voiced and start is not None:
+            regions.append([start, index])
+            start = None
+    if start is not None:
+        regions.append([start, len(voiced)])
+
+    # 合并间隔过短的区间，丢弃过短的区间
+    frame_ms = frame_length * 1000 / sample_rate
+    merged = []
+    for region in regions:
+        if merged and (region[0] - merged[-1][1]) * frame_ms < VAD_MIN_SILENCE_MS:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+    merged = [r for r in merged if (r[1] - r[0]) * frame_ms >= VAD_MIN_SPEECH_MS]
+
+    # 转换为采样点并在两端补充少量余量
+    padding = int(sample_rate * VAD_PADDING_MS / 1000)
+    spans = []
+    for start_frame, end_frame in merged:
+        span_start = max(0, start_frame * frame_length - padding)
+        span_end = min(len(audio), end_frame * frame_length + padding)
+        if spans and span_start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], span_end)
+        else:
+            spans.append((span_start, span_end))
+    return spans
+
+
+def trim_silence(audio, sample_rate):
+    """去除静音，返回 (拼接后的语音音频, 时间映射, 统计信息)
+
+    时间映射为 [(拼接后起始秒, 原始起始秒, 时长秒), ...]，用于把识别结果的时间戳还原
+    """
+    spans = detect_speech(audio, sample_rate)
+    gap = np.zeros(int(sample_rate * JOIN_GAP_MS / 1000), dtype=audio.dtype)
+
+    pieces = []
+    mapping = []
+    offset = 0
+    for index, (start, end) in enumerate(spans):
+        if index > 0:
+            pieces.append(gap)
+            offset += len(gap)
+        pieces.append(audio[start:end])
+        mapping.append((offset / sample_rate, start / sample_rate, (end - start) / sample_rate))
+        offset += end - start
+
+    trimmed = np.concatenate(pieces) if pieces else audio[:0]
+    original_duration = len(audio) / sample_rate if sample_rate else 0
+    voiced_duration = sum(end - start for start, end in spans) / sample_rate
+    stats = {
+        "original_duration": original_duration,
+        "voiced_duration": voiced_duration,
+        "speech_regions": len(spans),
+        "trimmed_ratio": 1 - voiced_duration / original_duration if original_duration else 0,
+    }
+    return trimmed, mapping, stats
+
+
+def map_to_original(seconds, mapping):
+    """把拼接后音频中的时间点映射回原始音频的时间点"""
+    if not mapping:
+        return seconds
+
+    for trimmed_start, original_start, duration in mapping:
+        if seconds < trimmed_start:
+            # 落在拼接间隙中，对齐到下一个区间的起点
+            return original_start
+        if seconds <= trimmed_start + duration:
+            return original_start + (seconds - trimmed_start)
+
+    trimmed_start, original_start, duration = mapping[-1]
+    return original_start + duration
@@ -12,211 +12,267 @@ import logging
 import time
 import numpy as np
 from flask import jsonify
-from moviepy.editor import VideoFileClip
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 # 导入自定义模块
 from modules.models import (
-    emotion_detector,
-    whisper_model,
-    model_loaded,
-    model,
-    tokenizer,
+    get_model_status,
+    get_emotion_detector,
+    get_whisper_model,
+    get_text_model,
 )
 from modules.utils import error_response, emotion_to_chinese
-from modules.speech_recognition import recognize_speech
+from modules.speech_recognition import transcribe_speech, segment_sentiment_track
 from modules.text_analysis import analyze_emotion
+from modules.frame_reader import SampledFrameReader
+from modules.frame_sampling import plan_samples
+from modules.face_batching import VIDEO_FACE_BATCHING, supports_batching, detect_emotions_batch
+from modules.face_tracking import VIDEO_FACE_TRACKING, track_face_emotions
+from modules.audio_decoding import decode_audio_file, NoAudioStreamError, SAMPLE_RATE
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 从环境变量获取配置
+VIDEO_PARALLEL_BRANCHES = os.environ.get("VIDEO_PARALLEL_BRANCHES", "true").lower() == "true"
+VIDEO_BRANCH_WORKERS = int(os.environ.get("VIDEO_BRANCH_WORKERS", 4))
 
-def process_video(video_file, language="zh-CN"):
-    """处理视频文件，提取面部表情和音频"""
-    # 即使模型未加载完成，也尝试处理视频
-    # 记录模型加载状态，但不阻止处理
-    if not model_loaded:
-        logger.warning("模型尚未完全加载，将尝试继续处理视频")
+# 执行语音分支的线程池
+_branch_executor = ThreadPoolExecutor(
+    max_workers=VIDEO_BRANCH_WORKERS, thread_name_prefix="video-speech"
+)
 
-    try:
-        start_time = time.time()
-        logger.info(f"开始处理视频文件: {video_file}")
 
-        # 面部表情分析
-        logger.info("开始分析视频中的面部表情...")
+def analyze_video_faces(video_file, sample_budget=None, track_faces=None):
+    """面部表情分支：读取采样帧并分析表情，返回 (面部分析结果, 视频信息)
 
-        # 初始化视频捕获
-        video = cv2.VideoCapture(video_file)
+    sample_budget 为最多分析的帧数，None 时按视频时长确定；
+    track_faces 为True时跟踪多个人物，结果中额外包含每个人物的情绪时间线（persons）
+    """
+    if track_faces is None:
+        track_faces = VIDEO_FACE_TRACKING
 
-        # 获取视频信息
-        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = video.get(cv2.CAP_PROP_FPS)
-        duration = total_frames / fps if fps > 0 else 0
-        logger.info(
-            f"视频信息: 总帧数={total_frames}, FPS={fps}, 时长={duration:.2f}秒"
-        )
+    # 面部表情分析
+    logger.info("开始分析视频中的面部表情...")
 
-        # 检查面部表情识别模型是否加载
-        if emotion_detector is None:
-            logger.warning("面部表情识别模型未加载，将跳过面部表情分析")
-            face_emotions = []
-            # 注意：即使跳过面部表情分析，我们仍然需要初始化video变量（已在上面完成）
+    # 初始化视频捕获
+    video = cv2.VideoCapture(video_file)
 
-        # 优化采样策略
-        emotions = []
-        max_samples = 20  # 最大采样数
+    # 获取视频信息
+    total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = video.get(cv2.CAP_PROP_FPS)
+    duration = total_frames / fps if fps > 0 else 0
+    logger.info(
+        f"视频信息: 总帧数={total_frames}, FPS={fps}, 时长={duration:.2f}秒"
+    )
 
-        # 计算采样间隔
-        if total_frames <= max_samples:
-            # 视频很短，分析每一帧
-            sample_indices = range(total_frames)
-        else:
-            # 均匀采样
-            sample_indices = [
-                int(i * total_frames / max_samples) for i in range(max_samples)
-            ]
-
-        logger.info(f"将采样 {len(sample_indices)} 帧进行分析")
+    # 检查面部表情识别模型是否加载
+    emotion_detector = get_emotion_detector()
+    if emotion_detector is None:
+        logger.warning("面部表情识别模型未加载，将跳过面部表情分析")
 
-        # 仅在模型加载时进行面部表情分析
-        if emotion_detector is not None:
-            for frame_idx in sample_indices:
-                # 跳转到指定帧
-                video.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = video.read()
-                if not ret:
-                    logger.warning(f"无法读取帧 {frame_idx}")
-                    continue
+    emotions = []
+    sampling = None
+    tracking = None
 
+    # 仅在模型加载时进行面部表情分析
+    if emotion_detector is not None:
+        # 按预算在画面变化处采样，跳过几乎不变的重复画面（视频很短时分析每一帧）
+        sample_indices, sampling, sampled_frames = plan_samples(
+            video, total_frames, fps, sample_budget, video_file=video_file
+        )
+        logger.info(f"将采样 {len(sample_indices)} 帧进行分析")
+        if sampled_frames is not None:
+            # 扫描候选帧时已保留选中的帧，无需再次解码
+            frame_reader = sampled_frames
+            reader_stats = {"cached": len(sampled_frames)}
+        else:
+            if sampling.get("adaptive"):
+                # 扫描候选帧后重新打开视频，从头顺序读取选中的帧
+                video.release()
+                video = cv2.VideoCapture(video_file)
+
+            # 顺序读取采样帧，间隔较大时才跳转，避免每次跳转都从关键帧重新解码；
+            # 沿用扫描时的GOP估计，不再探测
+            frame_reader = SampledFrameReader(
+                video, sample_indices, gop=sampling.get("gop"), video_file=video_file
+            )
+            reader_stats = frame_reader.stats
+        if track_faces and supports_batching(emotion_detector):
+            # 关键帧检测、其余帧跟踪，平均情绪包含所有人物的每次观测
+            emotions, persons, tracking = track_face_emotions(emotion_detector, frame_reader, fps)
+            frame_results = []
+        elif VIDEO_FACE_BATCHING and supports_batching(emotion_detector):
+            # 先检测所有采样帧中的人脸，再一次批量分类
+            frame_results = detect_emotions_batch(emotion_detector, frame_reader)
+        else:
+            frame_results = []
+            for frame_idx, frame in frame_reader:
                 # 分析当前帧的表情
                 try:
-                    result = emotion_detector.detect_emotions(frame)
-                    if result and len(result) > 0:
-                        emotions.append(result[0]["emotions"])
-                        logger.debug(
-                            f"帧 {frame_idx} 检测到表情: {result[0]['emotions']}"
-                        )
-                    else:
-                        logger.debug(f"帧 {frame_idx} 未检测到面部")
+                    frame_results.append((frame_idx, emotion_detector.detect_emotions(frame)))
                 except Exception as e:
                     logger.error(f"分析帧 {frame_idx} 时出错: {str(e)}")
 
-        # 释放视频资源
-        video.release()
-        logger.info(f"共检测到 {len(emotions)} 个帧的表情数据")
-
-        # 如果没有检测到任何表情，返回空结果
-        if not emotions:
-            logger.warning("未在视频中检测到任何面部表情")
-            face_result = {
-                "emotions": {},
-                "dominant_emotion": "unknown",
-                "dominant_emotion_zh": "未知",
-            }
-        else:
-            # 计算平均情绪
-            avg_emotions = {}
-            for emotion_dict in emotions:
-                for emotion, score in emotion_dict.items():
-                    avg_emotions[emotion] = avg_emotions.get(emotion, 0) + score / len(
-                        emotions
-                    )
-
-            # 找出主要情绪
-            if avg_emotions:
-                # 明确指定键值类型，避免类型推断问题
-                emotion_keys = list(avg_emotions.keys())
-                dominant_emotion = max(emotion_keys, key=lambda x: avg_emotions[x])
+        for frame_idx, result in frame_results:
+            if result and len(result) > 0:
+                emotions.append(result[0]["emotions"])
+                logger.debug(f"帧 {frame_idx} 检测到表情: {result[0]['emotions']}")
             else:
-                dominant_emotion = "neutral"
+                logger.debug(f"帧 {frame_idx} 未检测到面部")
 
-            face_result = {
-                "emotions": avg_emotions,
-                "dominant_emotion": dominant_emotion,
-                "dominant_emotion_zh": emotion_to_chinese(dominant_emotion),
-            }
+        logger.info(f"采样帧读取统计: {reader_stats}")
+
+    # 释放视频资源
+    video.release()
+    logger.info(f"共检测到 {len(emotions)} 个帧的表情数据")
+
+    # 如果没有检测到任何表情，返回空结果
+    if not emotions:
+        logger.warning("未在视频中检测到任何面部表情")
+        face_result = {
+            "emotions": {},
+            "dominant_emotion": "unknown",
+            "dominant_emotion_zh": "未知",
+        }
+    else:
+        # 计算平均情绪
+        avg_emotions = {}
+        for emotion_dict in emotions:
+            for emotion, score in emotion_dict.items():
+                avg_emotions[emotion] = avg_emotions.get(emotion, 0) + score / len(
+                    emotions
+                )
+
+        # 找出主要情绪
+        if avg_emotions:
+            # 明确指定键值类型，避免类型推断问题
+            emotion_keys = list(avg_emotions.keys())
+            dominant_emotion = max(emotion_keys, key=lambda x: avg_emotions[x])
+        else:
+            dominant_emotion = "neutral"
+
+        face_result = {
+            "emotions": avg_emotions,
+            "dominant_emotion": dominant_emotion,
+            "dominant_emotion_zh": emotion_to_chinese(dominant_emotion),
+        }
+
+        logger.info(
+            f"面部表情分析结果: {dominant_emotion} ({face_result['dominant_emotion_zh']})"
+        )
+
+    if sampling is not None:
+        face_result["sampling"] = sampling
+    if tracking is not None:
+        face_result["persons"] = persons
+        face_result["tracking"] = tracking
+
+    video_info = {"duration": duration, "frames": total_frames, "fps": fps}
+    return face_result, video_info
 
-            logger.info(
-                f"面部表情分析结果: {dominant_emotion} ({face_result['dominant_emotion_zh']})"
-            )
 
-        # 音频处理
-        logger.info("开始处理视频中的音频...")
-        # 初始化临时文件路径变量
-        temp_audio_path = None
+def analyze_video_speech(video_file, language="zh-CN", segment_sentiment=None):
+    """语音分支：提取音轨、识别语音并分析文本情感，返回语音分析结果"""
+    # 音频处理
+    logger.info("开始处理视频中的音频...")
 
+    # 检查Whisper模型是否加载
+    if get_whisper_model() is None:
+        logger.warning("语音识别模型未加载，将跳过音频处理")
+        return {"success": False, "error": "语音识别模型未加载，请稍后再试"}
+
+    try:
+        # 用ffmpeg直接从容器中解复用音频流，解码为16kHz单声道数组，不写临时文件
         try:
-            # 检查Whisper模型是否加载
-            if whisper_model is None:
-                logger.warning("语音识别模型未加载，将跳过音频处理")
-                speech_result = {
-                    "success": False,
-                    "error": "语音识别模型未加载，请稍后再试",
-                }
-            else:
-                try:
-                    # 使用moviepy提取音频
-                    video_clip = VideoFileClip(video_file)
-
-                    # 检查视频是否有音频轨道
-                    if video_clip.audio is None:
-                        logger.warning("视频没有音频轨道")
-                        speech_result = {"success": False, "error": "视频没有音频轨道"}
-                    else:
-                        # 创建临时音频文件
-                        with tempfile.NamedTemporaryFile(
-                            suffix=".wav", delete=False
-                        ) as temp_audio:
-                            temp_audio_path = temp_audio.name
-
-                        # 将音频写入临时文件
-                        video_clip.audio.write_audiofile(temp_audio_path, logger=None)
-
-                        # 使用Whisper识别语音
-                        text, speech_error = recognize_speech(temp_audio_path, language)
-
-                        if speech_error:
-                            logger.warning(f"语音识别出错: {speech_error}")
-                            speech_result = {"success": False, "error": speech_error}
-                        else:
-                            # 对识别出的文本进行情感分析
-                            # 检查文本情感分析模型是否加载
-                            if model is None or tokenizer is None:
-                                logger.warning(
-                                    "文本情感分析模型未加载，将跳过文本情感分析"
-                                )
-                                emotion_result = None
-                                emotion_error = "文本情感分析模型未加载"
-                            else:
-                                emotion_result, emotion_error = analyze_emotion(text)
-
-                            if emotion_error:
-                                logger.warning(f"文本情感分析出错: {emotion_error}")
-
-                            speech_result = {
-                                "success": True,
-                                "text": text,
-                                "emotion_analysis": emotion_result,
-                                "emotion_error": emotion_error,
-                            }
-
-                    # 关闭视频对象
-                    video_clip.close()
+            audio = decode_audio_file(video_file)
+        except NoAudioStreamError:
+            logger.warning("视频没有音频轨道")
+            return {"success": False, "error": "视频没有音频轨道"}
+        logger.info(f"视频音轨解码完成: {len(audio) / SAMPLE_RATE:.2f}秒")
+
+        # 使用Whisper识别语音
+        transcription, speech_error = transcribe_speech(audio, language)
+
+        if speech_error:
+            logger.warning(f"语音识别出错: {speech_error}")
+            return {"success": False, "error": speech_error}
+
+        text = transcription["text"]
+        # 对识别出的文本进行情感分析
+        # 检查文本情感分析模型是否加载
+        model, tokenizer = get_text_model()
+        if model is None or tokenizer is None:
+            logger.warning("文本情感分析模型未加载，将跳过文本情感分析")
+            emotion_result = None
+            emotion_error = "文本情感分析模型未加载"
+        else:
+            emotion_result, emotion_error = analyze_emotion(text)
 
-                except Exception as e:
-                    logger.error(f"处理视频音频时出错: {str(e)}")
-                    speech_result = {
-                        "success": False,
-                        "error": f"处理视频音频时出错: {str(e)}",
-                    }
-        finally:
-            # 清理临时文件
-            if temp_audio_path and os.path.exists(temp_audio_path):
-                try:
-                    os.remove(temp_audio_path)
-                    logger.info(f"删除临时音频文件: {temp_audio_path}")
-                except Exception as e:
-                    logger.error(f"删除临时音频文件时出错: {str(e)}")
+        if emotion_error:
+            logger.warning(f"文本情感分析出错: {emotion_error}")
+
+        speech_result = {
+            "success": True,
+            "text": text,
+            "emotion_analysis": emotion_result,
+            "emotion_error": emotion_error,
+        }
+
+        # 分段情感轨迹
+        track, track_error = segment_sentiment_track(transcription, segment_sentiment)
+        if track_error:
+            logger.warning(f"分段情感分析出错: {track_error}")
+        elif track is not None:
+            speech_result["sentiment_track"] = track
+
+        return speech_result
+    except Exception as e:
+        logger.error(f"处理视频音频时出错: {str(e)}")
+        return {"success": False, "error": f"处理视频音频时出错: {str(e)}"}
+
+
+def _timed(fn, *args):
+    """执行函数并返回 (结果, 耗时秒数)"""
+    start_time = time.time()
+    return fn(*args), time.time() - start_time
+
+
+def process_video(
+    video_file, language="zh-CN", segment_sentiment=None, sample_budget=None, track_faces=None
+):
+    """处理视频文件，提取面部表情和音频
+
+    面部表情和语音两个分支互不依赖，默认并行执行（模型推理期间会释放GIL），
+    总耗时约为两者中较慢的一个。
+    segment_sentiment 为True时语音结果中额外包含每个分段的情感轨迹（sentiment_track），
+    sample_budget 为面部表情分析最多采样的帧数，track_faces 为True时输出每个人物的情绪时间线
+    """
+    # 即使模型未加载完成，也尝试处理视频
+    # 记录模型加载状态，但不阻止处理
+    if not get_model_status()["loaded"]:
+        logger.warning("模型尚未完全加载，将尝试继续处理视频")
+
+    try:
+        start_time = time.time()
+        logger.info(f"开始处理视频文件: {video_file}")
+
+        if VIDEO_PARALLEL_BRANCHES:
+            # 语音分支在线程池中执行，面部表情分支在当前线程执行
+            speech_future = _branch_executor.submit(
+                _timed, analyze_video_speech, video_file, language, segment_sentiment
+            )
+            (face_result, video_info), face_time = _timed(
+                analyze_video_faces, video_file, sample_budget, track_faces
+            )
+            speech_result, speech_time = speech_future.result()
+        else:
+            (face_result, video_info), face_time = _timed(
+                analyze_video_faces, video_file, sample_budget, track_faces
+            )
+            speech_result, speech_time = _timed(
+                analyze_video_speech, video_file, language, segment_sentiment
+            )
 
         # 计算处理时间
         end_time = time.time()
@@ -227,14 +283,18 @@ def process_video(video_file, language="zh-CN"):
             "face_analysis": face_result,
             "speech_analysis": speech_result,
             "processing_time": processing_time,
-            "video_info": {"duration": duration, "frames": total_frames, "fps": fps},
+            "branch_times": {"face": face_time, "speech": speech_time},
+            "video_info": video_info,
         }
 
         # 添加综合情感分析结果
         combined_result = combine_results(face_result, speech_result)
         result["combined_analysis"] = combined_result
 
-        logger.info(f"视频处理完成，耗时: {processing_time:.2f}秒")
+        logger.info(
+            f"视频处理完成，耗时: {processing_time:.2f}秒"
+            f"（面部 {face_time:.2f}秒，语音 {speech_time:.2f}秒）"
+        )
 
         return result, None
     except Exception as e:
@@ -318,11 +378,15 @@ def combine_results(video_result, text_result):
         }
 
 
-def handle_video_upload_request(video_file, language="zh-CN"):
+def handle_video_upload_request(
+    video_file, language="zh-CN", segment_sentiment=None, sample_budget=None, track_faces=None
+):
     """处理视频上传请求"""
     try:
         # 处理视频文件
-        result, error = process_video(video_file, language)
+        result, error = process_video(
+            video_file, language, segment_sentiment, sample_budget, track_faces
+        )
 
         # 即使有错误，也尝试返回部分结果
         if error and result:
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+视频分析任务执行器模块
+固定数量的常驻工作进程（各自加载一份模型），父进程维护一个有界的优先级队列，
+空闲的工作进程按优先级领取任务；取消运行中的任务时直接终止对应的工作进程并重新启动一个
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+import multiprocessing
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量获取配置
+VIDEO_WORKERS = int(os.environ.get("VIDEO_WORKERS", 1))
+VIDEO_TASK_QUEUE = int(os.environ.get("VIDEO_TASK_QUEUE", 8))
+VIDEO_TASK_RETRY_AFTER = int(os.environ.get("VIDEO_TASK_RETRY_AFTER", 30))
+VIDEO_WORKER_PRELOAD = os.environ.get("VIDEO_WORKER_PRELOAD", "true").lower() == "true"
+
+
+def init_worker_process():
+    """工作进程的公共初始化：配置日志，长音频改为在本进程内逐窗口转写
+
+    工作进程是守护进程，不能再创建转写进程池（daemonic processes are not allowed to have children）
+    """
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    from modules.transcription import disable_process_pool
+
+    disable_process_pool()
+
+
+def _worker_main(conn, threads, preload):
+    """工作进程入口：加载模型后循环处理父进程发来的任务，直到收到None"""
+    init_worker_process()
+    import torch
+    from modules.models import load_model
+    from modules.video_analysis import process_video
+
+    torch.set_num_threads(threads)
+    if preload:
+        load_model()
+    conn.send(("ready", None, None))
+
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        task_id, file_path, options = job
+        try:
+            result, error = process_video(file_path, **options)
+        except Exception as e:
+            result, error = None, str(e)
+        conn.send((task_id, result, error))
+
+
+class VideoJob:
+    """一个视频分析任务"""
+
+    def __init__(self, task_id, file_path, options, priority):
+        self.task_id = task_id
+        self.file_path = file_path
+        self.options = options
+        self.priority = priority
+        self.cancelled = False
+        self.status = None  # 结束时的状态
+        self.done = threading.Event()
+
+
+class VideoJobExecutor:
+    """视频分析进程池：有界优先级队列（priority越大越先执行），支持取消排队中和运行中的任务
+
+    on_update(task_id, status, result, error) 在任务开始、完成、失败或取消时调用，
+    status 为 processing / completed / failed / cancelled
+    """
+
+    def __init__(
+        self, on_update, max_workers=VIDEO_WORKERS, max_queue=VIDEO_TASK_QUEUE, target=_worker_main
+    ):
+        self.on_update = on_update
+        self.target = target
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self._context = multiprocessing.get_context("spawn")
+        self._threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+
+        self._condition = threading.Condition()
+        self._queue = []  # (-priority, 序号, 任务)
+        self._counter = itertools.count()
+        self._queued = {}  # task_id -> 排队中的任务
+        self._running = {}  # task_id -> (任务, 工作进程)
+        self._started = False
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    def _start(self):
+        """首次提交任务时启动工作进程的管理线程"""
+        if self._started:
+            return
+        self._started = True
+        for index in range(self.max_workers):
+            thread = threading.Thread(
+                target=self._manage_worker, name=f"video-worker-{index}", daemon=True
+            )
+            thread.start()
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=self.target,
+            args=(child_conn, self._threads, VIDEO_WORKER_PRELOAD),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _next_job(self, process):
+        """阻塞直到取得优先级最高的任务，并登记为由 process 执行"""
+        with self._condition:
+            while True:
+                while self._queue:
+                    _, _, job = heapq.heappop(self._queue)
+                    if not job.cancelled:
+                        del self._queued[job.task_id]
+                        self._running[job.task_id] = (job, process)
+                        return job
+                self._condition.wait()
+
+    def _manage_worker(self):
+        """管理一个工作进程：领取任务、等待结果；进程退出（被取消或崩溃）时重新启动"""
+        process, conn = None, None
+        while True:
+            if process is None or not process.is_alive():
+                process, conn = self._spawn()
+                try:
+                    conn.recv()  # 等待模型加载完成
+                except (EOFError, OSError):
+                    logger.error("视频分析工作进程启动失败，稍后重试")
+                    process = None
+                    time.sleep(5)
+                    continue
+
+            job = self._next_job(process)
+            self._notify(job, "processing", None, None)
+
+            try:
+                conn.send((job.task_id, job.file_path, job.options))
+                _, result, error = conn.recv()
+                status = "failed" if error else "completed"
+            except (EOFError, OSError):
+                # 工作进程被终止（取消）或崩溃，下一轮重新启动
+                process.join(timeout=5)
+                process = None
+                result = None
+                # 只有在收到结果之前被终止的任务才算取消，已收到结果的任务按完成处理
+                if job.cancelled:
+                    status, error = "cancelled", "任务已取消"
+                else:
+                    status, error = "failed", "视频分析进程意外退出"
+
+            with self._condition:
+                self._running.pop(job.task_id, None)
+                self._stats[status] += 1
+                # 收到结果后才被取消的任务，其工作进程已被终止，下一轮重新启动
+                terminated = job.cancelled and process is not None
+            if terminated:
+                process.join(timeout=5)
+                process = None
+            self._finish(job, status, result, error)
+
+    def _notify(self, job, status, result, error):
+        """调用状态回调；回调出错（如任务存储写入失败）时只记录日志，不影响管理线程"""
+        try:
+            self.on_update(job.task_id, status, result, error)
+        except Exception as e:
+            logger.error(f"[Task {job.task_id}] 更新任务状态 {status} 时出错: {str(e)}")
+
+    def _finish(self, job, status, result, error):
+        try:
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+                logger.info(f"[Task {job.task_id}] 已清理临时文件: {job.file_path}")
+        except Exception as e:
+            logger.error(f"[Task {job.task_id}] 清理临时文件时出错: {str(e)}")
+        job.status = status
+        self._notify(job, status, result, error)
+        job.done.set()
+        logger.info(f"[Task {job.task_id}] 视频分析任务结束: {status}")
+
+    def try_submit(self, task_id, file_path, options=None, priority=0):
+        """提交任务，等待队列已满时返回False"""
+        job = VideoJob(task_id, file_path, options or {}, priority)
+        with self._condition:
+            if len(self._queued) >= self.max_queue:
+                self._stats["rejected"] += 1
+                return False
+            self._start()
+            heapq.heappush(self._queue, (-priority, next(self._counter), job))
+            self._queued[task_id] = job
+            self._stats["submitted"] += 1
+            self._condition.notify()
+        return True
+
+    def cancel(self, task_id, timeout=10):
+        """取消任务：排队中的直接移出队列，运行中的终止其工作进程。返回任务是否被取消
+
+        运行中的任务等待管理线程确定结果：终止前工作进程已返回结果的任务按完成处理，返回False
+        """
+        with self._condition:
+            job = self._queued.pop(task_id, None)
+            if job is None:
+                running = self._running.get(task_id)
+                if running is None:
+                    return False
+                job, process = running
+                job.cancelled = True
+                process.terminate()
+            else:
+                # 堆中的条目在出队时跳过
+                job.cancelled = True
+                self._stats["cancelled"] += 1
+                process = None
+
+        if process is not None:
+            job.done.wait(timeout)
+            return job.status == "cancelled"
+
+        self._finish(job, "cancelled", None, "任务已取消")
+        return True
+
+    def task_ids(self):
+        """返回本执行器中排队和运行中的任务ID"""
+        with self._condition:
+            return list(self._queued) + list(self._running)
+
+    def get_stats(self):
+        """获取执行器统计信息"""
+        with self._condition:
+            return dict(
+                self._stats,
+                max_workers=self.max_workers,
+                max_queue=self.max_queue,
+                queued=len(self._queued),
+                running=len(self._running),
+            )
@@ -17,10 +17,35 @@ from modules.utils import (
     emotion_to_chinese,
     safe_filename,
     traditional_to_simplified,
+    normalize_text,
     generate_request_id,
     allowed_file,
     allowed_video_file,
+    parse_bool_option,
 )
+from modules.batching import MicroBatcher
+from modules.task_queue import BoundedExecutor
+from modules.lexicon import KeywordMatcher, build_matchers
+from modules.cache import LRUCache
+from modules.task_store import MemoryTaskStore, SQLiteTaskStore
+from modules.text_chunking import split_sentences, split_text_chunks
+from modules.corpus_analysis import parse_lines, iter_batches
+from modules.audio_decoding import (
+    decode_audio_bytes,
+    decode_audio_file,
+    AudioDecodeError,
+    NoAudioStreamError,
+    StreamDecoder,
+)
+from modules.vad import detect_speech, trim_silence, map_to_original
+from modules import transcription
+from modules.transcription import iter_windows, transcribe_long_audio
+from modules.frame_reader import SampledFrameReader, sample_frame_indices
+from modules import frame_sampling
+from modules.frame_sampling import select_by_change, plan_samples
+from modules.face_batching import detect_emotions_batch
+from modules.face_tracking import track_face_emotions
+from modules.video_jobs import VideoJobExecutor
 
 
 class TestUtils(unittest.TestCase):
@@ -61,6 +86,19 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(traditional_to_simplified(""), "")
         self.assertEqual(traditional_to_simplified(None), None)
 
+    def test_parse_bool_option(self):
+        """测试请求布尔参数解析"""
+        self.assertIsNone(parse_bool_option(None))
+        self.assertTrue(parse_bool_option(True))
+        self.assertTrue(parse_bool_option("true"))
+        self.assertFalse(parse_bool_option("false"))
+
+    def test_normalize_text(self):
+        """测试文本规范化"""
+        self.assertEqual(normalize_text("  今天  天气\n很好 "), "今天 天气 很好")
+        self.assertIn(normalize_text("測試"), ["测试", "測試"])
+        self.assertEqual(normalize_text(""), "")
+
     def test_generate_request_id(self):
         """测试请求ID生成"""
         request_id = generate_request_id()
@@ -89,6 +127,825 @@ class TestUtils(unittest.TestCase):
         self.assertFalse(allowed_video_file("test.mp3"))
 
 
+class TestMicroBatcher(unittest.TestCase):
+    """测试动态微批处理调度器"""
+
+    def test_concurrent_requests_are_batched(self):
+        """测试并发请求被合并且结果按请求分发"""
+        import threading
+
+        batch_sizes = []
+
+        def batch_fn(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+        results = {}
+
+        def worker(value):
+            results[value] = batcher.run(value, timeout=5)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {i: i * 2 for i in range(8)})
+        self.assertLess(len(batch_sizes), 8)  # 至少有一次合并
+        self.assertEqual(batcher.get_stats()["items"], 8)
+
+    def test_batch_error_propagates(self):
+        """测试批量推理异常会传递给每个请求"""
+
+        def batch_fn(items):
+            raise ValueError("boom")
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.run("x", timeout=5)
+
+
+class TestBoundedExecutor(unittest.TestCase):
+    """测试有界任务执行器"""
+
+    def test_rejects_when_full(self):
+        """测试运行和等待中的任务达到上限时拒绝新任务，任务完成后恢复"""
+        import threading
+        import time
+
+        release = threading.Event()
+        executor = BoundedExecutor(max_workers=1, max_queue=1, name="test")
+        try:
+            futures = [executor.try_submit(release.wait, 5) for _ in range(2)]
+            self.assertTrue(all(future is not None for future in futures))
+            self.assertIsNone(executor.try_submit(release.wait, 5))
+
+            stats = executor.get_stats()
+            self.assertEqual(stats["in_flight"], 2)
+            self.assertEqual(stats["rejected"], 1)
+
+            release.set()
+            for future in futures:
+                future.result(timeout=5)
+            # 名额在完成回调中释放，稍等回调执行
+            deadline = time.time() + 5
+            while executor.get_stats()["in_flight"] and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertIsNotNone(executor.try_submit(lambda: None))
+        finally:
+            release.set()
+            executor.shutdown()
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    """测试情感关键词匹配器"""
+
+    def test_count_matches_substring_semantics(self):
+        """测试命中统计与逐词 in 判断一致（含重叠关键词和权重）"""
+        matcher = KeywordMatcher(
+            {"angry": {"烦躁": 1, "烦躁不安": 2}, "sad": {"不": 1, "悲伤": 3}}
+        )
+        self.assertEqual(matcher.count("我很烦躁不安"), {"angry": 3, "sad": 1})
+        self.assertEqual(matcher.count("悲伤悲伤"), {"angry": 0, "sad": 3})
+        self.assertEqual(matcher.count(""), {"angry": 0, "sad": 0})
+
+    def test_default_lexicon(self):
+        """测试默认词典文件可以加载"""
+        matchers = build_matchers()
+        self.assertIn("analysis", matchers)
+        self.assertIn("mock", matchers)
+        counts = matchers["analysis"].count("今天很开心")
+        self.assertEqual(counts["positive"], 1)
+
+
+class TestLRUCache(unittest.TestCase):
+    """测试LRU缓存"""
+
+    def test_lru_eviction_and_stats(self):
+        """测试超出条目上限时淘汰最久未使用的条目"""
+        cache = LRUCache(max_entries=2, ttl=None)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # a 变为最近使用
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_ttl_and_memory_cap(self):
+        """测试过期时间和内存上限"""
+        import time
+
+        cache = LRUCache(max_entries=10, ttl=0.05)
+        cache.set("a", 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()["expirations"], 1)
+
+        cache = LRUCache(max_entries=10, ttl=None, max_bytes=250, size_fn=lambda k, v: 100)
+        for key in "abc":
+            cache.set(key, key)
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestTaskStore(unittest.TestCase):
+    """测试异步任务存储的容量上限和过期"""
+
+    def _check_eviction(self, store):
+        store.set("running", "processing")
+        store.set("a", "completed", result={"text": "你好"})
+        store.set("b", "failed", error="出错")
+        self.assertEqual(store.get("a")["result"], {"text": "你好"})  # a 变为最近访问
+        store.set("c", "completed", result={})
+
+        # 超出上限时淘汰最久未访问的已结束任务，运行中的任务保留
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(store.get("running")["status"], "processing")
+        self.assertEqual(store.get("a")["status"], "completed")
+        self.assertEqual(store.get_stats()["entries"], 3)
+
+    def test_memory_store(self):
+        """测试内存存储的LRU淘汰和TTL"""
+        import time
+
+        self._check_eviction(MemoryTaskStore(max_entries=3, ttl=None))
+
+        store = MemoryTaskStore(max_entries=10, ttl=0.05)
+        store.set("done", "completed", result={})
+        store.set("running", "processing")
+        time.sleep(0.1)
+        self.assertIsNone(store.get("done"))
+        self.assertIsNotNone(store.get("running"))
+
+    def test_sqlite_store(self):
+        """测试SQLite存储的淘汰规则，以及多个实例（进程）共享任务状态"""
+        path = os.path.join(tempfile.mkdtemp(), "tasks.sqlite3")
+        self._check_eviction(SQLiteTaskStore(path, max_entries=3, ttl=None))
+
+        other = SQLiteTaskStore(path, max_entries=3, ttl=None)
+        self.assertEqual(other.get("a"), {"status": "completed", "result": {"text": "你好"}, "error": None})
+        other.delete("a")
+        self.assertIsNone(other.get("a"))
+
+    def test_sqlite_cancel_requests_and_stale_tasks(self):
+        """测试通过共享存储转交取消请求，以及超时未结束的任务被标记为失败"""
+        import time
+
+        path = os.path.join(tempfile.mkdtemp(), "tasks.sqlite3")
+        owner = SQLiteTaskStore(path, unfinished_ttl=None)
+        other = SQLiteTaskStore(path, unfinished_ttl=None)
+        owner.set("running", "queued", kind="video")
+        owner.set("running", "processing")
+        owner.set("audio", "processing", kind="audio")
+        owner.set("done", "completed", result={}, kind="video")
+
+        # 只转交类型相符的未结束任务，状态更新后任务类型保留
+        self.assertTrue(other.request_cancel("running", "video"))
+        self.assertFalse(other.request_cancel("audio", "video"))
+        self.assertFalse(other.request_cancel("done", "video"))
+        self.assertEqual(owner.get_cancel_requests(["running", "done", "missing"]), ["running"])
+        owner.set("running", "cancelled", error="任务已取消")
+        self.assertEqual(owner.get_cancel_requests(["running"]), [])
+
+        owner.set("lost", "processing")
+        owner.set("live", "processing")
+        time.sleep(0.6)
+        # 执行进程定期刷新的任务保留，重启后超时未刷新的任务标记为失败
+        owner.touch(["live"])
+        restarted = SQLiteTaskStore(path, unfinished_ttl=0.5)
+        self.assertEqual(restarted.get("lost")["status"], "failed")
+        self.assertEqual(restarted.get("live")["status"], "processing")
+
+
+class TestTextChunking(unittest.TestCase):
+    """测试长文本切分"""
+
+    def test_split_sentences(self):
+        """测试按句末标点切分"""
+        text = "今天很开心。明天呢？\n好的!"
+        sentences = [text[start:end] for start, end in split_sentences(text)]
+        self.assertEqual(sentences, ["今天很开心。", "明天呢？\n", "好的!"])
+
+    def test_chunks_respect_token_budget(self):
+        """测试合并后的窗口不超过词元上限，且覆盖全文"""
+        text = "一二三。四五六。七八九十一二三四五六七八九十。"
+        token_len = lambda texts: [len(t) for t in texts]
+        chunks = split_text_chunks(text, token_len, max_tokens=8)
+
+        self.assertTrue(all(tokens <= 8 for _, _, tokens in chunks))
+        self.assertEqual(chunks[0][:2], (0, 8))  # 前两句合并
+        self.assertEqual("".join(text[start:end] for start, end, _ in chunks), text)
+        self.assertEqual(split_text_chunks("", token_len), [])
+
+
+class TestTextAnalysis(unittest.TestCase):
+    """测试文本情感分析（需要torch和transformers）"""
+
+    def setUp(self):
+        try:
+            from modules import text_analysis
+        except ImportError:
+            self.skipTest("torch或transformers未安装")
+        self.text_analysis = text_analysis
+
+    def test_segment_sentiment_without_model(self):
+        """测试文本模型不可用时分段情感轨迹使用模拟结果"""
+        from unittest import mock
+
+        segments = [
+            {"start": 0.0, "end": 2.0, "text": "今天非常开心"},
+            {"start": 2.0, "end": 4.0, "text": "有点难过"},
+        ]
+        with mock.patch.object(self.text_analysis, "get_text_model", return_value=(None, None)):
+            track, error = self.text_analysis.analyze_segment_emotions(segments, rules_first=False)
+
+        self.assertIsNone(error)
+        self.assertEqual(len(track), 2)
+        for item in track:
+            self.assertIn("emotion_type", item)
+            self.assertIn(item["sentiment_class"], range(5))
+
+    def test_long_text_without_chunks(self):
+        """测试长文本模式切分不出窗口时改为整体分析"""
+        import numpy as np
+        from unittest import mock
+
+        ta = self.text_analysis
+        scores = np.array([0.1, 0.1, 0.6, 0.1, 0.1])
+        with mock.patch.object(ta, "get_text_model", return_value=(object(), object())), \
+                mock.patch.object(ta, "split_text_chunks", return_value=[]), \
+                mock.patch.object(ta, "predict_sentiment_scores", return_value=[scores]), \
+                mock.patch.object(ta, "TEXT_BATCH_ENABLED", False), \
+                mock.patch.object(ta, "TEXT_CACHE_ENABLED", False):
+            result, error = ta.analyze_emotion("。" * 600, long_text=True, rules_first=False)
+
+        self.assertIsNone(error)
+        self.assertNotIn("long_text", result)
+        self.assertEqual(result["sentiment_class"], 2)
+
+    def test_cache_key_uses_loaded_backend(self):
+        """测试缓存键使用实际加载的推理后端（onnx回退为torch后不再沿用onnx的键）"""
+        from unittest import mock
+
+        ta = self.text_analysis
+        with mock.patch.object(ta, "get_text_backend", return_value="torch"):
+            torch_key = ta._score_cache_key("你好")
+        with mock.patch.object(ta, "get_text_backend", return_value="onnx"):
+            onnx_key = ta._score_cache_key("你好")
+        self.assertNotEqual(torch_key, onnx_key)
+        self.assertIn("torch", torch_key)
+
+    def test_light_label_mapping(self):
+        """测试轻量模型三分类标签映射到 消极 / 中性 / 积极，正负两个方向对称"""
+        import numpy as np
+
+        label_to_class = self.text_analysis._label_to_class
+        self.assertEqual(label_to_class("negative"), 1)
+        self.assertEqual(label_to_class("neutral"), 2)
+        self.assertEqual(label_to_class("positive"), 3)
+        self.assertEqual(label_to_class("5 stars"), 4)
+
+        # 没有情感关键词的文本由模型概率决定类别
+        text = "会议安排在明天下午三点钟举行"
+        for label, expected in (("negative", 1), ("positive", 3)):
+            scores = np.zeros(5)
+            scores[label_to_class(label)] = 0.9
+            scores[2] = 0.1
+            result = self.text_analysis._apply_keyword_rules(text, scores)
+            self.assertEqual(result["sentiment_class"], expected)
+
+
+class TestCorpusParsing(unittest.TestCase):
+    """测试语料逐行解析"""
+
+    def test_parse_lines_and_batches(self):
+        """测试纯文本行、JSON行和空行的解析及分批"""
+        lines = [
+            "今天很开心\n",
+            "\n",
+            b'{"id": 7, "text": "\xe5\xa5\xbd"}\n',
+            '{"id": 8}\n',
+            "{bad json\n",
+        ]
+        records = list(parse_lines(lines))
+
+        self.assertEqual(records[0], {"line": 1, "text": "今天很开心"})
+        self.assertEqual(records[1], {"line": 3, "id": 7, "text": "好"})
+        self.assertIn("error", records[2])
+        self.assertIn("error", records[3])
+
+        batches = list(iter_batches(iter(records), batch_size=3))
+        self.assertEqual([len(batch) for batch in batches], [3, 1])
+
+
+class TestAudioDecoding(unittest.TestCase):
+    """测试内存音频解码"""
+
+    def _make_wav(self, sample_rate, samples):
+        """生成16位单声道WAV字节"""
+        import io
+        import wave
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(samples.astype("<i2").tobytes())
+        return buffer.getvalue()
+
+    def test_decode_wav_in_memory(self):
+        """测试WAV字节解码为16kHz float32数组"""
+        import numpy as np
+
+        samples = (np.sin(np.linspace(0, 100, 16000)) * 16000).astype(np.int16)
+        try:
+            audio = decode_audio_bytes(self._make_wav(16000, samples))
+        except FileNotFoundError:
+            self.skipTest("ffmpeg和soundfile均不可用")
+
+        self.assertEqual(audio.dtype, np.float32)
+        self.assertEqual(len(audio), 16000)
+        self.assertTrue(np.allclose(audio, samples / 32768.0, atol=1e-3))
+
+    def test_stream_decoder(self):
+        """测试分块写入常驻解码进程，增量解码结果与整体解码一致"""
+        import numpy as np
+
+        samples = (np.sin(np.linspace(0, 300, 48000)) * 16000).astype(np.int16)
+        data = self._make_wav(16000, samples)
+        decoded = []
+        try:
+            decoder = StreamDecoder(decoded.append)
+        except FileNotFoundError:
+            self.skipTest("ffmpeg不可用")
+        for start in range(0, len(data), 7001):
+            decoder.write(data[start : start + 7001])
+        decoder.finish()
+
+        audio = np.concatenate(decoded)
+        self.assertEqual(len(audio), len(samples))
+        self.assertTrue(np.allclose(audio, samples / 32768.0, atol=1e-3))
+
+    def test_empty_audio(self):
+        """测试空数据"""
+        with self.assertRaises(AudioDecodeError):
+            decode_audio_bytes(b"")
+
+    def test_video_without_audio_stream(self):
+        """测试没有音轨的视频"""
+        video_file = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "examples",
+            "video",
+            "angry_test.mp4",
+        )
+        try:
+            with self.assertRaises(NoAudioStreamError):
+                decode_audio_file(video_file)
+        except FileNotFoundError:
+            self.skipTest("ffmpeg不可用")
+
+
+class TestVAD(unittest.TestCase):
+    """测试基于能量的语音活动检测"""
+
+    def _make_audio(self, sample_rate=16000):
+        """生成 静音1秒 + 语音1秒 + 静音2秒 + 语音1秒 + 静音1秒 的测试音频"""
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        noise = lambda seconds: rng.normal(0, 0.001, int(seconds * sample_rate))
+        tone = lambda seconds: 0.3 * np.sin(
+            2 * np.pi * 220 * np.arange(int(seconds * sample_rate)) / sample_rate
+        )
+        return np.concatenate(
+            [noise(1), tone(1), noise(2), tone(1), noise(1)]
+        ).astype(np.float32)
+
+    def test_detect_and_trim(self):
+        """测试语音区间检测、裁剪比例和时间戳映射"""
+        audio = self._make_audio()
+        spans = detect_speech(audio, 16000)
+        self.assertEqual(len(spans), 2)
+
+        trimmed, mapping, stats = trim_silence(audio, 16000)
+        self.assertLess(len(trimmed), len(audio))
+        self.assertGreater(stats["trimmed_ratio"], 0.4)
+        self.assertEqual(stats["speech_regions"], 2)
+
+        # 第二个语音区间在拼接后音频中的起点映射回原始音频约4秒处
+        second_start = mapping[1][0]
+        self.assertAlmostEqual(map_to_original(second_start + 0.5, mapping), mapping[1][1] + 0.5)
+        self.assertAlmostEqual(mapping[1][1], 4.0, delta=0.3)
+
+    def test_silence_only(self):
+        """测试纯静音"""
+        import numpy as np
+
+        trimmed, mapping, stats = trim_silence(np.zeros(16000, dtype=np.float32), 16000)
+        self.assertEqual(len(trimmed), 0)
+        self.assertEqual(stats["speech_regions"], 0)
+
+
+class _FakeWhisper:
+    """模拟Whisper模型：每个窗口返回一个覆盖整个窗口的分段，并记录窗口长度"""
+
+    def __init__(self):
+        self.window_lengths = []
+
+    def transcribe(self, audio, language=None, fp16=False):
+        self.window_lengths.append(len(audio))
+        return {"text": "字", "segments": [{"start": 0.0, "end": len(audio) / 16000, "text": "字"}]}
+
+
+class TestAudioWindows(unittest.TestCase):
+    """测试长音频窗口切分"""
+
+    def test_windows_cut_at_silence(self):
+        """测试窗口在静音处断开且覆盖全部音频"""
+        import numpy as np
+
+        sample_rate = 16000
+        t = np.arange(sample_rate * 8) / sample_rate
+        # 每8秒中前7秒为语音，最后1秒为静音，共80秒
+        period = np.where(t < 7, 0.3 * np.sin(2 * np.pi * 220 * t), 0.0)
+        audio = np.tile(period, 10).astype(np.float32)
+        blocks = (audio[i : i + sample_rate * 10] for i in range(0, len(audio), sample_rate * 10))
+
+        windows = list(iter_windows(blocks, sample_rate, window_seconds=30))
+        self.assertGreater(len(windows), 2)
+        self.assertEqual(sum(len(w) for _, w in windows), len(audio))
+
+        for offset, window in windows[:-1]:
+            self.assertLessEqual(len(window), sample_rate * 30)
+            # 切分点落在静音段（每8秒周期的第7~8秒）
+            cut_time = (offset + len(window) / sample_rate) % 8
+            self.assertGreaterEqual(cut_time, 7)
+
+    def test_long_audio_file_streamed(self):
+        """测试长音频文件逐窗口流式解码转写，分段时间戳覆盖整个文件"""
+        import wave
+        import numpy as np
+        from unittest import mock
+
+        sample_rate = 16000
+        t = np.arange(sample_rate * 8) / sample_rate
+        period = np.where(t < 7, 0.3 * np.sin(2 * np.pi * 220 * t), 0.0)
+        audio = np.tile(period, 20)
+
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
+            path = temp_file.name
+        try:
+            with wave.open(path, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(sample_rate)
+                wav.writeframes((audio * 32767).astype("<i2").tobytes())
+
+            model = _FakeWhisper()
+            with mock.patch.object(transcription, "SPEECH_WORKERS", 1):
+                try:
+                    result = transcribe_long_audio(path, "zh-CN", vad=False, whisper_model=model)
+                except FileNotFoundError:
+                    self.skipTest("ffmpeg不可用")
+        finally:
+            os.remove(path)
+
+        self.assertGreater(len(model.window_lengths), 4)
+        self.assertLessEqual(max(model.window_lengths), sample_rate * 30)
+        self.assertEqual(sum(model.window_lengths), len(audio))
+        self.assertEqual(result["text"], "字" * len(model.window_lengths))
+        self.assertAlmostEqual(result["segments"][-1]["end"], len(audio) / sample_rate, places=2)
+
+
+class TestFrameReader(unittest.TestCase):
+    """测试采样帧读取"""
+
+    class FakeCapture:
+        """记录 grab/retrieve/跳转调用的视频对象"""
+
+        def __init__(self, total_frames):
+            self.total_frames = total_frames
+            self.position = 0
+            self.grabs = 0
+            self.seeks = 0
+
+        def set(self, prop, value):
+            self.position = int(value)
+            self.seeks += 1
+
+        def grab(self):
+            if self.position >= self.total_frames:
+                return False
+            self.position += 1
+            self.grabs += 1
+            return True
+
+        def retrieve(self):
+            return True, self.position - 1
+
+    def test_sample_indices(self):
+        """测试均匀采样帧号"""
+        self.assertEqual(sample_frame_indices(5, 20), [0, 1, 2, 3, 4])
+        self.assertEqual(sample_frame_indices(100, 4), [0, 25, 50, 75])
+
+    def test_sequential_for_dense_samples(self):
+        """测试采样间隔小于GOP时只顺序读取，不跳转"""
+        capture = self.FakeCapture(1000)
+        frames = list(SampledFrameReader(capture, sample_frame_indices(1000, 20), gop=250))
+        self.assertEqual([index for index, _ in frames], sample_frame_indices(1000, 20))
+        self.assertEqual([frame for _, frame in frames], sample_frame_indices(1000, 20))
+        self.assertEqual(capture.seeks, 0)
+
+    def test_seek_for_sparse_samples(self):
+        """测试采样间隔大于GOP时跳转，而不是逐帧跳过"""
+        capture = self.FakeCapture(100000)
+        indices = sample_frame_indices(100000, 20)
+        frames = list(SampledFrameReader(capture, indices, gop=250))
+        self.assertEqual([frame for _, frame in frames], indices)
+        self.assertEqual(capture.seeks, 19)
+        self.assertEqual(capture.grabs, 20)
+
+    def test_adaptive_selection(self):
+        """测试自适应采样跳过重复画面、总是采样镜头切换并遵守预算"""
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+
+        def frame(level):
+            # 带少量噪声的纯色缩略图
+            return np.full((36, 64), level, np.float32) + rng.normal(0, 0.5, (36, 64)).astype(np.float32)
+
+        # 静止画面只保留第一帧
+        self.assertEqual(select_by_change([frame(100) for _ in range(40)], 10), ([0], 0))
+        # 镜头切换处总是采样
+        thumbnails = [frame(100) for _ in range(20)] + [frame(200) for _ in range(20)]
+        self.assertEqual(select_by_change(thumbnails, 10), ([0, 20], 1))
+        # 画面持续变化时不超过预算
+        selected, _ = select_by_change([frame(i * 5) for i in range(40)], 10)
+        self.assertEqual(len(selected), 10)
+        self.assertEqual(selected[0], 0)
+
+    def test_plan_samples_keeps_selected_frames(self):
+        """测试自适应采样直接返回扫描时保留的选中帧，超出内存上限时只返回帧号和GOP估计"""
+        import numpy as np
+        from unittest import mock
+
+        class SceneCapture(self.FakeCapture):
+            # 前一半为暗画面，后一半为亮画面
+            def retrieve(self):
+                level = 50 if self.position - 1 < self.total_frames // 2 else 200
+                return True, np.full((36, 64, 3), level, np.uint8)
+
+        indices, stats, frames = plan_samples(SceneCapture(1000), 1000, 25, budget=10)
+        self.assertTrue(stats["cached_frames"])
+        self.assertEqual([frame_idx for frame_idx, _ in frames], indices)
+        self.assertEqual(indices[:2], [0, 500])
+        self.assertEqual(int(frames[1][1][0, 0, 0]), 200)
+
+        with mock.patch.object(frame_sampling, "VIDEO_FRAME_CACHE_MB", 0.01):
+            indices, stats, frames = plan_samples(SceneCapture(1000), 1000, 25, budget=10)
+        self.assertIsNone(frames)
+        self.assertEqual(indices[:2], [0, 500])
+        self.assertIn("gop", stats)
+
+
+class TestFaceBatching(unittest.TestCase):
+    """测试面部表情批量分类"""
+
+    class FakeDetector:
+        """按帧号返回固定人脸框、记录分类批次的检测器"""
+
+        faces = {0: [[10, 10, 20, 20]], 1: [], 2: [[0, 0, 30, 20], [40, 40, 20, 30]]}
+
+        def __init__(self):
+            self.batches = []
+
+        def find_faces(self, frame, bgr=True):
+            return self.faces[int(frame[0, 0, 0])]
+
+        @staticmethod
+        def pad(image):
+            import cv2
+
+            return cv2.copyMakeBorder(image, 40, 40, 40, 40, cv2.BORDER_CONSTANT, value=0)
+
+        @staticmethod
+        def tosquare(bbox):
+            x, y, w, h = bbox
+            side = max(w, h)
+            return (x - (side - w) // 2, y - (side - h) // 2, side, side)
+
+        @staticmethod
+        def _get_labels():
+            return {0: "happy", 1: "sad"}
+
+        def _classify_emotions(self, gray_faces):
+            import numpy as np
+
+            self.batches.append(gray_faces.shape)
+            return np.tile([0.8, 0.2], (len(gray_faces), 1))
+
+    def test_batched_results(self):
+        """测试所有人脸一次分类，结果按帧分组"""
+        import numpy as np
+
+        frames = [(index, np.full((120, 160, 3), index, np.uint8)) for index in range(3)]
+        detector = self.FakeDetector()
+        results = detect_emotions_batch(detector, frames)
+
+        self.assertEqual(detector.batches, [(3, 64, 64)])
+        self.assertEqual([frame_idx for frame_idx, _ in results], [0, 1, 2])
+        self.assertEqual([len(faces) for _, faces in results], [1, 0, 2])
+        self.assertEqual(results[2][1][1]["box"], [40, 40, 20, 30])
+        self.assertEqual(results[0][1][0]["emotions"], {"happy": 0.8, "sad": 0.2})
+
+
+class TestFaceTracking(unittest.TestCase):
+    """测试关键帧检测加跟踪的人物时间线"""
+
+    class MovingFacesDetector(TestFaceBatching.FakeDetector):
+        """返回两个移动纹理块真实位置的检测器，记录检测次数"""
+
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        def find_faces(self, frame, bgr=True):
+            self.calls += 1
+            position = int(frame[0, 0, 0])
+            return [[20 + position * 3, 30, 40, 40], [200 - position * 3, 100, 40, 40]]
+
+    def _frames(self, count):
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        patches = [rng.integers(0, 255, (40, 40, 3), dtype=np.uint8) for _ in range(2)]
+        for position in range(count):
+            frame = np.zeros((240, 320, 3), np.uint8)
+            frame[30:70, 20 + position * 3 : 60 + position * 3] = patches[0]
+            frame[100:140, 200 - position * 3 : 240 - position * 3] = patches[1]
+            frame[0, 0] = position
+            yield position, frame
+
+    def test_person_timelines(self):
+        """测试只在关键帧检测，其余帧跟踪，每个人物得到完整的时间线"""
+        detector = self.MovingFacesDetector()
+        emotions, persons, stats = track_face_emotions(detector, self._frames(10), fps=10)
+
+        self.assertEqual(detector.calls, 2)
+        self.assertEqual(stats["tracked"], 16)
+        self.assertEqual(len(persons), 2)
+        self.assertEqual([len(person["timeline"]) for person in persons], [10, 10])
+        self.assertEqual(persons[0]["timeline"][-1]["box"], [47, 30, 40, 40])
+        self.assertEqual(persons[1]["timeline"][-1]["box"], [173, 100, 40, 40])
+        self.assertEqual(len(emotions), 20)
+        self.assertEqual(detector.batches, [(20, 64, 64)])
+
+
+def _fake_video_worker(conn, threads, preload):
+    """测试用的视频工作进程：按任务参数等待一段时间后返回文件路径"""
+    import time
+
+    conn.send(("ready", None, None))
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        task_id, file_path, options = job
+        time.sleep(options.get("sleep", 0))
+        conn.send((task_id, {"file": file_path}, None))
+
+
+def _long_audio_video_worker(conn, threads, preload):
+    """测试用的视频工作进程：与正式工作进程相同的初始化，按任务参数转写一段长音频"""
+    import numpy as np
+    from modules.video_jobs import init_worker_process
+
+    init_worker_process()
+    conn.send(("ready", None, None))
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        task_id, file_path, options = job
+        try:
+            audio = np.zeros(int(16000 * options["seconds"]), dtype=np.float32)
+            result = transcribe_long_audio(audio, "zh-CN", vad=False, whisper_model=_FakeWhisper())
+            conn.send((task_id, {"text": result["text"], "pool": transcription.uses_process_pool()}, None))
+        except Exception as e:
+            conn.send((task_id, None, repr(e)))
+
+
+class TestVideoJobExecutor(unittest.TestCase):
+    """测试视频任务进程池的有界队列、优先级和取消"""
+
+    def test_priority_and_cancel(self):
+        import threading
+
+        updates = []
+        finished = threading.Event()
+        lock = threading.Condition()
+
+        def on_update(task_id, status, result, error):
+            with lock:
+                updates.append((task_id, status))
+                lock.notify_all()
+            if task_id == "low" and status != "processing":
+                finished.set()
+
+        def wait_for(task_id, status):
+            with lock:
+                self.assertTrue(lock.wait_for(lambda: (task_id, status) in updates, timeout=60))
+
+        tmp_dir = tempfile.mkdtemp()
+        paths = {}
+        for name in ("slow", "low", "high", "extra"):
+            paths[name] = os.path.join(tmp_dir, name)
+            open(paths[name], "w").close()
+
+        executor = VideoJobExecutor(on_update, max_workers=1, max_queue=2, target=_fake_video_worker)
+        self.assertTrue(executor.try_submit("slow", paths["slow"], {"sleep": 30}))
+        wait_for("slow", "processing")
+
+        self.assertTrue(executor.try_submit("low", paths["low"], priority=0))
+        self.assertTrue(executor.try_submit("high", paths["high"], priority=5))
+        # 等待队列已满
+        self.assertFalse(executor.try_submit("extra", paths["extra"]))
+
+        # 取消运行中的任务会终止工作进程，之后按优先级继续执行
+        self.assertTrue(executor.cancel("slow"))
+        self.assertTrue(finished.wait(timeout=60))
+
+        finished_order = [task_id for task_id, status in updates if status != "processing"]
+        self.assertEqual(finished_order, ["slow", "high", "low"])
+        self.assertIn(("slow", "cancelled"), updates)
+        self.assertIn(("high", "completed"), updates)
+        self.assertFalse(executor.cancel("low"))
+        for name in ("slow", "low", "high"):
+            self.assertFalse(os.path.exists(paths[name]))
+        self.assertEqual(executor.get_stats()["rejected"], 1)
+
+    def test_update_errors_do_not_stop_worker(self):
+        """测试状态回调出错（如任务存储写入失败）时管理线程继续处理后续任务"""
+        import threading
+
+        updates = []
+        lock = threading.Condition()
+
+        def on_update(task_id, status, result, error):
+            with lock:
+                updates.append((task_id, status))
+                lock.notify_all()
+            raise RuntimeError("database is locked")
+
+        tmp_dir = tempfile.mkdtemp()
+        executor = VideoJobExecutor(on_update, max_workers=1, target=_fake_video_worker)
+        for name in ("first", "second"):
+            path = os.path.join(tmp_dir, name)
+            open(path, "w").close()
+            self.assertTrue(executor.try_submit(name, path))
+
+        with lock:
+            self.assertTrue(lock.wait_for(lambda: ("second", "completed") in updates, timeout=60))
+        self.assertIn(("first", "completed"), updates)
+        self.assertFalse(os.path.exists(os.path.join(tmp_dir, "first")))
+        self.assertEqual(executor.get_stats()["completed"], 2)
+
+    def test_long_audio_in_worker(self):
+        """测试工作进程（守护进程）中的长音频转写不会创建转写进程池"""
+        import threading
+
+        results = {}
+        done = threading.Event()
+
+        def on_update(task_id, status, result, error):
+            if status != "processing":
+                results[task_id] = (status, result, error)
+                done.set()
+
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            path = temp_file.name
+        executor = VideoJobExecutor(on_update, max_workers=1, target=_long_audio_video_worker)
+        seconds = transcription.SPEECH_LONG_AUDIO_MIN_SECONDS + 30
+        self.assertTrue(executor.try_submit("long", path, {"seconds": seconds}))
+        self.assertTrue(done.wait(timeout=120))
+
+        status, result, error = results["long"]
+        self.assertEqual(status, "completed", error)
+        self.assertFalse(result["pool"])
+        self.assertGreater(len(result["text"]), 1)
+
+
 class TestAPIEndpoints(unittest.TestCase):
     """测试API端点（需要运行中的应用）"""
 
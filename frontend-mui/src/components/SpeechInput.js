@@ -37,11 +37,16 @@ function SpeechInput({ modelStatus, apiBaseUrl, onRecognitionResult, recognizedT
 	const [status, setStatus] = useState("准备就绪");
 	const [progress, setProgress] = useState(0);
 	const [showProgress, setShowProgress] = useState(false);
+	const [partialText, setPartialText] = useState("");
+	const [partialEmotion, setPartialEmotion] = useState(null);
 
 	// Refs
 	const mediaRecorderRef = useRef(null);
 	const audioChunksRef = useRef([]);
 	const fileInputRef = useRef(null);
+	// 实时识别会话ID，以及保证分块按顺序上传的Promise链
+	const streamSessionRef = useRef(null);
+	const chunkQueueRef = useRef(Promise.resolve());
 
 	// 检查浏览器兼容性
 	const checkBrowserCompatibility = () => {
@@ -75,6 +80,7 @@ function SpeechInput({ modelStatus, apiBaseUrl, onRecognitionResult, recognizedT
 						autoGainControl: true
 					}
 				});
+				await startStreamSession();
 				startRecording(stream);
 				setIsRecording(true);
 				setStatus("正在录音...");
@@ -99,6 +105,93 @@ function SpeechInput({ modelStatus, apiBaseUrl, onRecognitionResult, recognizedT
 		}
 	};
 
+	// 创建实时识别会话（失败时录音结束后再整体上传）
+	const startStreamSession = async () => {
+		streamSessionRef.current = null;
+		chunkQueueRef.current = Promise.resolve();
+		setPartialText("");
+		setPartialEmotion(null);
+		try {
+			const response = await fetch(`${apiBaseUrl}/record_stream`, {
+				method: "POST",
+				headers: {
+					"Content-Type": "application/json",
+				},
+				body: JSON.stringify({ language: language, format: "container" }),
+			});
+			const data = await response.json();
+			if (response.ok && data.success) {
+				streamSessionRef.current = data.session_id;
+			}
+		} catch (error) {
+			console.warn("创建实时识别会话失败，将在录音结束后整体上传:", error);
+		}
+	};
+
+	// 上传一块录音数据并更新阶段性结果
+	const sendStreamChunk = chunk => {
+		const sessionId = streamSessionRef.current;
+		if (!sessionId) {
+			return;
+		}
+		chunkQueueRef.current = chunkQueueRef.current.then(async () => {
+			try {
+				const response = await fetch(`${apiBaseUrl}/record_stream/${sessionId}/chunk`, {
+					method: "POST",
+					headers: {
+						"Content-Type": "application/octet-stream",
+					},
+					body: chunk,
+				});
+				const data = await response.json();
+				if (data.success) {
+					setPartialText(data.text || "");
+					setPartialEmotion(data.emotion_analysis);
+				} else {
+					streamSessionRef.current = null;
+				}
+			} catch (error) {
+				console.warn("上传录音分块失败:", error);
+				streamSessionRef.current = null;
+			}
+		});
+	};
+
+	// 结束实时识别会话，失败时回退为整体上传
+	const finishStreamSession = async audioBlob => {
+		setProgress(30);
+		await chunkQueueRef.current;
+		const sessionId = streamSessionRef.current;
+		streamSessionRef.current = null;
+		if (!sessionId) {
+			processAudioBlob(audioBlob);
+			return;
+		}
+
+		try {
+			const response = await fetch(`${apiBaseUrl}/record_stream/${sessionId}/finish`, {
+				method: "POST",
+			});
+			setProgress(80);
+			const data = await response.json();
+			if (response.status === 404) {
+				// 会话已过期，回退为整体上传
+				throw new Error(data.error);
+			}
+			if (!response.ok) {
+				setStatus("处理出错");
+				setShowProgress(false);
+				setProgress(0);
+				setError(data.error || `服务器响应错误: ${response.status} ${response.statusText}`);
+				return;
+			}
+			completeRecognition(data);
+		} catch (error) {
+			console.warn("实时识别结束失败，改为整体上传:", error);
+			processAudioBlob(audioBlob);
+		}
+	};
+
 	// 开始录音
 	const startRecording = stream => {
 		audioChunksRef.current = [];
@@ -106,14 +199,16 @@ function SpeechInput({ modelStatus, apiBaseUrl, onRecognitionResult, recognizedT
 
 		mediaRecorderRef.current.addEventListener("dataavailable", event => {
 			audioChunksRef.current.push(event.data);
+			sendStreamChunk(event.data);
 		});
 
 		mediaRecorderRef.current.addEventListener("stop", () => {
 			const audioBlob = new Blob(audioChunksRef.current, { type: "audio/wav" });
-			processAudioBlob(audioBlob);
+			finishStreamSession(audioBlob);
 		});
 
-		mediaRecorderRef.current.start();
+		// 每秒产生一个分块，录音过程中持续上传
+		mediaRecorderRef.current.start(1000);
 	};
 
 	// 停止录音
@@ -124,6 +219,25 @@ function SpeechInput({ modelStatus, apiBaseUrl, onRecognitionResult, recognizedT
 		}
 	};
 
+	// 显示识别结果
+	const completeRecognition = data => {
+		setProgress(100);
+		setTimeout(() => {
+			setShowProgress(false);
+			setProgress(0);
+			setStatus("处理完成");
+		}, 500);
+
+		// 检查结果中是否有文本
+		if (data.success && (!data.text || data.text.trim() === '')) {
+			// 没有识别出文本，显示友好的提示
+			setError('未能识别出有效文本，请尝试说话更清晰或降低背景噪音');
+			return;
+		}
+
+		onRecognitionResult(data);
+	};
+
 	// 处理录音数据
 	const processAudioBlob = async audioBlob => {
 		setProgress(30);
@@ -181,21 +295,7 @@ function SpeechInput({ modelStatus, apiBaseUrl, onRecognitionResult, recognizedT
 				setProgress(80);
 				const data = await response.json();
 
-				setProgress(100);
-				setTimeout(() => {
-					setShowProgress(false);
-					setProgress(0);
-					setStatus("处理完成");
-				}, 500);
-
-				// 检查结果中是否有文本
-				if (data.success && (!data.text || data.text.trim() === '')) {
-					// 没有识别出文本，显示友好的提示
-					setError('未能识别出有效文本，请尝试说话更清晰或降低背景噪音');
-					return;
-				}
-
-				onRecognitionResult(data);
+				completeRecognition(data);
 			} catch (error) {
 				console.error("处理音频数据出错:", error);
 				setStatus("处理出错");
@@ -299,6 +399,20 @@ function SpeechInput({ modelStatus, apiBaseUrl, onRecognitionResult, recognizedT
 								))}
 							</RecordingAnimation>
 						)}
+
+						{isRecording && partialText && (
+							<Box sx={{ mt: 2 }}>
+								<Typography variant='body2' sx={{ color: "#ffffff" }}>
+									{partialText}
+								</Typography>
+								{partialEmotion && (
+									<Typography variant='caption' sx={{ color: "#b0bec5" }}>
+										临时情感: {partialEmotion.sentiment}
+										{partialEmotion.emotion_type ? ` (${partialEmotion.emotion_type})` : ""}
+									</Typography>
+								)}
+							</Box>
+						)}
 					</Paper>
 				</Grid>
 
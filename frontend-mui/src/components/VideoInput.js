@@ -74,7 +74,7 @@ const VideoInput = ({ apiBaseUrl, setResult, modelStatus, setError }) => {
 					setTaskId(null);
 					if (pollingIntervalId) clearInterval(pollingIntervalId);
 					setPollingIntervalId(null);
-				} else if (data.status === "failed") {
+				} else if (data.status === "failed" || data.status === "cancelled") {
 					setError(`视频分析失败: ${data.error}`);
 					setResult(null);
 					setUploading(false);